@@ -0,0 +1,26 @@
+"""
+Gunicorn settings. Loaded automatically when gunicorn starts from this directory.
+
+When PROMETHEUS_MULTIPROC_DIR is set, each worker writes its metrics to that
+directory and /metrics aggregates them; the directory is emptied on start and
+the files of exited workers are marked dead so their gauges are dropped.
+"""
+
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+
+def on_starting(server):
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Book, Quote
+from .models import User, Book, Quote, DigestRun, UserQuoteStats
 from .forms import QuotesUserCreationForm, QuotesUserChangeForm
 
 
@@ -9,6 +9,10 @@ class QuotesUserAdmin(UserAdmin):
     list_display = ("username", "email", "is_staff")
     form = QuotesUserChangeForm
     add_form = QuotesUserCreationForm
+    fieldsets = UserAdmin.fieldsets + (
+        ("Digest", {"fields": ("timezone", "send_slot")}),
+    )
+    readonly_fields = ("send_slot",)
     add_fieldsets = (
         (None, {
             "classes": ("wide",),
@@ -30,3 +34,15 @@ class QuoteAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return Quote.all_objects.all()
+
+
+@admin.register(DigestRun)
+class DigestRunAdmin(admin.ModelAdmin):
+    list_display = ("started_at", "total_users", "sent", "skipped", "failed")
+    readonly_fields = ("started_at", "total_users", "sent", "skipped", "failed")
+
+
+@admin.register(UserQuoteStats)
+class UserQuoteStatsAdmin(admin.ModelAdmin):
+    list_display = ("user", "quote_count", "book_count", "updated_at")
+    readonly_fields = ("user", "quote_count", "book_count", "book_counts", "author_counts", "month_counts", "updated_at")
@@ -0,0 +1,280 @@
+import base64
+import binascii
+import json
+import logging
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.views import View
+
+from .models import Quote, Book
+from .services import create_quotes, soft_delete_quotes, restore_quotes, search_books
+from .db_router import ReplicaReadMixin
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 100
+MAX_BOOK_SEARCH_RESULTS = 20
+
+# Public field name -> ORM lookup. Nested fields use a dot in the public name.
+QUOTE_FIELDS = {
+    "id": "id",
+    "quote": "quote",
+    "page_number": "page_number",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+    "book.id": "book_id",
+    "book.title": "book__title",
+    "book.author": "book__author",
+}
+
+BOOK_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "author": "author",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+# Batch create item field -> expected JSON type; every field may also be null
+QUOTE_ITEM_TYPES = {
+    "quote": str,
+    "title": str,
+    "author": str,
+    "book_id": int,
+    "page_number": int,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message: str, status: int = 400, errors: list|None = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+class ApiView(LoginRequiredMixin, View):
+    """
+    Base view for the JSON API.
+    Anonymous requests get a 401 instead of a redirect to the login page and
+    ApiErrors raised by handlers are rendered as JSON error responses.
+    """
+    def handle_no_permission(self):
+        return JsonResponse({"error": "Authentication required."}, status=401)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            body = {"error": e.message}
+            if e.errors is not None:
+                body["errors"] = e.errors
+            return JsonResponse(body, status=e.status)
+
+
+def parse_fields(request, available: dict[str, str]) -> list[str]:
+    """
+    Parse the sparse fieldset from ?fields=a,b.c. Defaults to every available field.
+    """
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(available)
+    fields = [field.strip() for field in raw.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_ids(values: list) -> list[int]:
+    if not isinstance(values, list):
+        raise ApiError("ids must be a list.")
+    try:
+        ids = [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise ApiError("ids must be integers.")
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ApiError(f"At most {MAX_BATCH_SIZE} ids can be requested at once.")
+    return ids
+
+
+def parse_json_body(request) -> dict:
+    try:
+        body = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ApiError("Request body must be valid JSON.")
+    if not isinstance(body, dict):
+        raise ApiError("Request body must be a JSON object.")
+    return body
+
+
+def encode_cursor(pk: int) -> str:
+    return base64.urlsafe_b64encode(str(pk).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ApiError("Invalid cursor.")
+
+
+def serialize_row(row: dict, fields: list[str], available: dict[str, str]) -> dict:
+    """
+    Turn a values() row into a (possibly nested) dict containing only the requested fields.
+    """
+    item = {}
+    for field in fields:
+        *parents, name = field.split(".")
+        target = item
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[name] = row[available[field]]
+    return item
+
+
+def paginate(request, queryset, available: dict[str, str]) -> JsonResponse:
+    """
+    Keyset (cursor) pagination over the primary key, newest first.
+    Only the columns needed for the requested fields are selected.
+    """
+    fields = parse_fields(request, available)
+    try:
+        limit = min(int(request.GET.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+    if limit < 1:
+        raise ApiError("limit must be positive.")
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        queryset = queryset.filter(pk__lt=decode_cursor(cursor))
+
+    columns = {available[field] for field in fields} | {"id"}
+    rows = list(queryset.order_by("-id").values(*columns)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]["id"]) if len(rows) > limit else None
+    return JsonResponse({
+        "results": [serialize_row(row, fields, available) for row in rows[:limit]],
+        "next_cursor": next_cursor,
+    })
+
+
+def serialize_creation_result(result) -> dict:
+    if result.status == "success":
+        return {"status": result.status, "id": result.quote.id}
+    elif result.status == "quote_exists":
+        return {"status": result.status, "existing_quote_id": result.existing_quote_id}
+    else:
+        return {"status": result.status, "error": result.error_message}
+
+
+class QuoteListApiView(ReplicaReadMixin, ApiView):
+    def get(self, request):
+        return paginate(request, Quote.objects.filter(user=request.user), QUOTE_FIELDS)
+
+
+def quote_item_errors(item: dict) -> dict[str, str]:
+    """Field -> error for the fields of a batch create item that have the wrong type."""
+    errors = {}
+    for field, expected in QUOTE_ITEM_TYPES.items():
+        value = item.get(field)
+        # bool is a subclass of int, but true is not a page number
+        if value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            errors[field] = f"{field} must be {'a string' if expected is str else 'an integer'}."
+    return errors
+
+
+class QuoteBatchApiView(ApiView):
+    def get(self, request):
+        """
+        Multi-get: ?ids=1,2,3. Returns the user's quotes in the requested order
+        plus the ids that were not found, using a single query.
+        """
+        raw_ids = request.GET.get("ids", "")
+        ids = parse_ids([value for value in raw_ids.split(",") if value])
+        fields = parse_fields(request, QUOTE_FIELDS)
+        columns = {QUOTE_FIELDS[field] for field in fields} | {"id"}
+        rows = {
+            row["id"]: row
+            for row in Quote.objects.filter(user=request.user, id__in=ids).values(*columns)
+        }
+        return JsonResponse({
+            "results": [serialize_row(rows[pk], fields, QUOTE_FIELDS) for pk in ids if pk in rows],
+            "missing": [pk for pk in ids if pk not in rows],
+        })
+
+    def post(self, request):
+        """
+        Batch create: {"quotes": [{"quote", "book_id" | "title" + "author", "page_number"}, ...]}.
+        Returns one result per submitted quote, in order.
+        """
+        items = parse_json_body(request).get("quotes")
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ApiError("quotes must be a list of objects.")
+        if len(items) > MAX_BATCH_SIZE:
+            raise ApiError(f"At most {MAX_BATCH_SIZE} quotes can be created at once.")
+        errors = [
+            {"index": index, "errors": item_errors}
+            for index, item in enumerate(items)
+            if (item_errors := quote_item_errors(item))
+        ]
+        if errors:
+            raise ApiError("Some quotes are malformed.", errors=errors)
+
+        results = create_quotes(items, request.user)
+        logger.info(
+            "Quotes batch created",
+            extra={
+                "user_id": request.user.id,
+                "created": sum(1 for result in results if result.status == "success"),
+                "submitted": len(items),
+            }
+        )
+        return JsonResponse({"results": [serialize_creation_result(result) for result in results]})
+
+
+class QuoteBatchDeleteApiView(ApiView):
+    def post(self, request):
+        """
+        Batch soft delete: {"ids": [1, 2, 3]}. Returns the number of quotes deleted.
+        """
+        ids = parse_ids(parse_json_body(request).get("ids") or [])
+        return JsonResponse({"deleted": soft_delete_quotes(request.user, ids)})
+
+
+class QuoteBatchRestoreApiView(ApiView):
+    def post(self, request):
+        """
+        Batch restore: {"ids": [1, 2, 3]}. Returns the number of quotes restored and
+        the ids that could not be restored because the quote already exists.
+        """
+        ids = parse_ids(parse_json_body(request).get("ids") or [])
+        result = restore_quotes(request.user, ids)
+        return JsonResponse({"restored": result.restored, "conflicts": result.conflict_ids})
+
+
+class BookListApiView(ReplicaReadMixin, ApiView):
+    def get(self, request):
+        return paginate(request, Book.objects.all(), BOOK_FIELDS)
+
+
+class BookSearchApiView(ApiView):
+    def get(self, request):
+        """
+        Autocomplete: books whose title starts with ?q= (ignoring case), in title
+        order, served from the book catalogue snapshot.
+        """
+        prefix = request.GET.get("q", "").strip()
+        if not prefix:
+            raise ApiError("q is required.")
+        try:
+            limit = min(int(request.GET.get("limit", 10)), MAX_BOOK_SEARCH_RESULTS)
+        except ValueError:
+            raise ApiError("limit must be an integer.")
+        books = search_books(prefix, max(limit, 1))
+        return JsonResponse({
+            "results": [{"id": book_id, "title": title, "author": author} for book_id, title, author in books]
+        })
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import api
+
+app_name = "quotes_api"
+urlpatterns = [
+    path("quotes/", api.QuoteListApiView.as_view(), name="quotes_list"),
+    path("quotes/batch/", api.QuoteBatchApiView.as_view(), name="quotes_batch"),
+    path("quotes/batch/delete/", api.QuoteBatchDeleteApiView.as_view(), name="quotes_batch_delete"),
+    path("quotes/batch/restore/", api.QuoteBatchRestoreApiView.as_view(), name="quotes_batch_restore"),
+    path("books/", api.BookListApiView.as_view(), name="books_list"),
+    path("books/search/", api.BookSearchApiView.as_view(), name="books_search"),
+]
@@ -0,0 +1,180 @@
+"""
+Asyncio SMTP sender for digests.
+
+Django's SMTP backend sends one message at a time per process, so throughput is
+bounded by the mail relay's round trip time. AsyncMailSender keeps a bounded
+pool of SMTP connections and sends up to `concurrency` messages at once, with
+per-recipient retries for transient failures.
+"""
+
+import asyncio
+import logging
+import random
+import time
+
+import aiosmtplib
+from django.conf import settings
+from django.core.mail import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSendResult:
+    def __init__(self):
+        self.sent: list[str] = []
+        self.failed: list[str] = []
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Connection problems and 4xx replies are worth retrying; 5xx replies are permanent.
+    """
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= recipient_error.code < 500 for recipient_error in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return isinstance(error, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError))
+
+
+class AsyncMailSender:
+    def __init__(
+        self,
+        hostname: str|None = None,
+        port: int|None = None,
+        username: str|None = None,
+        password: str|None = None,
+        use_tls: bool|None = None,
+        pool_size: int|None = None,
+        concurrency: int|None = None,
+        max_retries: int|None = None,
+        retry_backoff: float = 0.5,
+        timeout: float = 30,
+        rate_limiter=None,
+    ):
+        self.hostname = hostname or settings.EMAIL_HOST
+        self.port = port or settings.EMAIL_PORT
+        self.username = username if username is not None else settings.EMAIL_HOST_USER
+        self.password = password if password is not None else settings.EMAIL_HOST_PASSWORD
+        self.use_tls = settings.EMAIL_USE_TLS if use_tls is None else use_tls
+        self.pool_size = pool_size or settings.DIGEST_ASYNC_MAIL_POOL_SIZE
+        self.concurrency = concurrency or settings.DIGEST_ASYNC_MAIL_CONCURRENCY
+        self.max_retries = settings.DIGEST_ASYNC_MAIL_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        # Optional quotes.ratelimit.RateLimiter applied to every send attempt
+        self.rate_limiter = rate_limiter
+        self._pool: asyncio.LifoQueue|None = None
+        self._slots: asyncio.Semaphore|None = None
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username or None,
+            password=self.password or None,
+            start_tls=self.use_tls,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        return client
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        # Reuse an idle connection if there is one, otherwise open a new one; the
+        # semaphore caps the number of open connections at pool_size.
+        await self._slots.acquire()
+        try:
+            client = self._pool.get_nowait()
+            if client.is_connected:
+                return client
+        except asyncio.QueueEmpty:
+            pass
+        try:
+            return await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, client: aiosmtplib.SMTP) -> None:
+        if client.is_connected:
+            self._pool.put_nowait(client)
+        self._slots.release()
+
+    async def _send_one(self, message: EmailMessage) -> bool:
+        recipients = message.recipients()
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                await self.rate_limiter.acquire_async()
+            start = time.perf_counter()
+            try:
+                client = await self._acquire()
+            except Exception as e:
+                error = e
+            else:
+                try:
+                    await client.send_message(message.message(), sender=message.from_email, recipients=recipients)
+                    self._release(client)
+                    self._record(True, start)
+                    return True
+                except Exception as e:
+                    error = e
+                    if not isinstance(e, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)):
+                        # The connection is in an unknown state; drop it
+                        client.close()
+                    self._release(client)
+            self._record(False, start)
+            if not is_transient(error) or attempt == self.max_retries:
+                logger.warning(
+                    "Async digest send failed",
+                    extra={"recipients": recipients, "attempts": attempt + 1, "error": str(error)},
+                )
+                return False
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt * (0.5 + random.random()))
+        return False
+
+    def _record(self, ok: bool, start: float) -> None:
+        if self.rate_limiter:
+            self.rate_limiter.record(ok, time.perf_counter() - start)
+
+    async def send_messages(self, messages) -> AsyncSendResult:
+        """
+        Send an iterable of EmailMessages. At most `concurrency` messages are in
+        flight and at most twice that many are buffered, so a lazily produced
+        iterable is consumed no faster than the relay accepts messages.
+        """
+        self._pool = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(self.pool_size)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        result = AsyncSendResult()
+
+        async def worker():
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+                recipients = result.sent if await self._send_one(message) else result.failed
+                recipients.extend(message.to)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            for message in messages:
+                await queue.put(message)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker_task in workers:
+                worker_task.cancel()
+            while not self._pool.empty():
+                client = self._pool.get_nowait()
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+        return result
+
+
+def send_messages_async(messages, **kwargs) -> AsyncSendResult:
+    """
+    Synchronous entry point for Celery tasks and management commands.
+    """
+    return asyncio.run(AsyncMailSender(**kwargs).send_messages(messages))
@@ -0,0 +1,170 @@
+"""
+Read-only snapshot of the book catalogue (id, title, author) in a single file
+at BOOK_CATALOGUE_PATH:
+
+    header         magic, version (latest book update in µs, book count), text size
+    ids            int64[n]       book ids, sorted
+    title_offsets  int64[n + 1]   book i's title is text[title_offsets[i]:title_offsets[i + 1]]
+    author_offsets int64[n + 1]   same for the author
+    key_offsets    int64[n + 1]   casefolded titles, in sorted order (the prefix index)
+    key_rows       int64[n]       book of each key
+    text           uint8[size]    UTF-8 titles, authors and keys
+
+The file is opened with mmap, so web and Celery processes on a host share one
+copy in the page cache. It is rebuilt periodically and replaced atomically;
+each process notices the new file on its next lookup and maps it instead, no
+restart needed. Lookups of books missing from the snapshot (created since the
+last build) fall back to the database in the services.
+"""
+
+import bisect
+import os
+import tempfile
+from typing import Iterable
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b"QBOOKS01"
+HEADER = np.dtype([("magic", "S8"), ("updated", "<i8"), ("count", "<i8"), ("text_size", "<i8")])
+
+
+def search_key(text: str) -> bytes:
+    # UTF-8 preserves code point order, so byte prefixes are string prefixes
+    return text.casefold().encode()
+
+
+class _Keys:
+    """The sorted keys as a sequence of bytes, decoded on access, for bisect."""
+    def __init__(self, catalogue: "BookCatalogue"):
+        self.catalogue = catalogue
+
+    def __len__(self) -> int:
+        return len(self.catalogue.key_rows)
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.catalogue.text_at(self.catalogue.key_offsets, index)
+
+
+class BookCatalogue:
+    def __init__(self, version: tuple[int, int], ids, title_offsets, author_offsets, key_offsets, key_rows, text):
+        self.version = version
+        self.ids = ids
+        self.title_offsets = title_offsets
+        self.author_offsets = author_offsets
+        self.key_offsets = key_offsets
+        self.key_rows = key_rows
+        self.text = text
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text_at(self, offsets: np.ndarray, index: int) -> bytes:
+        return self.text[offsets[index]:offsets[index + 1]].tobytes()
+
+    def row(self, index: int) -> tuple[int, str, str]:
+        return (
+            int(self.ids[index]),
+            self.text_at(self.title_offsets, index).decode(),
+            self.text_at(self.author_offsets, index).decode(),
+        )
+
+    def get(self, book_id: int) -> tuple[int, str, str]|None:
+        """(id, title, author) of the book, or None if it is not in the snapshot."""
+        index = int(np.searchsorted(self.ids, book_id))
+        if index < len(self.ids) and self.ids[index] == book_id:
+            return self.row(index)
+        return None
+
+    def search(self, prefix: str, limit: int) -> list[tuple[int, str, str]]:
+        """Books whose title starts with prefix (ignoring case), in title order."""
+        key = search_key(prefix)
+        keys = _Keys(self)
+        results = []
+        for index in range(bisect.bisect_left(keys, key), len(keys)):
+            if len(results) == limit or not keys[index].startswith(key):
+                break
+            results.append(self.row(int(self.key_rows[index])))
+        return results
+
+    @staticmethod
+    def write(path: str, books: Iterable[tuple[int, str, str]], updated: int) -> None:
+        """
+        Write a snapshot of the (id, title, author) rows, atomically replacing
+        path. updated is the latest update time of the books, in µs.
+        """
+        books = sorted(books)
+        titles = [title.encode() for _, title, _ in books]
+        authors = [author.encode() for _, _, author in books]
+        key_rows = sorted(range(len(books)), key=lambda row: search_key(books[row][1]))
+        keys = [search_key(books[row][1]) for row in key_rows]
+
+        def offsets(parts: list[bytes], start: int) -> np.ndarray:
+            result = np.full(len(parts) + 1, start, dtype=np.int64)
+            np.cumsum(np.array([len(part) for part in parts], dtype=np.int64), out=result[1:])
+            result[1:] += start
+            return result
+
+        title_offsets = offsets(titles, 0)
+        author_offsets = offsets(authors, title_offsets[-1])
+        key_offsets = offsets(keys, author_offsets[-1])
+        text = b"".join(titles + authors + keys)
+        header = np.array([(MAGIC, updated, len(books), len(text))], dtype=HEADER)
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.tobytes())
+                f.write(np.array([book_id for book_id, _, _ in books], dtype="<i8").tobytes())
+                for array in (title_offsets, author_offsets, key_offsets, np.array(key_rows, dtype="<i8")):
+                    f.write(array.astype("<i8").tobytes())
+                f.write(text)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "BookCatalogue|None":
+        """Map the snapshot read-only, or None if there is none."""
+        try:
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        except FileNotFoundError:
+            return None
+        header = np.frombuffer(data, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a book catalogue snapshot")
+        count = int(header["count"])
+        offset = HEADER.itemsize
+        arrays = []
+        for length in (count, count + 1, count + 1, count + 1, count):
+            arrays.append(np.frombuffer(data, dtype="<i8", count=length, offset=offset))
+            offset += 8 * length
+        text = data[offset:offset + int(header["text_size"])]
+        return cls((int(header["updated"]), count), *arrays, text)
+
+
+# Snapshot mapped by this process and the identity of the file it came from
+_mapped: tuple[tuple[int, int], BookCatalogue]|None = None
+
+
+def get_book_catalogue() -> BookCatalogue|None:
+    """
+    The current snapshot, or None when it is disabled or not built yet. The file
+    is checked on every call so a rebuilt snapshot is picked up at once.
+    """
+    global _mapped
+    if not settings.BOOK_CATALOGUE_PATH:
+        return None
+    try:
+        stat = os.stat(settings.BOOK_CATALOGUE_PATH)
+    except FileNotFoundError:
+        _mapped = None
+        return None
+    identity = (stat.st_ino, stat.st_mtime_ns)
+    if _mapped is None or _mapped[0] != identity:
+        catalogue = BookCatalogue.load(settings.BOOK_CATALOGUE_PATH)
+        _mapped = (identity, catalogue) if catalogue is not None else None
+    return _mapped[1] if _mapped else None
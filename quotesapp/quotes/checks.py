@@ -0,0 +1,44 @@
+"""
+Startup self-check for the prod settings profile.
+
+With DEBUG on (or a debug cursor forced), Django appends every SQL statement to
+connection.queries. Web requests clear that list, but Celery workers never do,
+so a long-lived worker grows without bound. Prod web and worker processes call
+check_production_settings() at startup and refuse to boot in that state, or
+without a bearer token guarding /metrics; `manage.py check` reports the same
+problems.
+"""
+
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+
+def production_settings_problems() -> list[str]:
+    if settings.SETTINGS_PROFILE != "prod":
+        return []
+    problems = []
+    if settings.DEBUG:
+        problems.append("DEBUG is on; set DJANGO_DEBUG_MODE=false.")
+    recording = [alias for alias in connections if connections[alias].force_debug_cursor]
+    if recording:
+        problems.append(f"SQL queries are being recorded on {', '.join(recording)}.")
+    if not settings.METRICS_BEARER_TOKEN:
+        problems.append("/metrics is unprotected; set METRICS_BEARER_TOKEN.")
+    return problems
+
+
+def check_production_settings() -> None:
+    """Raise ImproperlyConfigured if a prod process is misconfigured."""
+    problems = production_settings_problems()
+    if problems:
+        raise ImproperlyConfigured(f"Refusing to start with the prod profile: {' '.join(problems)}")
+
+
+@checks.register()
+def production_settings_check(app_configs, **kwargs):
+    return [
+        checks.Error(problem, id="quotesapp.E001")
+        for problem in production_settings_problems()
+    ]
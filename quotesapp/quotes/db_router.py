@@ -0,0 +1,92 @@
+"""
+Read-replica routing.
+
+Reads only go to a replica inside `use_replica()` (read-only views and digest
+sampling); everything else, including every write and every read inside a
+transaction, uses the primary. After a write, the client is pinned to the
+primary for READ_REPLICA_STICKY_SECONDS through a cookie so that it reads its
+own writes despite replication lag.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_PRIMARY_COOKIE = "pin_primary"
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def use_replica(enabled: bool = True):
+    """Send the reads made in the block to a replica, if any is configured."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def choose_replica() -> str|None:
+    replicas = settings.DATABASE_REPLICAS
+    return random.choice(replicas) if replicas else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def is_pinned_to_primary(request) -> bool:
+    return PIN_PRIMARY_COOKIE in request.COOKIES
+
+
+class ReplicaReadMixin:
+    """
+    Serve a read-only view from a replica, unless the client wrote recently.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        # Load the session and user from the primary: a session created by a login
+        # moments ago may not have reached the replicas yet
+        request.user.is_authenticated
+        with use_replica(not is_pinned_to_primary(request)):
+            response = super().dispatch(request, *args, **kwargs)
+            # Template responses run their queries while rendering
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+            return response
+
+
+class PinPrimaryAfterWriteMiddleware:
+    """
+    Pin clients to the primary for a short while after any unsafe request.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS") and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_PRIMARY_COOKIE,
+                "1",
+                max_age=settings.READ_REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
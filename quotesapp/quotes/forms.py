@@ -1,6 +1,7 @@
 from django import forms
 from .models import User, Book, Quote
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from .services import get_books
 
 class QuotesUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -20,7 +21,7 @@ class QuotesUserChangeForm(UserChangeForm):
 
     class Meta:
         model = User
-        fields = ("username", "email", "first_name", "last_name", "is_active", "is_staff")
+        fields = ("username", "email", "first_name", "last_name", "timezone", "is_active", "is_staff")
     
     def clean_email(self):
         email = self.cleaned_data["email"]
@@ -28,8 +29,22 @@ class QuotesUserChangeForm(UserChangeForm):
             raise forms.ValidationError("This email address is already in use.")
         return email
 
+class CatalogueBookChoiceField(forms.ModelChoiceField):
+    """Book choice validated against the book catalogue snapshot instead of a query"""
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            book_id = int(value.pk if isinstance(value, Book) else value)
+        except (TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value})
+        book = get_books([book_id]).get(book_id)
+        if book is None:
+            raise forms.ValidationError(self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value})
+        return book
+
 class QuoteCreateForm(forms.ModelForm):
-    book = forms.ModelChoiceField(queryset=Book.objects.all(), required=False)
+    book = CatalogueBookChoiceField(queryset=Book.objects.all(), required=False)
     title = forms.CharField(required=False)
     author = forms.CharField(required=False)
 
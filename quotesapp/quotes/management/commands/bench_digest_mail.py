@@ -0,0 +1,60 @@
+import time
+
+from django.core.mail import EmailMessage
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management.base import BaseCommand
+
+from quotes.async_mail import send_messages_async
+from quotes.smtp_sink import SmtpSink
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the sync (Django SMTP backend) and async digest mail senders "
+        "against a local SMTP sink with a simulated relay round trip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200)
+        parser.add_argument("--latency", type=float, default=0.01,
+                            help="Seconds the sink waits before each reply.")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--pool-size", type=int, default=10)
+
+    def handle(self, *args, **options):
+        messages = [
+            EmailMessage(
+                f"Benchmark digest {i}",
+                "Here are three quotes from your collection.\n" * 10,
+                "digest@example.com",
+                [f"user{i}@example.com"],
+            )
+            for i in range(options["messages"])
+        ]
+        sink = SmtpSink(latency=options["latency"]).start()
+        try:
+            start = time.perf_counter()
+            backend = EmailBackend(host=sink.host, port=sink.port, username="", password="",
+                                   use_tls=False, use_ssl=False, fail_silently=False)
+            backend.send_messages(messages)
+            self.report("sync", len(messages), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            result = send_messages_async(
+                messages,
+                hostname=sink.host,
+                port=sink.port,
+                username="",
+                password="",
+                use_tls=False,
+                pool_size=options["pool_size"],
+                concurrency=options["concurrency"],
+            )
+            self.report("async", len(result.sent), time.perf_counter() - start)
+            if result.failed:
+                self.stderr.write(f"async: {len(result.failed)} messages failed")
+        finally:
+            sink.stop()
+
+    def report(self, mode: str, sent: int, seconds: float) -> None:
+        self.stdout.write(f"{mode:>5}: {sent} messages in {seconds:.2f}s ({sent / seconds:.0f} msg/s)")
@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from quotes.models import Quote
+from quotes.views import project_quote_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-user quote query latency and, with --maintenance, how long "
+        "VACUUM ANALYZE takes on the quotes table. Run before and after "
+        "partition_quotes to compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50,
+                            help="Number of users with quotes to sample.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--maintenance", action="store_true",
+                            help="Also time VACUUM (ANALYZE) (PostgreSQL only).")
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            Quote.objects.order_by().values_list("user_id", flat=True).distinct()[:options["users"]]
+        )
+        if not user_ids:
+            self.stdout.write("No quotes to measure")
+            return
+        self.report("list", [
+            self.time(lambda: list(project_quote_rows(Quote.objects.filter(user_id=user_id))))
+            for user_id in user_ids
+            for _ in range(options["repeat"])
+        ])
+        self.report("count", [
+            self.time(lambda: Quote.objects.filter(user_id=user_id).count())
+            for user_id in user_ids
+            for _ in range(options["repeat"])
+        ])
+        if options["maintenance"] and connection.vendor == "postgresql":
+            self.maintenance()
+
+    def time(self, query) -> float:
+        start = time.perf_counter()
+        query()
+        return time.perf_counter() - start
+
+    def report(self, name: str, timings: list[float]) -> None:
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{name:>5}: p50 {statistics.median(timings) * 1000:.2f}ms, "
+            f"p95 {p95 * 1000:.2f}ms, max {timings[-1] * 1000:.2f}ms ({len(timings)} queries)"
+        )
+
+    def maintenance(self) -> None:
+        # A partitioned table is vacuumed one partition at a time, so the largest
+        # partition bounds how long any single maintenance operation runs
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass ORDER BY 1",
+                [Quote._meta.db_table],
+            )
+            tables = [row[0] for row in cursor.fetchall()] or [Quote._meta.db_table]
+            timings = []
+            for table in tables:
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+                size = cursor.fetchone()[0]
+                elapsed = self.time(lambda: cursor.execute(f"VACUUM (ANALYZE) {table}"))
+                timings.append(elapsed)
+                self.stdout.write(f"vacuum {table}: {elapsed:.2f}s ({size / 2 ** 20:.1f} MiB)")
+        self.stdout.write(f"vacuum total {sum(timings):.2f}s, longest {max(timings):.2f}s")
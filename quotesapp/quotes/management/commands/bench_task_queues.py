@@ -0,0 +1,116 @@
+import logging
+import statistics
+import threading
+import time
+from contextlib import ExitStack
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long an interactive task waits while a digest flood is "
+        "queued: first with every task on one queue and one worker pool, then "
+        "with the configured routing and a pool of workers per queue. Workers run "
+        "in threads of this process (one task at a time each, like prefork "
+        "children) on an in-memory broker unless --broker is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--broker", default="memory://localhost/",
+                            help="Broker URL, e.g. redis://127.0.0.1:6379/15 (use a spare database).")
+        parser.add_argument("--flood", type=int, default=2000,
+                            help="Digest tasks queued before the interactive ones.")
+        parser.add_argument("--task-ms", type=float, default=5.0,
+                            help="Time each digest task takes.")
+        parser.add_argument("--probes", type=int, default=20,
+                            help="Interactive tasks sent while the flood drains.")
+        parser.add_argument("--interval", type=float, default=0.05,
+                            help="Seconds between interactive tasks.")
+        parser.add_argument("--digest-concurrency", type=int, default=4,
+                            help="Workers consuming the digest queue.")
+        parser.add_argument("--interactive-concurrency", type=int, default=1,
+                            help="Workers consuming the interactive queue.")
+
+    def handle(self, *args, **options):
+        logging.getLogger("celery").setLevel(logging.WARNING)
+        for routed in (False, True):
+            latencies, flood_seconds = self.run(routed, options)
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f"{'routed' if routed else 'shared':>6}: interactive wait p50 "
+                f"{statistics.median(latencies) * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms, "
+                f"max {latencies[-1] * 1000:.1f}ms; flood drained in {flood_seconds:.1f}s"
+            )
+
+    def run(self, routed: bool, options) -> tuple[list[float], float]:
+        digest_route = settings.CELERY_TASK_ROUTES["quotes.tasks.send_email_task"]
+        lock = threading.Lock()
+        flood_done = threading.Event()
+        probes_done = threading.Event()
+        digest_count = [0]
+        latencies = []
+
+        def make_app(name: str) -> Celery:
+            # Workers select their queues on their app, so each gets its own app;
+            # the tasks are not shared so each run counts its own tasks
+            app = Celery(name, set_as_current=False)
+            app.conf.update(
+                broker_url=options["broker"],
+                # The in-memory transport polls its queues; Redis blocks on them
+                broker_transport_options={**settings.CELERY_BROKER_TRANSPORT_OPTIONS, "polling_interval": 0.001},
+                result_backend=None,
+                task_ignore_result=True,
+                task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE,
+                task_default_priority=settings.CELERY_TASK_DEFAULT_PRIORITY,
+                task_routes={"bench.digest": digest_route} if routed else {},
+                worker_prefetch_multiplier=1,
+                worker_hijack_root_logger=False,
+            )
+
+            @app.task(name="bench.digest", acks_late=True, shared=False)
+            def digest():
+                time.sleep(options["task_ms"] / 1000)
+                with lock:
+                    digest_count[0] += 1
+                    if digest_count[0] == options["flood"]:
+                        flood_done.set()
+
+            @app.task(name="bench.interactive", shared=False)
+            def interactive(sent_at: float):
+                with lock:
+                    latencies.append(time.time() - sent_at)
+                    if len(latencies) == options["probes"]:
+                        probes_done.set()
+
+            return app
+
+        if routed:
+            pools = [
+                (digest_route["queue"], options["digest_concurrency"]),
+                (settings.CELERY_TASK_DEFAULT_QUEUE, options["interactive_concurrency"]),
+            ]
+        else:
+            pools = [(settings.CELERY_TASK_DEFAULT_QUEUE, options["digest_concurrency"] + options["interactive_concurrency"])]
+        producer = make_app("bench_producer")
+        with ExitStack() as workers:
+            for queue, concurrency in pools:
+                for number in range(concurrency):
+                    workers.enter_context(start_worker(
+                        make_app(f"bench_{queue}_{number}"), pool="solo", queues=[queue],
+                        perform_ping_check=False, shutdown_timeout=60,
+                    ))
+            start = time.time()
+            for _ in range(options["flood"]):
+                producer.send_task("bench.digest")
+            for _ in range(options["probes"]):
+                producer.send_task("bench.interactive", args=[time.time()])
+                time.sleep(options["interval"])
+            probes_done.wait()
+            flood_done.wait()
+            flood_seconds = time.time() - start
+        return latencies, flood_seconds
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quotes.ratelimit import get_rate_limiter
+
+
+class Command(BaseCommand):
+    help = "Show the current rate, available tokens and observed throughput of the digest rate limiters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Seconds between the two samples used to measure throughput.")
+
+    def handle(self, *args, **options):
+        limiters = [get_rate_limiter(name) for name in settings.DIGEST_RATE_LIMITS]
+        before = [limiter.snapshot() for limiter in limiters]
+        time.sleep(options["interval"])
+        for first, second in zip(before, (limiter.snapshot() for limiter in limiters)):
+            if second["backend"] == "unavailable":
+                self.stdout.write(f"{second['name']}: unavailable")
+                continue
+            throughput = (second["acquired"] - first["acquired"]) / options["interval"]
+            self.stdout.write(
+                f"{second['name']} ({second['backend']}): rate {second['rate']:.1f}/s, "
+                f"tokens {second['tokens']:.1f}, throughput {throughput:.1f}/s"
+            )
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from quotes import book_import
+from quotes.services import refresh_book_catalogue
+
+
+class Command(BaseCommand):
+    help = (
+        "Load books from a large catalogue dump (CSV with a header, or JSON lines; "
+        "gzipped if the name ends in .gz) with COPY, skipping books that already exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"],
+                            help="Dump format (by default from the file name: .jsonl or .ndjson, else CSV).")
+        parser.add_argument("--title-column", default="title")
+        parser.add_argument("--author-column", default="author")
+        parser.add_argument("--chunk-size", type=int, default=500_000,
+                            help="Rows copied and merged per transaction.")
+        parser.add_argument("--dedup-window", type=int, default=1_000_000,
+                            help="Distinct books remembered to drop duplicates before they are copied.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor != "postgresql":
+            raise CommandError("Importing books needs PostgreSQL.")
+        stats = book_import.BookImportStats()
+        try:
+            books = book_import.read_books(
+                options["path"],
+                stats,
+                format=options["format"],
+                title_column=options["title_column"],
+                author_column=options["author_column"],
+                dedup_window=options["dedup_window"],
+            )
+            book_import.load_books(
+                connection,
+                books,
+                stats,
+                chunk_size=options["chunk_size"],
+                progress=lambda stats: self.stdout.write(str(stats)),
+            )
+        except (book_import.BookImportError, OSError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Done: {stats}"))
+        if settings.BOOK_CATALOGUE_PATH and stats.added:
+            refresh_book_catalogue()
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from quotes import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the outbox backlog, or replay events so the derived data consumers "
+        "handle them again (e.g. after fixing a consumer or to rebuild its data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("step", choices=["status", "replay"])
+        parser.add_argument("--since", type=datetime.datetime.fromisoformat,
+                            help="Replay the events written since this time (ISO 8601, UTC if no offset).")
+        parser.add_argument("--from-id", type=int, help="Replay the events from this id on.")
+        parser.add_argument("--topic", action="append", dest="topics",
+                            help="Only replay events of this topic (repeatable).")
+
+    def handle(self, *args, **options):
+        if options["step"] == "status":
+            status = outbox.status()
+            self.stdout.write(
+                f"{status['pending']} pending events (oldest {status['oldest_pending_seconds']:.1f}s old), "
+                f"{status['dead']} failed too often"
+            )
+            return
+        since = options["since"]
+        if since is None and options["from_id"] is None:
+            raise CommandError("Give --since or --from-id.")
+        if since is not None and timezone.is_naive(since):
+            since = timezone.make_aware(since, datetime.timezone.utc)
+        requeued = outbox.replay(since=since, from_id=options["from_id"], topics=options["topics"])
+        self.stdout.write(f"Requeued {requeued} events")
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from quotes import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the quotes table to hash partitions on user_id while the app keeps "
+        "running: prepare the partitioned copy, copy the rows in batches, then swap."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("step", choices=["status", "prepare", "copy", "swap"])
+        parser.add_argument("--partitions", type=int, default=settings.QUOTE_PARTITIONS or 16)
+        parser.add_argument("--batch-size", type=int, default=10000,
+                            help="Ids copied per transaction.")
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Seconds to sleep between batches to limit the load.")
+        parser.add_argument("--no-verify", action="store_true",
+                            help="Skip comparing row counts before the swap.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning needs PostgreSQL.")
+        try:
+            if options["step"] == "status":
+                self.status(connection)
+            elif options["step"] == "prepare":
+                partitioning.prepare(connection, options["partitions"])
+                self.stdout.write(f"Created {partitioning.PARTITIONED_TABLE} with {options['partitions']} partitions")
+            elif options["step"] == "copy":
+                copied = partitioning.copy(
+                    connection,
+                    options["batch_size"],
+                    pause=options["pause"],
+                    progress=lambda done, end: self.stdout.write(f"Copied ids up to {done} of {end}"),
+                )
+                self.stdout.write(f"Copied {copied} quotes")
+            else:
+                partitioning.swap(connection, verify=not options["no_verify"])
+                self.stdout.write(
+                    f"{partitioning.TABLE} is partitioned; the old table was kept as "
+                    f"{partitioning.UNPARTITIONED_TABLE}"
+                )
+        except partitioning.PartitioningError as e:
+            raise CommandError(str(e))
+
+    def status(self, connection) -> None:
+        with connection.cursor() as cursor:
+            if partitioning.is_partitioned(cursor):
+                cursor.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = %s::regclass", [partitioning.TABLE])
+                self.stdout.write(f"{partitioning.TABLE} is partitioned ({cursor.fetchone()[0]} partitions)")
+                return
+            if not partitioning.table_exists(cursor, partitioning.PARTITIONED_TABLE):
+                self.stdout.write(f"{partitioning.TABLE} is not partitioned")
+                return
+            cursor.execute(
+                f"SELECT (SELECT coalesce(max(id), 0) FROM {partitioning.PARTITIONED_TABLE}), "
+                f"(SELECT coalesce(max(id), 0) FROM {partitioning.TABLE}), "
+                f"(SELECT count(*) FROM {partitioning.CHANGES_TABLE})"
+            )
+            copied_up_to, last_id, changes = cursor.fetchone()
+            self.stdout.write(
+                f"Copy in progress: ids up to {copied_up_to} of {last_id} copied, "
+                f"{changes} changes to replay at the swap"
+            )
@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter so nothing is already imported. Prints the timings
+# of the boot phases on stdout while -X importtime writes to stderr.
+STARTUP_SCRIPT = """
+import os, sys, time
+start = time.perf_counter()
+target, warmup, first_request = sys.argv[1], sys.argv[2] == "1", sys.argv[3] == "1"
+phases = []
+if target == "web":
+    from quotesapp.wsgi import application
+    phases.append(("load wsgi application", time.perf_counter() - start))
+    if warmup:
+        from quotesapp.warmup import warm_up
+        phases.append(("warmup", warm_up()))
+else:
+    import django
+    django.setup()
+    from quotesapp.celery import app
+    app.loader.import_default_modules()
+    phases.append(("load celery app and tasks", time.perf_counter() - start))
+if first_request:
+    from django.test import Client
+    client = Client()
+    for label in ("first request", "second request"):
+        request_start = time.perf_counter()
+        client.get("/")
+        phases.append((label, time.perf_counter() - request_start))
+for label, seconds in phases:
+    print(f"{label}\\t{seconds}")
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile process startup: import time per module (as reported by "
+        "python -X importtime) and the time spent in each boot phase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=["web", "worker"], default="web",
+                            help="Profile a gunicorn (web) or Celery (worker) process boot.")
+        parser.add_argument("--top", type=int, default=20,
+                            help="Number of modules and packages to list.")
+        parser.add_argument("--warmup", action="store_true",
+                            help="Run the DJANGO_WARMUP step after loading the web application.")
+        parser.add_argument("--first-request", action="store_true",
+                            help="Time the first and second request to the login page.")
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_WARMUP": ""}
+        result = subprocess.run(
+            [
+                sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT,
+                options["target"],
+                "1" if options["warmup"] else "0",
+                "1" if options["first_request"] else "0",
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr[-2000:])
+            raise SystemExit(result.returncode)
+
+        modules = parse_importtime(result.stderr)
+        top = options["top"]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Boot phases ({options['target']})"))
+        for line in result.stdout.splitlines():
+            if "\t" not in line:
+                continue
+            label, seconds = line.rsplit("\t", 1)
+            self.stdout.write(f"  {label:<28} {float(seconds) * 1000:9.1f} ms")
+
+        total_us = sum(self_us for self_us, _ in modules.values())
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Imports: {len(modules)} modules, {total_us / 1000:.1f} ms total"
+        ))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Top {top} packages by self time"))
+        packages = defaultdict(int)
+        for name, (self_us, _) in modules.items():
+            packages[name.split(".")[0]] += self_us
+        for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+            self.stdout.write(f"  {name:<40} {self_us / 1000:9.1f} ms")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Top {top} modules by cumulative time"))
+        by_cumulative = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        for name, (self_us, cumulative_us) in by_cumulative:
+            self.stdout.write(f"  {name:<50} {cumulative_us / 1000:9.1f} ms  (self {self_us / 1000:.1f} ms)")
+
+
+def parse_importtime(output: str) -> dict[str, tuple[int, int]]:
+    """
+    Parse `python -X importtime` output into {module: (self_us, cumulative_us)}.
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # Header line
+            continue
+        modules[parts[2].strip()] = (self_us, cumulative_us)
+    return modules
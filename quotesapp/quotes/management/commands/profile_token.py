@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.profiling import TOKEN_HEADER, TOKEN_PARAMETER, make_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Print a token that lets a staff user profile their own requests: send it "
+        "in the X-Profile header or the _profile query parameter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+
+    def handle(self, *args, **options):
+        if not settings.PROFILING_DIR:
+            raise CommandError("Set PROFILING_DIR to turn request profiling on.")
+        user = get_user_model().objects.filter(username=options["username"]).first()
+        if user is None or not user.is_staff:
+            raise CommandError(f"{options['username']} is not a staff user.")
+        token = make_token(user)
+        minutes = settings.PROFILING_TOKEN_MAX_AGE // 60
+        self.stdout.write(token)
+        self.stdout.write(
+            f"Valid for {minutes} minutes, e.g. ?{TOKEN_PARAMETER}={token} "
+            f"or {TOKEN_HEADER}: {token}",
+            self.style.NOTICE,
+        )
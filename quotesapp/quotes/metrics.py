@@ -0,0 +1,174 @@
+"""
+Prometheus metrics for the web and worker hot paths.
+
+With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py), every gunicorn worker
+writes its samples to that directory and /metrics aggregates all of them;
+without it, /metrics only reports the serving process.
+"""
+
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+from quotes.streaming import finish_after_streaming
+
+REQUEST_LATENCY = Histogram(
+    "quotes_http_request_duration_seconds",
+    "Request latency by URL name.",
+    ["view", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "quotes_http_request_db_queries",
+    "Number of database queries per request by URL name.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_TIME = Histogram(
+    "quotes_http_request_db_duration_seconds",
+    "Time spent in database queries per request by URL name.",
+    ["view"],
+)
+CACHE_REQUESTS = Counter(
+    "quotes_cache_requests",
+    "Cache lookups by cache name and result (hit or miss).",
+    ["cache", "result"],
+)
+QUOTES_CREATED = Counter(
+    "quotes_created",
+    "Quotes created.",
+)
+QUOTE_CONFLICTS = Counter(
+    "quotes_conflicts",
+    "Quote creations and restores rejected because the quote already exists.",
+    ["operation"],
+)
+DIGEST_TASKS_ENQUEUED = Counter(
+    "quotes_digest_tasks_enqueued",
+    "Digest send tasks enqueued.",
+)
+DIGEST_USERS = Counter(
+    "quotes_digest_users",
+    "Digest outcomes per user (sent, skipped, failed, duplicates).",
+    ["outcome"],
+)
+OUTBOX_EVENTS = Counter(
+    "quotes_outbox_events",
+    "Outbox events handled by the consumers, by outcome (processed or failed).",
+    ["outcome"],
+)
+OUTBOX_LAG = Histogram(
+    "quotes_outbox_lag_seconds",
+    "Time from an outbox event's write to its processing.",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+OUTBOX_OLDEST_PENDING = Gauge(
+    "quotes_outbox_oldest_pending_seconds",
+    "Age of the oldest unprocessed outbox event after the last drain (0 when caught up).",
+    multiprocess_mode="livemostrecent",
+)
+RATE_LIMIT_RATE = Gauge(
+    "quotes_rate_limit_rate",
+    "Current rate of a digest rate limiter, in tokens per second.",
+    ["limiter"],
+    multiprocess_mode="livemostrecent",
+)
+RATE_LIMIT_TOKENS = Gauge(
+    "quotes_rate_limit_tokens",
+    "Tokens left in a digest rate limiter's bucket after the last take.",
+    ["limiter"],
+    multiprocess_mode="livemostrecent",
+)
+RATE_LIMIT_ACQUIRED = Counter(
+    "quotes_rate_limit_acquired",
+    "Tokens acquired from a digest rate limiter.",
+    ["limiter"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "quotes_log_records_dropped",
+    "Log records dropped because the log queue was full.",
+)
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    CACHE_REQUESTS.labels(cache, "hit").inc(hits)
+    CACHE_REQUESTS.labels(cache, "miss").inc(misses)
+
+
+class MetricsMiddleware:
+    """
+    Times every request and counts the database queries it runs. Streaming
+    responses are measured until their content has been sent.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        wrappers = ExitStack()
+        try:
+            # Reads may go to a replica
+            for database in connections.all():
+                wrappers.enter_context(database.execute_wrapper(count_query))
+            response = self.get_response(request)
+        except BaseException:
+            wrappers.close()
+            raise
+
+        def finish():
+            wrappers.close()
+            elapsed = time.perf_counter() - start
+            match = getattr(request, "resolver_match", None)
+            view = match.view_name if match else "unmatched"
+            REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(view).observe(queries[0])
+            REQUEST_DB_TIME.labels(view).observe(queries[1])
+
+        if response.streaming:
+            # Streamed rows are read from the database while the response is sent
+            finish_after_streaming(response, finish)
+        else:
+            finish()
+        return response
+
+
+def metrics_view(request):
+    """
+    Expose the metrics in the Prometheus text format. If METRICS_BEARER_TOKEN is
+    set, scrapers have to send it as a bearer token; the prod profile refuses
+    every scraper without one.
+    """
+    token = settings.METRICS_BEARER_TOKEN
+    if not token and settings.SETTINGS_PROFILE == "prod":
+        return HttpResponseForbidden()
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:16
+
+from datetime import datetime, time, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+import quotes.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast, Mod
+
+
+def assign_send_slots(apps, schema_editor):
+    # The slot computation of quotes.scheduling at the time, inlined so later
+    # changes to it do not change this migration
+    User = apps.get_model('quotes', 'User')
+    send_time = time.fromisoformat(settings.DIGEST_SEND_TIME)
+    now = datetime.now(dt_timezone.utc)
+    for tz_name in User.objects.values_list('timezone', flat=True).distinct():
+        tz = ZoneInfo(tz_name)
+        send_at = datetime.combine(now.astimezone(tz).date(), send_time, tzinfo=tz).astimezone(dt_timezone.utc)
+        minutes = Cast(
+            Mod(
+                Value(send_at.hour * 60 + send_at.minute) + Mod(F('id'), Value(settings.DIGEST_SPREAD_MINUTES)),
+                Value(24 * 60),
+            ),
+            output_field=IntegerField(),
+        )
+        User.objects.filter(timezone=tz_name).update(send_slot=minutes / Value(settings.DIGEST_SLOT_MINUTES))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0009_digestrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestrun',
+            name='send_slot',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='send_slot',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64, validators=[quotes.models.validate_timezone]),
+        ),
+        migrations.RunPython(assign_send_slots, migrations.RunPython.noop),
+    ]
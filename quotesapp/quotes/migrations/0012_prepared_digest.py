@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0011_digest_delivery_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreparedDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('recipient', models.EmailField(max_length=254)),
+                ('subject', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('quote_ids', models.JSONField(blank=True, default=list)),
+                ('prepared_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_prepared_digest_per_user_per_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_quotes(apps, schema_editor):
+    """
+    Partition the quotes table when QUOTE_PARTITIONS is set and it is still
+    empty. Tables with data are converted online with `manage.py partition_quotes`.
+
+    The table being empty, it is replaced outright: a partitioned table with the
+    same columns takes its name, then its indexes, foreign keys and primary key
+    (extended with the partition key) are recreated under their original names.
+    """
+    connection = schema_editor.connection
+    partitions = settings.QUOTE_PARTITIONS
+    if connection.vendor != 'postgresql' or not partitions:
+        return
+    if partitions < 2:
+        raise ValueError('QUOTE_PARTITIONS must be 0 or at least 2.')
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'quotes_quote'::regclass")
+        if cursor.fetchone()[0] == 'p':
+            return
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM quotes_quote)')
+        if cursor.fetchone()[0]:
+            return
+
+        cursor.execute(
+            """
+            SELECT pg_get_indexdef(idx.oid)
+            FROM pg_index JOIN pg_class idx ON idx.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = 'quotes_quote'::regclass AND NOT pg_index.indisprimary
+            ORDER BY idx.relname
+            """
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'quotes_quote'::regclass AND contype IN ('p', 'f') ORDER BY conname"
+        )
+        constraints = cursor.fetchall()
+        primary_key = next(name for name, kind, _ in constraints if kind == 'p')
+        foreign_keys = [(name, definition) for name, kind, definition in constraints if kind == 'f']
+
+        cursor.execute(
+            'CREATE TABLE quotes_quote_part (LIKE quotes_quote INCLUDING DEFAULTS '
+            'INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY HASH (user_id)'
+        )
+        cursor.execute('DROP TABLE quotes_quote')
+        cursor.execute('ALTER TABLE quotes_quote_part RENAME TO quotes_quote')
+        for remainder in range(partitions):
+            cursor.execute(
+                f'CREATE TABLE quotes_quote_part_{remainder} PARTITION OF quotes_quote '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            )
+        cursor.execute('CREATE SEQUENCE quotes_quote_id_seq OWNED BY quotes_quote.id')
+        cursor.execute("ALTER TABLE quotes_quote ALTER COLUMN id SET DEFAULT nextval('quotes_quote_id_seq')")
+        # Unique constraints on a partitioned table must include the partition key
+        cursor.execute(f'ALTER TABLE quotes_quote ADD CONSTRAINT {primary_key} PRIMARY KEY (id, user_id)')
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE quotes_quote ADD CONSTRAINT {name} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0012_prepared_digest'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_quotes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:43
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def populate_user_quote_stats(apps, schema_editor):
+    # The stats computation of quotes.stats at the time, inlined on the historical
+    # models so later changes to it do not change this migration. The table is
+    # new: every user gets a row, 500 users at a time.
+    UserQuoteStats = apps.get_model('quotes', 'UserQuoteStats')
+    Quote = apps.get_model('quotes', 'Quote')
+    User = apps.get_model('quotes', 'User')
+    last_id = 0
+    while user_ids := list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:500]):
+        last_id = user_ids[-1]
+        stats = {
+            user_id: {'quote_count': 0, 'book_counts': {}, 'author_counts': {}, 'month_counts': {}}
+            for user_id in user_ids
+        }
+        groups = (
+            Quote.objects
+            .filter(user_id__in=user_ids, deleted_at__isnull=True)
+            .annotate(month=TruncMonth('created_at', tzinfo=datetime.timezone.utc))
+            .values('user_id', 'book_id', 'book__author', 'month')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for group in groups:
+            fields = stats[group['user_id']]
+            fields['quote_count'] += group['count']
+            for counts, key in (
+                (fields['book_counts'], str(group['book_id'])),
+                (fields['author_counts'], group['book__author']),
+                (fields['month_counts'], group['month'].strftime('%Y-%m')),
+            ):
+                counts[key] = counts.get(key, 0) + group['count']
+        UserQuoteStats.objects.bulk_create([
+            UserQuoteStats(user_id=user_id, book_count=len(fields['book_counts']), **fields)
+            for user_id, fields in stats.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0013_partition_quote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserQuoteStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='quote_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('quote_count', models.PositiveIntegerField(default=0)),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('book_counts', models.JSONField(default=dict)),
+                ('author_counts', models.JSONField(default=dict)),
+                ('month_counts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_user_quote_stats, migrations.RunPython.noop),
+    ]
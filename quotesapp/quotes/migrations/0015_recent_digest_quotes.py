@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0014_user_quote_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecentDigestQuotes',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recent_digest_quotes', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('entries', models.JSONField(default=list)),
+            ],
+        ),
+    ]
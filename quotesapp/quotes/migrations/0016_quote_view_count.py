@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0015_recent_digest_quotes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteViewCount',
+            fields=[
+                ('quote', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='view_count', serialize=False, to='quotes.quote')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-views'], name='quote_views_per_user_idx')],
+            },
+        ),
+    ]
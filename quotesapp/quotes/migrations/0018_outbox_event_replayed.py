@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0017_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='replayed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
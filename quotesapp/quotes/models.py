@@ -1,7 +1,12 @@
+import datetime
+
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db.models import Q, UniqueConstraint
+from django.core.exceptions import ValidationError
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from quotes.scheduling import compute_send_slot
 
 # Create your models here.
 
@@ -50,10 +55,199 @@ class Book(models.Model):
     def __str__(self):
         return f"{self.title} by {self.author}"
 
+def validate_timezone(value: str) -> None:
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"{value} is not a valid timezone.")
+
 class User(AbstractUser):
     email = models.EmailField(unique=True, blank=False)
     first_name = models.CharField(max_length=255, blank=False)
     last_name = models.CharField(max_length=255, blank=False)
+    timezone = models.CharField(max_length=64, default="UTC", validators=[validate_timezone])
+    # UTC slot of the day in which the daily digest is sent, see quotes.scheduling
+    send_slot = models.PositiveSmallIntegerField(null=True, blank=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The slot is spread by id, so it can only be assigned once the row exists
+        send_slot = compute_send_slot(self.pk, self.timezone)
+        if send_slot != self.send_slot:
+            self.send_slot = send_slot
+            User.objects.filter(pk=self.pk).update(send_slot=send_slot)
+
+    def __str__(self):
+        return f"{self.username} - {self.email}"
+
+class DigestRun(models.Model):
+    """
+    Aggregate progress of one daily digest fan-out. Each send task bumps one of
+    the counters instead of storing a result row per user.
+    """
+    started_at = models.DateTimeField(auto_now_add=True)
+    send_slot = models.PositiveSmallIntegerField(null=True, blank=True)
+    total_users = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Users left out because their digest had already been claimed or sent
+    duplicates = models.PositiveIntegerField(default=0)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.sent + self.skipped + self.failed >= self.total_users
+
+    def __str__(self):
+        return f"Digest run {self.started_at:%Y-%m-%d %H:%M}: {self.sent} sent, {self.skipped} skipped, {self.failed} failed"
+
+class DigestDelivery(models.Model):
+    """
+    Send ledger: one row per user per day, claimed by the digest run that enqueues
+    the user. A retried or double-fired fan-out skips users that already have a row,
+    and sent_at guards against the same send task running twice.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    date = models.DateField(db_index=True)
+    run = models.ForeignKey(DigestRun, on_delete=models.SET_NULL, null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "date"],
+                name="unique_digest_delivery_per_user_per_day"
+            )
+        ]
+
+    def __str__(self):
+        return f"Digest for user {self.user_id} on {self.date}"
+
+class PreparedDigest(models.Model):
+    """
+    Staging table for digests rendered ahead of the send window. The send stage
+    only has to read these rows and hand them to the mail connection.
+    An empty quote_ids means the user had no quotes and nothing is sent.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    date = models.DateField()
+    recipient = models.EmailField()
+    subject = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    quote_ids = models.JSONField(default=list, blank=True)
+    prepared_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "date"],
+                name="unique_prepared_digest_per_user_per_day"
+            )
+        ]
+
+    def __str__(self):
+        return f"Prepared digest for user {self.user_id} on {self.date}"
+
+
+class UserQuoteStats(models.Model):
+    """
+    Per-user summary of the live (not deleted) quotes, so dashboards and digests
+    read one row instead of aggregating the user's quotes. As quotes are
+    created, moved to another book, deleted and restored, the outbox consumer
+    adds or takes away one quote per change (see quotes.stats); a daily job
+    recomputes it from the quotes table.
+    Counts are keyed by book id, author and creation month ("YYYY-MM", UTC).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="quote_stats")
+    quote_count = models.PositiveIntegerField(default=0)
+    book_count = models.PositiveIntegerField(default=0)
+    book_counts = models.JSONField(default=dict)
+    author_counts = models.JSONField(default=dict)
+    month_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def top_authors(self, limit: int = 5) -> list[tuple[str, int]]:
+        return sorted(self.author_counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def quotes_per_month(self) -> list[tuple[str, int]]:
+        return sorted(self.month_counts.items())
+
+    def __str__(self):
+        return f"Quote stats for user {self.user_id}: {self.quote_count} quotes from {self.book_count} books"
+
+
+class RecentDigestQuotes(models.Model):
+    """
+    Ring buffer of the quotes sent in a user's recent digests, so the digest
+    sampler can skip them without joining a send history. Entries are
+    [date, quote ids] pairs, oldest first, and entries older than the window are
+    dropped whenever a digest is recorded.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="recent_digest_quotes")
+    entries = models.JSONField(default=list)
+
+    def quote_ids(self, since: datetime.date) -> set[int]:
+        """Ids of the quotes sent on or after the given date."""
+        return {quote_id for date, quote_ids in self.entries if date >= since.isoformat() for quote_id in quote_ids}
+
+    def record(self, date: datetime.date, quote_ids: list[int], since: datetime.date) -> None:
+        """Add a digest sent on date, dropping the entries before since."""
+        self.entries = [
+            entry for entry in self.entries
+            if since.isoformat() <= entry[0] != date.isoformat()
+        ] + [[date.isoformat(), quote_ids]]
+
+    def __str__(self):
+        return f"Recent digest quotes for user {self.user_id}"
+
+
+class QuoteViewCount(models.Model):
+    """
+    Number of times a quote was viewed. Views are buffered (see quotes.view_counts)
+    and added here in batches, so viewing a quote never writes to the database.
+    There is no database constraint on quote: the quotes table may be partitioned
+    on (id, user_id). Counts of quotes deleted through the ORM are deleted with them.
+    """
+    quote = models.OneToOneField(Quote, on_delete=models.CASCADE, primary_key=True, db_constraint=False, related_name="view_count")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    views = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-views"], name="quote_views_per_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"Quote {self.quote_id}: {self.views} views"
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox: a change to a quote, written in the same transaction
+    as the change itself, for the consumers of derived data to pick up
+    asynchronously (see quotes.outbox). processed_at is set once every consumer
+    handled the event; events that failed OUTBOX_MAX_ATTEMPTS times are left
+    unprocessed until replayed. replayed marks events requeued by a replay, which
+    consumers applying deltas must not apply again.
+    """
+    QUOTE_CREATED = "quote.created"
+    QUOTE_UPDATED = "quote.updated"
+    QUOTE_DELETED = "quote.deleted"
+    QUOTE_RESTORED = "quote.restored"
+
+    topic = models.CharField(max_length=64)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    object_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    replayed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["id"], condition=Q(processed_at__isnull=True), name="outbox_pending_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.username} - {self.email}"
\ No newline at end of file
+        return f"{self.topic} {self.object_id}"
@@ -0,0 +1,153 @@
+"""
+Transactional outbox for data derived from the quotes.
+
+The quote services write an OutboxEvent in the same transaction as each change,
+so an event exists if and only if the change committed, and writes pay for one
+insert instead of running the consumers. process_outbox_task drains the table
+in batches, oldest first: each batch is claimed with SELECT ... FOR UPDATE SKIP
+LOCKED, so several workers can drain in parallel without taking the same
+events, handed to every handler at once and marked processed in the same
+transaction.
+
+Handlers take a list of events. Their writes commit with the events being
+marked processed, so each event is applied once, but batches drained in
+parallel may finish out of order. Events requeued by a replay are handled again
+and flagged as replayed: handlers that apply events as deltas (the quote stats)
+read the current state of those instead; the others (the similarity indexes)
+always do.
+A batch that fails is retried event by event so one bad event does not hold up
+the others; an event that failed OUTBOX_MAX_ATTEMPTS times stays unprocessed
+until it is replayed.
+"""
+
+import datetime
+import logging
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from quotes.metrics import OUTBOX_EVENTS, OUTBOX_LAG, OUTBOX_OLDEST_PENDING
+from quotes.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[list[OutboxEvent]], None]
+
+
+def record_events(topic: str, user_id: int, object_ids, payloads: list[dict]|None = None) -> None:
+    """
+    Write one event per object in the current transaction.
+    """
+    payloads = payloads or [{}] * len(object_ids)
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic, user_id=user_id, object_id=object_id, payload=payload)
+        for object_id, payload in zip(object_ids, payloads)
+    ])
+
+
+def pending_events():
+    return OutboxEvent.objects.filter(processed_at__isnull=True, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS)
+
+
+def dispatch(handlers: list[Handler], events: list[OutboxEvent]) -> None:
+    for handler in handlers:
+        handler(events)
+
+
+def process_batch(handlers: list[Handler], batch_size: int) -> int:
+    """
+    Claim the oldest pending events that no other consumer holds, run the
+    handlers on them and mark them processed. Returns the number of events claimed.
+    """
+    with transaction.atomic():
+        events = list(pending_events().select_for_update(skip_locked=True).order_by("id")[:batch_size])
+        if not events:
+            return 0
+        failed = []
+        try:
+            with transaction.atomic():
+                dispatch(handlers, events)
+        except Exception:
+            logger.exception("Outbox batch failed", extra={"events": len(events)})
+            if len(events) == 1:
+                failed.append(events[0].id)
+            else:
+                failed = retry_one_by_one(handlers, events)
+        now = timezone.now()
+        processed = [event for event in events if event.id not in failed]
+        OutboxEvent.objects.filter(id__in=[event.id for event in processed]).update(processed_at=now)
+        OutboxEvent.objects.filter(id__in=failed).update(attempts=F("attempts") + 1)
+    for event in processed:
+        OUTBOX_LAG.observe((now - event.created_at).total_seconds())
+    OUTBOX_EVENTS.labels("processed").inc(len(processed))
+    OUTBOX_EVENTS.labels("failed").inc(len(failed))
+    return len(events)
+
+
+def retry_one_by_one(handlers: list[Handler], events: list[OutboxEvent]) -> list[int]:
+    """Run the handlers on each event on its own. Returns the ids of the events that failed."""
+    failed = []
+    for event in events:
+        try:
+            with transaction.atomic():
+                dispatch(handlers, [event])
+        except Exception:
+            logger.exception("Outbox event failed", extra={"event_id": event.id, "topic": event.topic})
+            failed.append(event.id)
+    return failed
+
+
+def drain(handlers: list[Handler], batch_size: int, time_limit: float) -> int:
+    """
+    Process batches until the outbox is empty or time_limit seconds have
+    passed, then record the age of the oldest event left. Returns the number of
+    events claimed.
+    """
+    deadline = time.monotonic() + time_limit
+    claimed = 0
+    while time.monotonic() < deadline:
+        count = process_batch(handlers, batch_size)
+        claimed += count
+        if count < batch_size:
+            break
+    oldest = pending_events().order_by("id").values_list("created_at", flat=True).first()
+    OUTBOX_OLDEST_PENDING.set((timezone.now() - oldest).total_seconds() if oldest else 0)
+    return claimed
+
+
+def replay(since: datetime.datetime|None = None, from_id: int|None = None, topics: list[str]|None = None) -> int:
+    """
+    Mark the events written since the given time or from the given id (and of
+    the given topics) as unprocessed, with no failed attempts, so the consumers
+    handle them again. Only events still within OUTBOX_RETENTION_DAYS can be
+    replayed. Returns the number of events requeued.
+    """
+    events = OutboxEvent.objects.all()
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    if from_id is not None:
+        events = events.filter(id__gte=from_id)
+    if topics:
+        events = events.filter(topic__in=topics)
+    return events.update(processed_at=None, attempts=0, replayed=True)
+
+
+def prune(retention_days: int) -> int:
+    """Delete the events processed more than retention_days ago."""
+    cutoff = timezone.now() - datetime.timedelta(days=retention_days)
+    deleted, _ = OutboxEvent.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
+
+
+def status() -> dict:
+    """Pending and dead (failed too often) events and the age of the oldest pending one."""
+    oldest = pending_events().order_by("id").values_list("created_at", flat=True).first()
+    return {
+        "pending": pending_events().count(),
+        "dead": OutboxEvent.objects.filter(processed_at__isnull=True, attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).count(),
+        "oldest_pending_seconds": (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
@@ -0,0 +1,243 @@
+"""
+Opt-in Postgres hash partitioning of the quotes table on user_id.
+
+Every per-user query filters on user_id, so once the table is split into
+QUOTE_PARTITIONS hash partitions it only touches one of them, and vacuum and
+index builds work on partitions a fraction of the size. An existing table is
+converted online by the partition_quotes command, in three steps:
+
+1. prepare: create a partitioned copy with the same columns, indexes and foreign
+   keys under temporary names, and a trigger on the live table that records the
+   ids of the rows changed from then on;
+2. copy: backfill the copy in id ranges, one short transaction per batch;
+3. swap: lock the live table, recopy the rows changed since prepare, swap the
+   names and keep the old table as quotes_quote_unpartitioned.
+
+Postgres requires unique constraints on a partitioned table to include the
+partition key: the primary key becomes (id, user_id), and the partial unique
+constraint on (quote, user, book) already qualifies. The Django model and its
+managers are unchanged.
+"""
+
+import re
+import time
+
+from django.db import transaction
+
+TABLE = "quotes_quote"
+PARTITIONED_TABLE = "quotes_quote_part"
+UNPARTITIONED_TABLE = "quotes_quote_unpartitioned"
+CHANGES_TABLE = "quotes_quote_part_changes"
+CAPTURE_TRIGGER = "quotes_quote_part_capture"
+SEQUENCE = "quotes_quote_part_id_seq"
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def temporary_name(name: str) -> str:
+    # Postgres identifiers are at most 63 characters
+    return f"{name[:61]}_p"
+
+
+def retired_name(name: str) -> str:
+    return f"{name[:56]}_unpart"
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [TABLE])
+    return cursor.fetchone()[0] == "p"
+
+
+def table_exists(cursor, table: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+    return cursor.fetchone()[0]
+
+
+def get_columns(cursor) -> list[str]:
+    cursor.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum",
+        [TABLE],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_indexes(cursor, table: str) -> list[tuple[str, str]]:
+    """Name and definition of every index of the table except the primary key."""
+    cursor.execute(
+        """
+        SELECT idx.relname, pg_get_indexdef(idx.oid)
+        FROM pg_index JOIN pg_class idx ON idx.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = %s::regclass AND NOT pg_index.indisprimary
+        ORDER BY idx.relname
+        """,
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def get_constraints(cursor, table: str, kind: str) -> list[tuple[str, str]]:
+    """Name and definition of the table's constraints of a kind ('p' or 'f')."""
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = %s ORDER BY conname",
+        [table, kind],
+    )
+    return cursor.fetchall()
+
+
+def partitioned_table_sql(partitions: int, indexes: list[tuple[str, str]], foreign_keys: list[tuple[str, str]]) -> list[str]:
+    """
+    Statements creating the partitioned copy of the quotes table, with the
+    indexes and foreign keys of the live table under temporary names.
+    """
+    if partitions < 2:
+        raise PartitioningError("At least two partitions are needed.")
+    statements = [
+        f"CREATE TABLE {PARTITIONED_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY HASH (user_id)",
+        f"CREATE SEQUENCE {SEQUENCE}",
+        f"ALTER TABLE {PARTITIONED_TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')",
+        f"ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {temporary_name(TABLE + '_pkey')} PRIMARY KEY (id, user_id)",
+    ]
+    statements += [
+        f"CREATE TABLE {PARTITIONED_TABLE}_{remainder} PARTITION OF {PARTITIONED_TABLE} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+    for name, definition in indexes:
+        statements.append(re.sub(
+            rf'INDEX "?{re.escape(name)}"? ON \S+ ',
+            f"INDEX {temporary_name(name)} ON {PARTITIONED_TABLE} ",
+            definition,
+            count=1,
+        ))
+    statements += [
+        f"ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {temporary_name(name)} {definition}"
+        for name, definition in foreign_keys
+    ]
+    return statements
+
+
+def capture_changes_sql() -> list[str]:
+    """Statements recording the ids of quotes inserted, updated or deleted from now on."""
+    return [
+        f"CREATE TABLE {CHANGES_TABLE} (id bigint NOT NULL)",
+        f"""
+        CREATE FUNCTION {CAPTURE_TRIGGER}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO {CHANGES_TABLE} VALUES (OLD.id);
+            ELSE
+                INSERT INTO {CHANGES_TABLE} VALUES (NEW.id);
+            END IF;
+            RETURN NULL;
+        END $$
+        """,
+        f"CREATE TRIGGER {CAPTURE_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON {TABLE} "
+        f"FOR EACH ROW EXECUTE FUNCTION {CAPTURE_TRIGGER}()",
+    ]
+
+
+def prepare(connection, partitions: int, capture: bool = True) -> None:
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            raise PartitioningError(f"{TABLE} is already partitioned.")
+        if table_exists(cursor, PARTITIONED_TABLE):
+            raise PartitioningError(f"{PARTITIONED_TABLE} already exists; run the copy and swap steps.")
+        statements = partitioned_table_sql(
+            partitions,
+            get_indexes(cursor, TABLE),
+            get_constraints(cursor, TABLE, "f"),
+        )
+        if capture:
+            statements += capture_changes_sql()
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def copy(connection, batch_size: int, pause: float = 0.0, progress=None) -> int:
+    """
+    Backfill the partitioned copy in id ranges of batch_size, committing each
+    batch. Resumes after the highest id already copied. Returns the rows copied.
+    """
+    with connection.cursor() as cursor:
+        columns = ", ".join(get_columns(cursor))
+        cursor.execute(f"SELECT coalesce(max(id), 0) FROM {PARTITIONED_TABLE}")
+        start = cursor.fetchone()[0]
+        cursor.execute(f"SELECT coalesce(max(id), 0) FROM {TABLE}")
+        end = cursor.fetchone()[0]
+    copied = 0
+    while start < end:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {PARTITIONED_TABLE} ({columns}) SELECT {columns} FROM {TABLE} "
+                f"WHERE id > %s AND id <= %s ON CONFLICT DO NOTHING",
+                [start, start + batch_size],
+            )
+            copied += cursor.rowcount
+        start += batch_size
+        if progress:
+            progress(min(start, end), end)
+        if pause:
+            time.sleep(pause)
+    return copied
+
+
+def swap(connection, verify: bool = True) -> None:
+    """
+    Catch up with the changes made since prepare and swap the tables, all while
+    holding an exclusive lock on the quotes table. With verify, the row counts
+    of both tables are compared first and nothing is swapped if they differ.
+    """
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        columns = ", ".join(get_columns(cursor))
+        capture = table_exists(cursor, CHANGES_TABLE)
+        cursor.execute(f"SELECT coalesce(max(id), 0) FROM {PARTITIONED_TABLE}")
+        copied_up_to = cursor.fetchone()[0]
+        changed = f"SELECT id FROM {CHANGES_TABLE}" if capture else "SELECT NULL::bigint"
+        cursor.execute(f"DELETE FROM {PARTITIONED_TABLE} WHERE id IN ({changed})")
+        cursor.execute(
+            f"INSERT INTO {PARTITIONED_TABLE} ({columns}) SELECT {columns} FROM {TABLE} "
+            f"WHERE id > %s OR id IN ({changed})",
+            [copied_up_to],
+        )
+        if verify:
+            cursor.execute(f"SELECT (SELECT count(*) FROM {TABLE}), (SELECT count(*) FROM {PARTITIONED_TABLE})")
+            live, partitioned = cursor.fetchone()
+            if live != partitioned:
+                raise PartitioningError(f"{TABLE} has {live} rows but {PARTITIONED_TABLE} has {partitioned}.")
+        cursor.execute(f"SELECT setval('{SEQUENCE}', coalesce(max(id), 0) + 1, false) FROM {TABLE}")
+        # Check the deferred foreign keys of the rows copied now: tables with
+        # pending trigger events cannot be altered
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        if capture:
+            cursor.execute(f"DROP TRIGGER {CAPTURE_TRIGGER} ON {TABLE}")
+            cursor.execute(f"DROP FUNCTION {CAPTURE_TRIGGER}()")
+            cursor.execute(f"DROP TABLE {CHANGES_TABLE}")
+
+        # Retire the old table: its foreign keys would block deleting users and
+        # books, and its names are handed over to the partitioned table
+        indexes = [name for name, _ in get_indexes(cursor, TABLE)]
+        (primary_key, _), = get_constraints(cursor, TABLE, "p")
+        foreign_keys = [name for name, _ in get_constraints(cursor, TABLE, "f")]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        old_sequence = cursor.fetchone()[0]
+        for name in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} DROP CONSTRAINT {name}")
+        for name in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {retired_name(name)}")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {primary_key} TO {retired_name(primary_key)}")
+        if old_sequence:
+            cursor.execute(f"ALTER SEQUENCE {old_sequence} RENAME TO {UNPARTITIONED_TABLE}_id_seq")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED_TABLE}")
+
+        cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {TABLE}")
+        for name in indexes:
+            cursor.execute(f"ALTER INDEX {temporary_name(name)} RENAME TO {name}")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {temporary_name(TABLE + '_pkey')} TO {primary_key}")
+        for name in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {temporary_name(name)} TO {name}")
+        cursor.execute(f"ALTER SEQUENCE {SEQUENCE} RENAME TO {TABLE}_id_seq")
+        cursor.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
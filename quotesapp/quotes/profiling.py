@@ -0,0 +1,258 @@
+"""
+On-demand profiling of single requests, for staff.
+
+A staff user gets a token from `manage.py profile_token <username>` and sends
+it in the X-Profile header or the _profile query parameter. That request then
+runs with a sampler thread recording the Python stack of the request thread
+every PROFILING_INTERVAL seconds, and with every SQL query timed. The result is
+saved in PROFILING_DIR as a speedscope (https://www.speedscope.app) file with
+two profiles: the sampled stacks, as a flamegraph, and the queries on a
+timeline. Staff list and download the files at /profiles/.
+
+Without PROFILING_DIR the middleware removes itself, so other requests don't
+pay anything; with it, requests without a token only pay for the token lookup.
+"""
+
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.utils import timezone
+
+from quotes.streaming import finish_after_streaming, stream_then_finish
+
+TOKEN_SALT = "quotes.profiling"
+TOKEN_HEADER = "X-Profile"
+TOKEN_PARAMETER = "_profile"
+PROFILE_NAME = re.compile(r"[\w.-]+\.speedscope\.json")
+# Characters of each query kept as its frame name
+SQL_NAME_LENGTH = 200
+
+
+def make_token(user) -> str:
+    """A token that lets the staff user profile their requests for PROFILING_TOKEN_MAX_AGE."""
+    return signing.dumps(user.pk, salt=TOKEN_SALT)
+
+
+def token_user_id(token: str) -> int|None:
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+class StackSampler:
+    """
+    Records the stack of a thread every interval seconds, from a daemon thread,
+    down to (and excluding) the innermost frame running one of the root code
+    objects. Stacks without such a frame are not recorded.
+    """
+    def __init__(self, thread_id: int, roots: set, interval: float):
+        self.thread_id = thread_id
+        self.roots = roots
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code not in self.roots:
+                code = frame.f_code
+                stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            # No root frame: the thread is between the view and the streamed content
+            if stack and frame is not None:
+                stack.reverse()
+                self.samples.append((time.perf_counter(), stack))
+
+
+class Speedscope:
+    """Builds a speedscope file: frames are shared by all its profiles."""
+    def __init__(self, name: str):
+        self.name = name
+        self.frames = []
+        self.frame_index = {}
+        self.profiles = []
+
+    def frame(self, name: str, file: str|None = None, line: int|None = None) -> int:
+        key = (name, file, line)
+        if key not in self.frame_index:
+            self.frame_index[key] = len(self.frames)
+            self.frames.append({"name": name, "file": file, "line": line} if file else {"name": name})
+        return self.frame_index[key]
+
+    def add_sampled(self, name: str, start: float, end: float, samples: list[tuple[float, list]]) -> None:
+        # Each sample stands for the time since the previous one
+        stacks, weights = [], []
+        previous = start
+        for at, stack in samples:
+            stacks.append([self.frame(*frame) for frame in stack])
+            weights.append(at - previous)
+            previous = at
+        self.profiles.append({
+            "type": "sampled", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": end - start, "samples": stacks, "weights": weights,
+        })
+
+    def add_evented(self, name: str, start: float, end: float, spans: list[tuple[str, float, float]]) -> None:
+        events = []
+        for span_name, span_start, span_end in spans:
+            frame = self.frame(span_name)
+            events.append({"type": "O", "frame": frame, "at": span_start - start})
+            events.append({"type": "C", "frame": frame, "at": span_end - start})
+        self.profiles.append({
+            "type": "evented", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": end - start, "events": events,
+        })
+
+    def to_json(self) -> dict:
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "quotesapp",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": self.profiles,
+        }
+
+
+def save_profile(profile: dict, name: str) -> str:
+    """
+    Write the profile to PROFILING_DIR, keeping the newest PROFILING_KEEP.
+    Returns the file name.
+    """
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{name}.speedscope.json"
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(profile, f)
+    os.replace(temporary, os.path.join(directory, filename))
+    for old in list_profiles()[settings.PROFILING_KEEP:]:
+        try:
+            os.unlink(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+    return filename
+
+
+def list_profiles() -> list[str]:
+    """Saved profiles, newest first."""
+    try:
+        names = [name for name in os.listdir(settings.PROFILING_DIR) if PROFILE_NAME.fullmatch(name)]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests of staff users that carry a valid profiling token. Must
+    come after the authentication middleware. Streaming responses are profiled
+    until their content has been sent.
+    """
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.headers.get(TOKEN_HEADER) or request.GET.get(TOKEN_PARAMETER)
+        if not token or not self.allowed(request, token):
+            return self.get_response(request)
+
+        queries = []
+
+        def time_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                alias = context["connection"].alias
+                queries.append((f"[{alias}] {sql[:SQL_NAME_LENGTH]}", start, time.perf_counter()))
+
+        # Streamed content is rendered from stream_then_finish, after this returned
+        roots = {sys._getframe().f_code, stream_then_finish.__code__}
+        sampler = StackSampler(threading.get_ident(), roots, settings.PROFILING_INTERVAL)
+        start = time.perf_counter()
+        sampler.start()
+        wrappers = ExitStack()
+        try:
+            # Reads may go to a replica
+            for database in connections.all():
+                wrappers.enter_context(database.execute_wrapper(time_query))
+            response = self.get_response(request)
+        except BaseException:
+            wrappers.close()
+            sampler.stop()
+            raise
+
+        match = getattr(request, "resolver_match", None)
+        view = re.sub(r"[^\w.-]", "_", match.view_name) if match else "unmatched"
+        name = f"{timezone.now():%Y%m%dT%H%M%S}-{request.user.pk}-{view}-{uuid.uuid4().hex[:8]}"
+        # The headers may go out before the profile is complete
+        response[TOKEN_HEADER] = f"{name}.speedscope.json"
+
+        def finish():
+            wrappers.close()
+            sampler.stop()
+            end = time.perf_counter()
+            title = f"{request.method} {request.path}"
+            profile = Speedscope(f"{title} ({response.status_code}, {len(queries)} queries)")
+            profile.add_sampled(f"{title} Python", start, end, sampler.samples)
+            profile.add_evented(f"{title} SQL", start, end, queries)
+            save_profile(profile.to_json(), name)
+
+        if response.streaming:
+            finish_after_streaming(response, finish)
+        else:
+            finish()
+        return response
+
+    def allowed(self, request, token: str) -> bool:
+        user = request.user
+        return user.is_authenticated and user.is_staff and token_user_id(token) == user.pk
+
+
+@staff_member_required
+def profiles_view(request):
+    """List the saved request profiles."""
+    return render(request, "quotes/profiles.html", {"profiles": list_profiles()})
+
+
+@staff_member_required
+def profile_view(request, name: str):
+    """Download a saved request profile, to open in speedscope."""
+    if not settings.PROFILING_DIR or not PROFILE_NAME.fullmatch(name):
+        raise Http404("No such profile")
+    try:
+        return FileResponse(
+            open(os.path.join(settings.PROFILING_DIR, name), "rb"),
+            as_attachment=True,
+            content_type="application/json",
+        )
+    except FileNotFoundError:
+        raise Http404("No such profile")
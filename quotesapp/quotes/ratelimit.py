@@ -0,0 +1,303 @@
+"""
+Adaptive token-bucket rate limiting for the digest pipeline.
+
+Buckets live in Redis so that every Celery worker draws from the same budget.
+Without Redis configured each process uses an in-memory bucket; while the
+configured Redis is unreachable each process falls back to one, retrying Redis
+every redis_retry_interval seconds. The rate adapts to what callers observe:
+it is cut when errors or slow calls show up and grows back slowly while things
+are healthy (additive increase, multiplicative decrease). The rate, the tokens
+left and the tokens acquired are exported as Prometheus metrics.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from quotes.metrics import RATE_LIMIT_ACQUIRED, RATE_LIMIT_RATE, RATE_LIMIT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Refill the bucket using the Redis clock, then take `n` tokens if available.
+# Returns the number of seconds to wait before retrying (0 when acquired), the
+# tokens left and the rate, as strings so Redis does not truncate them.
+TAKE_SCRIPT = """
+local default_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local n = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local rate = tonumber(data[3]) or default_rate
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= n then
+    tokens = tokens - n
+    redis.call('HINCRBYFLOAT', KEYS[1], 'acquired', n)
+else
+    wait = (n - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 86400)
+return {tostring(wait), tostring(tokens), tostring(rate)}
+"""
+
+
+class MemoryBucket:
+    """Token bucket local to this process."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.acquired = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, n: float) -> tuple[float, float, float]:
+        """Returns the seconds to wait (0 when acquired), the tokens left and the rate."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= n:
+                self.tokens -= n
+                self.acquired += n
+                return 0.0, self.tokens, self.rate
+            return (n - self.tokens) / self.rate, self.tokens, self.rate
+
+    def get_rate(self) -> float:
+        return self.rate
+
+    def set_rate(self, rate: float) -> None:
+        with self.lock:
+            self.rate = rate
+
+    def state(self) -> dict:
+        return {"backend": "memory", "rate": self.rate, "tokens": self.tokens, "acquired": self.acquired}
+
+
+class RedisBucket:
+    """Token bucket shared by every process through a Redis hash."""
+
+    def __init__(self, client: redis.Redis, key: str, rate: float, burst: float):
+        self.client = client
+        self.key = key
+        self.default_rate = rate
+        self.burst = burst
+        self.script = client.register_script(TAKE_SCRIPT)
+
+    def take(self, n: float) -> tuple[float, float, float]:
+        wait, tokens, rate = self.script(keys=[self.key], args=[self.default_rate, self.burst, n])
+        return float(wait), float(tokens), float(rate)
+
+    def get_rate(self) -> float:
+        rate = self.client.hget(self.key, "rate")
+        return float(rate) if rate is not None else self.default_rate
+
+    def set_rate(self, rate: float) -> None:
+        self.client.hset(self.key, "rate", rate)
+
+    def state(self) -> dict:
+        data = self.client.hgetall(self.key)
+        return {
+            "backend": "redis",
+            "rate": float(data.get(b"rate", self.default_rate)),
+            "tokens": float(data.get(b"tokens", self.burst)),
+            "acquired": float(data.get(b"acquired", 0)),
+        }
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float|None = None,
+        min_rate: float|None = None,
+        max_rate: float|None = None,
+        latency_target: float = 1.0,
+        error_threshold: float = 0.05,
+        adjust_interval: float = 5.0,
+        redis_url: str|None = None,
+        redis_retry_interval: float = 5.0,
+    ):
+        self.name = name
+        self.burst = burst or rate
+        self.min_rate = min_rate or rate / 10
+        self.max_rate = max_rate or rate * 4
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.adjust_interval = adjust_interval
+        self.redis_retry_interval = redis_retry_interval
+        self.rate = rate
+        # The in-memory bucket used while Redis is unreachable, until fallback_until
+        self.fallback: MemoryBucket|None = None
+        self.fallback_until = 0.0
+        self.bucket = self._make_bucket(redis_url, rate)
+        self._lock = threading.Lock()
+        self._reset_window()
+
+    def _make_bucket(self, redis_url: str|None, rate: float):
+        if not redis_url:
+            return MemoryBucket(rate, self.burst)
+        client = redis.Redis.from_url(redis_url, socket_connect_timeout=0.5, socket_timeout=0.5)
+        bucket = RedisBucket(client, f"ratelimit:{self.name}", rate, self.burst)
+        try:
+            client.ping()
+        except redis.RedisError:
+            self._fall_back()
+        return bucket
+
+    def _fall_back(self) -> None:
+        """Use an in-memory bucket, at the last rate seen, until the next Redis retry."""
+        logger.warning(
+            "Rate limiter falling back to memory",
+            extra={"limiter": self.name, "retry_in": self.redis_retry_interval},
+        )
+        if self.fallback is None:
+            self.fallback = MemoryBucket(self.rate, self.burst)
+        else:
+            self.fallback.set_rate(self.rate)
+        self.fallback_until = time.monotonic() + self.redis_retry_interval
+
+    def active_bucket(self):
+        """The shared bucket, or the in-memory one while Redis is being waited out."""
+        if self.fallback is not None and time.monotonic() < self.fallback_until:
+            return self.fallback
+        return self.bucket
+
+    def _take(self, n: float) -> float:
+        bucket = self.active_bucket()
+        try:
+            wait, tokens, rate = bucket.take(n)
+        except redis.RedisError:
+            self._fall_back()
+            wait, tokens, rate = self.fallback.take(n)
+        self.rate = rate
+        RATE_LIMIT_RATE.labels(self.name).set(rate)
+        RATE_LIMIT_TOKENS.labels(self.name).set(tokens)
+        if not wait:
+            RATE_LIMIT_ACQUIRED.labels(self.name).inc(n)
+        return wait
+
+    def acquire(self, n: float = 1) -> float:
+        """
+        Block until `n` tokens are available. Larger requests than the burst are
+        taken in burst-sized chunks. Returns the total time spent waiting.
+        """
+        waited = 0.0
+        while n > 0:
+            chunk = min(n, self.burst)
+            while (wait := self._take(chunk)) > 0:
+                time.sleep(wait)
+                waited += wait
+            n -= chunk
+        return waited
+
+    async def acquire_async(self, n: float = 1) -> float:
+        """Same as acquire, without blocking the event loop."""
+        waited = 0.0
+        while n > 0:
+            chunk = min(n, self.burst)
+            while (wait := self._take(chunk)) > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+            n -= chunk
+        return waited
+
+    @contextmanager
+    def throttle(self, n: float = 1, calls: int|None = None):
+        """
+        Acquire `n` tokens, run the block and record its outcome and latency.
+        The block is taken to make `calls` rate-limited calls (`n` by default),
+        so its latency is compared with latency_target per call: wrap single
+        calls, not whole batches of work.
+        """
+        calls = max(calls if calls is not None else n, 1)
+        self.acquire(n)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(False, time.perf_counter() - start, calls)
+            raise
+        self.record(True, time.perf_counter() - start, calls)
+
+    def _reset_window(self) -> None:
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+        self._window_errors = 0
+        self._window_latency = 0.0
+
+    def record(self, ok: bool, latency: float, calls: int = 1) -> None:
+        """
+        Report the outcome of `calls` rate-limited operations that took `latency`
+        seconds in total. Once per adjust_interval the shared rate is cut by 30%
+        if the error rate or the average latency is over target, and raised by 5%
+        of max_rate otherwise.
+        """
+        with self._lock:
+            self._window_calls += calls
+            self._window_errors += 0 if ok else calls
+            self._window_latency += latency
+            if time.monotonic() - self._window_start < self.adjust_interval:
+                return
+            error_rate = self._window_errors / self._window_calls
+            average_latency = self._window_latency / self._window_calls
+            self._reset_window()
+        bucket = self.active_bucket()
+        try:
+            rate = bucket.get_rate()
+            if error_rate > self.error_threshold or average_latency > self.latency_target:
+                new_rate = max(self.min_rate, rate * 0.7)
+            else:
+                new_rate = min(self.max_rate, rate + self.max_rate * 0.05)
+            if new_rate != rate:
+                bucket.set_rate(new_rate)
+                self.rate = new_rate
+                RATE_LIMIT_RATE.labels(self.name).set(new_rate)
+                logger.info(
+                    "Rate limit adjusted",
+                    extra={
+                        "limiter": self.name,
+                        "rate": round(new_rate, 2),
+                        "error_rate": round(error_rate, 3),
+                        "average_latency": round(average_latency, 3),
+                    },
+                )
+        except redis.RedisError:
+            logger.warning("Rate limiter could not adjust its rate", extra={"limiter": self.name})
+            self._fall_back()
+
+    def snapshot(self) -> dict:
+        """Current rate, available tokens and total tokens acquired."""
+        try:
+            return {"name": self.name, **self.active_bucket().state()}
+        except redis.RedisError:
+            return {"name": self.name, "backend": "unavailable"}
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """
+    The process-wide limiter configured under DIGEST_RATE_LIMITS[name].
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(
+                name,
+                redis_url=settings.RATE_LIMIT_REDIS_URL,
+                **settings.DIGEST_RATE_LIMITS[name],
+            )
+        return _limiters[name]
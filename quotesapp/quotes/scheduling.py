@@ -0,0 +1,102 @@
+"""
+Digest send slots.
+
+The day is split into slots of DIGEST_SLOT_MINUTES. Every user is assigned the
+UTC slot in which their local DIGEST_SEND_TIME falls, shifted by up to
+DIGEST_SPREAD_MINUTES based on their id so that users in the same timezone don't
+all land in the same slot. The beat scheduler then only has to enqueue the
+users of the current slot, found through the indexed User.send_slot column.
+
+A digest is dated in the user's timezone: the send ledger, the prepared digests
+and the recently sent quotes use the local date at the start of the user's slot,
+which is the previous UTC date for the morning digests of users east of UTC.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast, Mod
+from django.utils import timezone
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def slots_per_day() -> int:
+    return MINUTES_PER_DAY // settings.DIGEST_SLOT_MINUTES
+
+
+def send_time_utc_minutes(tz_name: str, now: datetime|None = None) -> int:
+    """
+    Minute of the UTC day at which DIGEST_SEND_TIME happens today in the given timezone.
+    Uses today's UTC offset, so the result moves with daylight saving time.
+    """
+    tz = ZoneInfo(tz_name)
+    now = now or timezone.now()
+    local_date = now.astimezone(tz).date()
+    send_time = time.fromisoformat(settings.DIGEST_SEND_TIME)
+    send_at = datetime.combine(local_date, send_time, tzinfo=tz).astimezone(dt_timezone.utc)
+    return send_at.hour * 60 + send_at.minute
+
+
+def compute_send_slot(user_id: int, tz_name: str, now: datetime|None = None) -> int:
+    minutes = send_time_utc_minutes(tz_name, now) + user_id % settings.DIGEST_SPREAD_MINUTES
+    return (minutes % MINUTES_PER_DAY) // settings.DIGEST_SLOT_MINUTES
+
+
+def current_send_slot(now: datetime|None = None) -> int:
+    now = (now or timezone.now()).astimezone(dt_timezone.utc)
+    return (now.hour * 60 + now.minute) // settings.DIGEST_SLOT_MINUTES
+
+
+def slot_start(slot: int, now: datetime|None = None) -> datetime:
+    """Start of the given send slot in the current UTC day."""
+    now = (now or timezone.now()).astimezone(dt_timezone.utc)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + timedelta(minutes=slot * settings.DIGEST_SLOT_MINUTES)
+
+
+def digest_date(tz_name: str, slot: int, now: datetime|None = None) -> date:
+    """Local date of the digest sent in the slot of the current UTC day."""
+    return slot_start(slot, now).astimezone(ZoneInfo(tz_name)).date()
+
+
+def next_digest_date(tz_name: str, slot: int, now: datetime|None = None) -> date:
+    """
+    Local date of the next digest sent in the slot: today's (UTC), or
+    tomorrow's if the slot has already started.
+    """
+    now = now or timezone.now()
+    send_at = slot_start(slot, now)
+    if send_at <= now:
+        send_at += timedelta(days=1)
+    return send_at.astimezone(ZoneInfo(tz_name)).date()
+
+
+def refresh_send_slots(user_model, now: datetime|None = None) -> int:
+    """
+    Recompute the send slot of every user, e.g. after a daylight saving change.
+    Runs one UPDATE per distinct timezone and only writes rows whose slot changed.
+    Returns the number of users updated.
+    """
+    updated = 0
+    for tz_name in user_model.objects.values_list("timezone", flat=True).distinct():
+        base_minutes = send_time_utc_minutes(tz_name, now)
+        # MOD returns a float or a numeric on some backends: cast before dividing,
+        # so the division truncates like compute_send_slot instead of rounding
+        minutes = Cast(
+            Mod(
+                Value(base_minutes) + Mod(F("id"), Value(settings.DIGEST_SPREAD_MINUTES)),
+                Value(MINUTES_PER_DAY),
+            ),
+            output_field=IntegerField(),
+        )
+        slot = minutes / Value(settings.DIGEST_SLOT_MINUTES)
+        updated += (
+            user_model.objects
+            .filter(timezone=tz_name)
+            .exclude(send_slot=slot)
+            .update(send_slot=slot)
+        )
+    return updated
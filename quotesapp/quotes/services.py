@@ -1,13 +1,36 @@
-from quotes.models import Quote, Book, User
-from django.db import transaction, DataError, IntegrityError, DatabaseError
+from quotes.models import Quote, Book, User, DigestRun, DigestDelivery, PreparedDigest, UserQuoteStats, RecentDigestQuotes, QuoteViewCount, OutboxEvent
+from django.db import connection, transaction, DataError, IntegrityError, DatabaseError, DEFAULT_DB_ALIAS
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
+from django.core.mail import send_mail, EmailMessage, get_connection
 from django.conf import settings
 from django.utils import timezone
+from django.db.models import Q, Exists, OuterRef, F, Window, Max, Count
+from django.db.models.functions import Random, RowNumber
+from django.template.loader import render_to_string
+from quotes.ratelimit import get_rate_limiter
+from quotes.metrics import QUOTES_CREATED, QUOTE_CONFLICTS, record_cache
+from quotes.db_router import use_replica
+from quotes.scheduling import current_send_slot
+from quotes.stats import apply_user_quote_stats_changes, compute_user_quote_stats, refresh_user_quote_stats, stats_month
+from quotes import outbox, similarity
+from quotes.book_catalogue import BookCatalogue, get_book_catalogue
+from quotes.view_counts import ViewCounter, get_view_counter
+from collections import defaultdict
+from itertools import groupby
+from functools import reduce
+import operator
+import os
+import datetime
 import logging
+from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
 
+# Number of users whose ledger entries are checked and claimed per round trip
+DIGEST_CLAIM_BLOCK_SIZE = 1000
+# Number of quotes in each daily digest
+DIGEST_QUOTE_COUNT = 3
+
 class QuoteCreationResult:
     def __init__(self, quote: Quote, status: str, existing_quote_id: int|None, error_message: str|None):
         self.quote = quote
@@ -76,6 +99,7 @@ def create_quote(quote_text: str, book: Book|None, title: str|None, author: str|
             user=user,
         ).first()
         if existing_quote:
+            QUOTE_CONFLICTS.labels("create").inc()
             return QuoteCreationResult(existing_quote, "quote_exists", existing_quote.id, None)
         else:
             quote = Quote(
@@ -85,28 +109,817 @@ def create_quote(quote_text: str, book: Book|None, title: str|None, author: str|
                     page_number=page_number
                 )
             quote.save()
+            outbox.record_events(OutboxEvent.QUOTE_CREATED, user.id, [quote.id], [quote_stats_payload(quote)])
+            QUOTES_CREATED.inc()
             return QuoteCreationResult(quote, "success", None, None)
 
-def find_quotes_and_send_email(user_id: int) -> None:
+def create_quotes(items: list[dict], user: User) -> list[QuoteCreationResult]:
+    """
+    Create many quotes for a user in a constant number of queries.
+    Each item is a dict with the same inputs as create_quote, except that the book
+    is given as "book_id". Every item is validated like create_quote and one result
+    is returned per item, in input order.
+    """
+    results: list[QuoteCreationResult|None] = [None] * len(items)
+
+    book_ids = {item.get("book_id") for item in items if item.get("book_id")}
+    books_by_id = get_books(book_ids)
+
+    valid = []
+    for index, item in enumerate(items):
+        book_id = item.get("book_id")
+        book = books_by_id.get(book_id) if book_id else None
+        if book_id and book is None:
+            results[index] = QuoteCreationResult(None, "form_error", None, "Selected book does not exist.")
+            continue
+        try:
+            validate_quote_creation_input(item.get("quote"), book, item.get("title"), item.get("author"), item.get("page_number"))
+        except ValueError as e:
+            results[index] = QuoteCreationResult(None, "form_error", None, str(e))
+            continue
+        valid.append((index, item, book))
+
+    if not valid:
+        return results
+
+    with transaction.atomic():
+        # The books given by id may come from the catalogue snapshot, which still
+        # has the books deleted since it was built
+        given_book_ids = {book.id for _, _, book in valid if book is not None}
+        if given_book_ids:
+            live_book_ids = set(Book.objects.filter(id__in=given_book_ids).values_list("id", flat=True))
+            for index, item, book in valid:
+                if book is not None and book.id not in live_book_ids:
+                    results[index] = QuoteCreationResult(None, "form_error", None, "Selected book does not exist.")
+            valid = [(index, item, book) for index, item, book in valid if book is None or book.id in live_book_ids]
+
+        # Resolve the books that were given by title and author: insert the missing
+        # ones and read them all back in a single query.
+        new_book_keys = {(item["title"], item["author"]) for _, item, book in valid if book is None}
+        books_by_key = {}
+        if new_book_keys:
+            Book.objects.bulk_create(
+                [Book(title=title, author=author) for title, author in new_book_keys],
+                ignore_conflicts=True,
+            )
+            book_filter = reduce(operator.or_, (Q(title=title, author=author) for title, author in new_book_keys))
+            books_by_key = {(book.title, book.author): book for book in Book.objects.filter(book_filter)}
+
+        resolved = [
+            (index, item, book or books_by_key[(item["title"], item["author"])])
+            for index, item, book in valid
+        ]
+
+        existing = Quote.objects.filter(
+            user=user,
+            book_id__in={book.id for _, _, book in resolved},
+            quote__in={item["quote"] for _, item, _ in resolved},
+        )
+        existing_by_key = {(quote.quote, quote.book_id): quote for quote in existing}
+
+        to_create = {}
+        for index, item, book in resolved:
+            key = (item["quote"], book.id)
+            if key in existing_by_key or key in to_create:
+                continue
+            to_create[key] = Quote(
+                quote=item["quote"],
+                book=book,
+                user=user,
+                page_number=item.get("page_number"),
+            )
+        Quote.objects.bulk_create(to_create.values())
+        if to_create:
+            outbox.record_events(
+                OutboxEvent.QUOTE_CREATED,
+                user.id,
+                [quote.id for quote in to_create.values()],
+                [quote_stats_payload(quote) for quote in to_create.values()],
+            )
+
+        # Items that duplicate an earlier item in the same batch point at the quote
+        # that item created.
+        created_keys = set()
+        for index, item, book in resolved:
+            key = (item["quote"], book.id)
+            if key in existing_by_key:
+                existing_quote = existing_by_key[key]
+                results[index] = QuoteCreationResult(existing_quote, "quote_exists", existing_quote.id, None)
+            elif key not in created_keys:
+                created_keys.add(key)
+                results[index] = QuoteCreationResult(to_create[key], "success", None, None)
+            else:
+                quote = to_create[key]
+                results[index] = QuoteCreationResult(quote, "quote_exists", quote.id, None)
+    QUOTES_CREATED.inc(len(to_create))
+    QUOTE_CONFLICTS.labels("create").inc(len(resolved) - len(to_create))
+    return results
+
+class DigestSendError(Exception):
+    """
+    Raised when some digests of a block could not be sent; carries the outcome
+    counts and the ids of the users to retry.
+    """
+    def __init__(self, counts: dict[str, int], user_ids: list[int]):
+        super().__init__(f"Failed to send {counts['failed']} digests")
+        self.counts = counts
+        self.user_ids = user_ids
+
+    def __reduce__(self):
+        return type(self), (self.counts, self.user_ids)
+
+class QuoteRestoreResult:
+    def __init__(self, restored: int, conflict_ids: list[int]):
+        self.restored = restored
+        self.conflict_ids = conflict_ids
+
+def soft_delete_quotes(user: User, quote_ids: list[int]) -> int:
+    """
+    Soft delete the given quotes belonging to the user with a single UPDATE.
+    Quotes that are already deleted or belong to another user are left untouched.
+    The UPDATE returns the rows it changed, so when two requests delete the same
+    quote only the one that deleted it records the event. Returns the number of
+    quotes deleted.
+    """
+    quote_ids = sorted(set(quote_ids))
+    rows = []
+    if quote_ids:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                soft_delete_quotes_sql(len(quote_ids)),
+                [connection.ops.adapt_datetimefield_value(timezone.now()), user.id, *quote_ids],
+            )
+            rows = cursor.fetchall()
+            if rows:
+                created_at = Quote._meta.get_field("created_at").cached_col
+                converters = connection.ops.get_db_converters(created_at)
+                payloads = []
+                for _, book_id, author, created in rows:
+                    # SQLite returns the column as text, Postgres as a datetime
+                    for converter in converters:
+                        created = converter(created, created_at, connection)
+                    payloads.append(quote_stats_payload_from(book_id, author, created))
+                outbox.record_events(
+                    OutboxEvent.QUOTE_DELETED,
+                    user.id,
+                    [quote_id for quote_id, *_ in rows],
+                    payloads,
+                )
+    logger.info(
+        "Quotes soft deleted",
+        extra={
+            "user_id": user.id,
+            "requested": len(quote_ids),
+            "deleted": len(rows),
+        }
+    )
+    return len(rows)
+
+def soft_delete_quotes_sql(ids: int) -> str:
+    # The author is read with a subquery rather than UPDATE ... FROM because
+    # SQLite only lets RETURNING see the table being updated
+    table = Quote._meta.db_table
+    placeholders = ", ".join(["%s"] * ids)
+    return f"""
+        UPDATE {table} SET deleted_at = %s
+        WHERE user_id = %s AND id IN ({placeholders}) AND deleted_at IS NULL
+        RETURNING id, book_id,
+            (SELECT author FROM {Book._meta.db_table} AS book WHERE book.id = {table}.book_id),
+            created_at
+    """
+
+def restore_quotes(user: User, quote_ids: list[int]) -> QuoteRestoreResult:
+    """
+    Restore soft deleted quotes belonging to the user.
+    A quote cannot be restored if the same quote already exists (not deleted) for
+    the same book, or if an earlier quote in the same request restores that quote.
+    Conflicts are found with one query and everything else is restored with a
+    single UPDATE. Returns the number restored and the ids that conflicted.
+    """
+    with transaction.atomic():
+        live_duplicate = Quote.objects.filter(
+            user=user,
+            quote=OuterRef("quote"),
+            book=OuterRef("book"),
+        )
+        candidates = (
+            Quote.all_objects
+            .filter(user=user, id__in=quote_ids, deleted_at__isnull=False)
+            .annotate(has_live_duplicate=Exists(live_duplicate))
+            .order_by("-deleted_at", "-id")
+            .values_list("id", "quote", "book_id", "has_live_duplicate", "book__author", "created_at")
+        )
+
+        restorable = []
+        payloads = []
+        conflict_ids = []
+        restoring_keys = set()
+        for quote_id, quote_text, book_id, has_live_duplicate, author, created_at in candidates:
+            key = (quote_text, book_id)
+            if has_live_duplicate or key in restoring_keys:
+                conflict_ids.append(quote_id)
+            else:
+                restoring_keys.add(key)
+                restorable.append(quote_id)
+                payloads.append(quote_stats_payload_from(book_id, author, created_at))
+
+        restored = 0
+        if restorable:
+            restored = Quote.all_objects.filter(id__in=restorable).update(deleted_at=None)
+            outbox.record_events(OutboxEvent.QUOTE_RESTORED, user.id, restorable, payloads)
+    QUOTE_CONFLICTS.labels("restore").inc(len(conflict_ids))
+
+    logger.info(
+        "Quotes restored",
+        extra={
+            "user_id": user.id,
+            "requested": len(quote_ids),
+            "restored": restored,
+            "conflicts": len(conflict_ids),
+        }
+    )
+    return QuoteRestoreResult(restored, sorted(conflict_ids))
+
+def record_quote_update(quote: Quote, changed_fields: list[str], previous_book_id: int|None = None) -> None:
+    """
+    Write the outbox event of a quote edit; call it in the edit's transaction.
+    A quote moved from previous_book_id to another book carries both books, so
+    the stats can move it.
+    """
+    payload = {"fields": sorted(changed_fields)}
+    if previous_book_id is not None and previous_book_id != quote.book_id:
+        previous_author = Book.objects.filter(id=previous_book_id).values_list("author", flat=True).first()
+        payload.update(quote_stats_payload(quote))
+        payload.update({"previous_book_id": previous_book_id, "previous_author": previous_author})
+    outbox.record_events(OutboxEvent.QUOTE_UPDATED, quote.user_id, [quote.id], [payload])
+
+def quote_stats_payload_from(book_id: int, author: str, created_at: datetime.datetime) -> dict:
+    """What the stats consumer needs to count a quote in or out, for its outbox event."""
+    return {"book_id": book_id, "author": author, "month": stats_month(created_at)}
+
+def quote_stats_payload(quote: Quote) -> dict:
+    return quote_stats_payload_from(quote.book_id, quote.book.author, quote.created_at)
+
+def quote_stats_changes(event: OutboxEvent) -> list[tuple[int, int, str, str, int]]|None:
+    """
+    The stats changes of an event, from its payload, or None for events written
+    without the stats fields.
+    """
+    payload = event.payload
+    if event.topic == OutboxEvent.QUOTE_UPDATED:
+        if "previous_book_id" not in payload:
+            return []
+        return [
+            (event.user_id, payload["previous_book_id"], payload["previous_author"], payload["month"], -1),
+            (event.user_id, payload["book_id"], payload["author"], payload["month"], 1),
+        ]
+    if "book_id" not in payload:
+        return None
+    count = -1 if event.topic == OutboxEvent.QUOTE_DELETED else 1
+    return [(event.user_id, payload["book_id"], payload["author"], payload["month"], count)]
+
+def get_user_quote_stats(user: User) -> UserQuoteStats:
+    """
+    The user's quote stats: a single row read, computed on the spot the first time.
+    """
+    stats = UserQuoteStats.objects.filter(user=user).first()
+    if stats is None:
+        # Only stored when none of the user's changes wait in the outbox, which
+        # would then be counted twice
+        refresh_user_quote_stats(UserQuoteStats, Quote, [user.id], outbox.pending_events())
+        stats = UserQuoteStats.objects.filter(user=user).first()
+    if stats is None:
+        stats = UserQuoteStats(user=user, **compute_user_quote_stats(Quote, [user.id])[user.id])
+    return stats
+
+def sync_similarity_indexes(events: list[OutboxEvent]) -> None:
+    """
+    Outbox handler: bring the similar quotes index of every user in the events
+    up to date with the current state of the quotes the events name. A user
+    without an index gets one built from all their quotes.
+    """
+    if not similarity.enabled():
+        return
+    quote_ids_by_user = defaultdict(set)
+    for event in events:
+        quote_ids_by_user[event.user_id].add(event.object_id)
+    for user_id, quote_ids in quote_ids_by_user.items():
+        # Read under the lock so a consumer holding older state can't write after us
+        with similarity.locked(user_id):
+            path = similarity.index_path(user_id)
+            index = similarity.SimilarityIndex.load(path)
+            if index is None:
+                index = similarity.SimilarityIndex.from_quotes(
+                    Quote.objects.filter(user_id=user_id).values_list("id", "quote")
+                )
+            else:
+                live = list(Quote.objects.filter(user_id=user_id, id__in=quote_ids).values_list("id", "quote"))
+                index = index.updated(live, quote_ids - {quote_id for quote_id, _ in live})
+            index.save(path)
+
+def sync_user_quote_stats(events: list[OutboxEvent]) -> None:
+    """
+    Outbox handler: fold the stats changes carried by the events into the users'
+    stats, in bulk. Applying a change twice would count it twice, so the users
+    with replayed events, or events written without the stats fields, are
+    recomputed from their quotes instead.
     """
-    Pick three random quotes from the user's quotes and send an email to the user.
+    recompute = set()
+    changes_by_event = []
+    for event in events:
+        changes = None if event.replayed else quote_stats_changes(event)
+        if changes is None:
+            recompute.add(event.user_id)
+        else:
+            changes_by_event.append((event.user_id, changes))
+    apply_user_quote_stats_changes(UserQuoteStats, [
+        change
+        for user_id, changes in changes_by_event if user_id not in recompute
+        for change in changes
+    ])
+    if recompute:
+        pending = outbox.pending_events().exclude(id__in=[event.id for event in events])
+        refresh_user_quote_stats(UserQuoteStats, Quote, sorted(recompute), pending)
+
+# Consumers of the outbox, each handed every batch of events
+OUTBOX_HANDLERS = [sync_user_quote_stats, sync_similarity_indexes]
+
+def process_outbox() -> int:
+    """
+    Run the outbox handlers on the pending events, in batches, for up to
+    OUTBOX_DRAIN_SECONDS. Returns the number of events handled.
+    """
+    return outbox.drain(OUTBOX_HANDLERS, settings.OUTBOX_BATCH_SIZE, settings.OUTBOX_DRAIN_SECONDS)
+
+def rebuild_similarity_indexes(block_size: int = 500) -> int:
+    """
+    Rebuild the similar quotes index of every user with quotes (or a stale
+    index), reading the quotes of a block of users per query. An index updated
+    since its block was read is newer than the rebuild and is kept. Returns the
+    number of indexes written.
+    """
+    written = 0
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:block_size])
+        if not user_ids:
+            return written
+        last_id = user_ids[-1]
+        read_at = timezone.now().timestamp()
+        quotes = (
+            Quote.objects
+            .filter(user_id__in=user_ids)
+            .order_by("user_id", "id")
+            .values_list("user_id", "id", "quote")
+        )
+        quotes_by_user = {
+            user_id: [(quote_id, text) for _, quote_id, text in rows]
+            for user_id, rows in groupby(quotes.iterator(), key=lambda row: row[0])
+        }
+        for user_id in user_ids:
+            path = similarity.index_path(user_id)
+            if user_id not in quotes_by_user and not os.path.exists(path):
+                continue
+            index = similarity.SimilarityIndex.from_quotes(quotes_by_user.get(user_id, []))
+            with similarity.locked(user_id):
+                if os.path.exists(path) and os.path.getmtime(path) > read_at:
+                    continue
+                index.save(path)
+            written += 1
+
+def similar_quotes(user: User, quote: Quote, limit: int) -> list[Quote]:
+    """
+    The user's quotes most similar to the given one, best first, from the
+    similar quotes index. Quotes not indexed yet have none.
+    """
+    if not similarity.enabled():
+        return []
+    index = similarity.get_index(user.id)
+    if index is None:
+        return []
+    ids = [quote_id for quote_id, _ in index.similar([quote.id], limit)[quote.id]]
+    quotes = Quote.objects.filter(user=user).select_related("book").in_bulk(ids)
+    return [quotes[quote_id] for quote_id in ids if quote_id in quotes]
+
+def refresh_book_catalogue() -> bool:
+    """
+    Rebuild the book catalogue snapshot if books were added, changed or deleted
+    since it was built. Returns whether it was rebuilt.
+    """
+    summary = Book.objects.aggregate(updated=Max("updated_at"), count=Count("id"))
+    catalogue = get_book_catalogue()
+    if catalogue is not None and catalogue.version == (timestamp_us(summary["updated"]), summary["count"]):
+        return False
+    books = list(Book.objects.values_list("id", "title", "author", "updated_at").iterator())
+    BookCatalogue.write(
+        settings.BOOK_CATALOGUE_PATH,
+        [book[:3] for book in books],
+        max((timestamp_us(book[3]) for book in books), default=0),
+    )
+    logger.info("Book catalogue rebuilt", extra={"books": len(books)})
+    return True
+
+def timestamp_us(value: datetime.datetime|None) -> int:
+    return int(value.timestamp()) * 1_000_000 + value.microsecond if value else 0
+
+def get_books(book_ids) -> dict[int, Book]:
+    """
+    Books by id with their title and author, from the catalogue snapshot when
+    possible and from the database (one query) for the rest.
+    """
+    books = {}
+    catalogue = get_book_catalogue()
+    if catalogue is not None:
+        for book_id in book_ids:
+            row = catalogue.get(book_id)
+            if row is not None:
+                books[book_id] = Book.from_db(DEFAULT_DB_ALIAS, ["id", "title", "author"], row)
+    missing = [book_id for book_id in book_ids if book_id not in books]
+    if missing:
+        books.update(Book.objects.in_bulk(missing))
+    return books
+
+def attach_books(quotes: list[Quote]) -> None:
+    """Set the book of each quote from get_books instead of joining the books table."""
+    books = get_books({quote.book_id for quote in quotes})
+    for quote in quotes:
+        if quote.book_id in books:
+            quote.book = books[quote.book_id]
+
+def search_books(prefix: str, limit: int) -> list[tuple[int, str, str]]:
+    """(id, title, author) of the books whose title starts with prefix, ignoring case."""
+    catalogue = get_book_catalogue()
+    if catalogue is not None:
+        return catalogue.search(prefix, limit)
+    return list(
+        Book.objects.filter(title__istartswith=prefix).order_by("title").values_list("id", "title", "author")[:limit]
+    )
+
+def record_quote_view(quote_id: int) -> None:
+    """
+    Count a view of the quote in the view buffer. Nothing is written to the
+    database here: the buffer is flushed by a task or a background thread.
+    """
+    get_view_counter().add(quote_id)
+
+def flush_quote_views(counter: ViewCounter|None = None) -> int:
+    """
+    Add the buffered views to the view counts, one statement per batch of
+    quotes. Views of quotes that no longer exist are dropped. If the write fails
+    the views go back to the buffer. Returns the number of views written.
+    """
+    counter = counter or get_view_counter()
+    counts = counter.take()
+    if not counts:
+        return 0
+    # Same order in every flush so concurrent flushes lock rows in the same order
+    rows = sorted(counts.items())
+    batch_size = settings.VIEW_COUNTS_FLUSH_BATCH_SIZE
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    upsert_quote_views_sql(len(batch)),
+                    [value for row in batch for value in row],
+                )
+    except DatabaseError:
+        counter.put_back(counts)
+        raise
+    views = sum(counts.values())
+    logger.info("Quote views flushed", extra={"quotes": len(rows), "views": views})
+    return views
+
+def upsert_quote_views_sql(rows: int) -> str:
+    # The first views of a quote have no row to update, so insert and add to
+    # the existing count on conflict
+    table = QuoteViewCount._meta.db_table
+    values = ", ".join(["(%s, %s)"] * rows)
+    return f"""
+        WITH pending (quote_id, views) AS (VALUES {values})
+        INSERT INTO {table} (quote_id, user_id, views)
+        SELECT pending.quote_id, quote.user_id, pending.views
+        FROM pending JOIN {Quote._meta.db_table} AS quote ON quote.id = pending.quote_id
+        WHERE true
+        ON CONFLICT (quote_id) DO UPDATE SET views = {table}.views + excluded.views
+    """
+
+def most_viewed_quotes(user: User, limit: int) -> list[Quote]:
+    """
+    The user's live quotes with the most views (as of the last flush), most
+    viewed first, each with its view count in `views`.
+    """
+    counts = (
+        QuoteViewCount.objects
+        .filter(user=user, quote__deleted_at__isnull=True)
+        .select_related("quote")
+        .order_by("-views")[:limit]
+    )
+    quotes = []
+    for count in counts:
+        count.quote.views = count.views
+        quotes.append(count.quote)
+    return quotes
+
+def get_due_send_slots(now: datetime.datetime|None = None) -> list[int]:
+    """
+    Send slots of the UTC day, up to the current one, that no digest run has
+    handled yet. A beat tick that is missed or late leaves its slot to the next
+    tick instead of skipping its users.
+    """
+    now = (now or timezone.now()).astimezone(datetime.timezone.utc)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    handled = set(
+        DigestRun.objects
+        .filter(started_at__gte=midnight, send_slot__isnull=False)
+        .values_list("send_slot", flat=True)
+    )
+    return [slot for slot in range(current_send_slot(now) + 1) if slot not in handled]
+
+def claim_digest_deliveries(user_ids: list[int], run: DigestRun, date: datetime.date) -> list[int]:
+    """
+    Claim the day's digest for the given users in the send ledger.
+    Returns the ids claimed by this run; users already claimed for the date by an
+    earlier or concurrent run are left out. Each block of users costs one
+    membership check, one insert and one read back.
+    """
+    claimed = []
+    for start in range(0, len(user_ids), DIGEST_CLAIM_BLOCK_SIZE):
+        block = user_ids[start:start + DIGEST_CLAIM_BLOCK_SIZE]
+        already_claimed = set(
+            DigestDelivery.objects.filter(date=date, user_id__in=block).values_list("user_id", flat=True)
+        )
+        pending = [user_id for user_id in block if user_id not in already_claimed]
+        if not pending:
+            continue
+        # A concurrent run may claim some of these between the check and the insert;
+        # the unique constraint decides and reading back by run shows who won.
+        DigestDelivery.objects.bulk_create(
+            [DigestDelivery(user_id=user_id, date=date, run=run) for user_id in pending],
+            ignore_conflicts=True,
+        )
+        claimed.extend(
+            DigestDelivery.objects.filter(date=date, run=run, user_id__in=pending).values_list("user_id", flat=True)
+        )
+    return claimed
+
+def start_digest_delivery(user_id: int, date: datetime.date) -> bool:
+    """
+    Mark the user's digest for the date as sent, unless another task already did.
+    Returns whether the caller should send it.
+    """
+    return DigestDelivery.objects.filter(
+        user_id=user_id,
+        date=date,
+        sent_at__isnull=True,
+    ).update(sent_at=timezone.now()) == 1
+
+def reset_digest_delivery(user_id: int, date: datetime.date) -> None:
+    """
+    Undo start_digest_delivery after a failed send so that a retry can send it.
+    """
+    DigestDelivery.objects.filter(user_id=user_id, date=date).update(sent_at=None)
+
+def prune_digest_deliveries(retention_days: int) -> int:
+    """
+    Delete send ledger entries, and prepared digests that were never sent, older
+    than the retention period. Returns the number of ledger entries deleted.
+    """
+    cutoff = timezone.now().date() - datetime.timedelta(days=retention_days)
+    PreparedDigest.objects.filter(date__lt=cutoff).delete()
+    deleted, _ = DigestDelivery.objects.filter(date__lt=cutoff).delete()
+    return deleted
+
+def sample_digest_quotes(user_ids: list[int], recent: dict[int, set[int]]|None = None) -> dict[int, list[Quote]]:
+    """
+    Pick DIGEST_QUOTE_COUNT random quotes for each of the given users in a single
+    query, numbering each user's quotes in random order and keeping the first few.
+    Quotes in the user's recent set are skipped: enough extra quotes are fetched
+    to replace them, and they are only used when the user has too few others.
+    """
+    recent = recent or {}
+    extra = max((len(recent.get(user_id, ())) for user_id in user_ids), default=0)
+    ranked = (
+        Quote.objects
+        .filter(user_id__in=user_ids)
+        .annotate(rank=Window(RowNumber(), partition_by=F("user_id"), order_by=Random().asc()))
+        .filter(rank__lte=DIGEST_QUOTE_COUNT + extra)
+        .order_by("user_id", "rank")
+    )
+    quotes_by_user = {user_id: [] for user_id in user_ids}
+    skipped_by_user = {user_id: [] for user_id in user_ids}
+    ranked = list(ranked)
+    attach_books(ranked)
+    for quote in ranked:
+        if quote.id in recent.get(quote.user_id, ()):
+            skipped_by_user[quote.user_id].append(quote)
+        else:
+            quotes_by_user[quote.user_id].append(quote)
+    for user_id, quotes in quotes_by_user.items():
+        quotes[DIGEST_QUOTE_COUNT:] = []
+        quotes.extend(skipped_by_user[user_id][:DIGEST_QUOTE_COUNT - len(quotes)])
+    return quotes_by_user
+
+def get_recent_digest_quote_ids(user_ids: list[int], date: datetime.date) -> dict[int, set[int]]:
+    """
+    Ids of the quotes sent to each user in the DIGEST_RECENT_DAYS before the date,
+    from one read of their ring buffers, plus the quotes of their digests prepared
+    for those days but not sent yet: tomorrow's digests are prepared before the
+    late slots of today are sent.
+    """
+    since = date - datetime.timedelta(days=settings.DIGEST_RECENT_DAYS)
+    recent_ids = {
+        user_id: recent.quote_ids(since)
+        for user_id, recent in RecentDigestQuotes.objects.in_bulk(user_ids).items()
+    }
+    pending = PreparedDigest.objects.filter(user_id__in=user_ids, date__gte=since, date__lt=date)
+    for user_id, quote_ids in pending.values_list("user_id", "quote_ids"):
+        recent_ids.setdefault(user_id, set()).update(quote_ids)
+    return recent_ids
+
+def record_digest_quotes(quote_ids_by_user: dict[int, list[int]], date: datetime.date) -> None:
+    """
+    Add the quotes sent on the date to the users' ring buffers: one read, one
+    insert for users without a buffer and one bulk update.
+    """
+    if not quote_ids_by_user:
+        return
+    since = date - datetime.timedelta(days=settings.DIGEST_RECENT_DAYS)
+    existing = RecentDigestQuotes.objects.in_bulk(list(quote_ids_by_user))
+    missing = []
+    for user_id, quote_ids in quote_ids_by_user.items():
+        recent = existing.get(user_id)
+        if recent is None:
+            recent = RecentDigestQuotes(user_id=user_id)
+            missing.append(recent)
+        recent.record(date, quote_ids, since)
+    RecentDigestQuotes.objects.bulk_create(missing, ignore_conflicts=True)
+    RecentDigestQuotes.objects.bulk_update(existing.values(), ["entries"])
+
+def render_digest(user: User, quotes: list[Quote], date: datetime.date, stats: UserQuoteStats|None = None) -> tuple[str, str]:
+    """
+    Render the subject and body of a user's digest email, mentioning the size of
+    their collection when their stats are given.
+    """
+    authors = [quote.book.author for quote in quotes]
+    if len(authors) > 1:
+        authors_str = ", ".join(authors[:-1]) + f" and {authors[-1]}"
+    else:
+        authors_str = authors[0]
+    context = {"user": user, "quotes": quotes, "date": date.isoformat(), "authors": authors_str, "stats": stats}
+    subject = render_to_string("quotes/email/digest_subject.txt", context).strip()
+    body = render_to_string("quotes/email/digest_body.txt", context)
+    return subject, body
+
+def build_prepared_digests(user_ids: list[int], date: datetime.date) -> list[PreparedDigest]:
+    """
+    Sample and render the digests of a block of users, without saving them.
+    Each sampling read takes a token from the digest_sampling limiter and is
+    timed on its own, so the rendering does not count against latency_target.
+    """
+    limiter = get_rate_limiter("digest_sampling")
+    with use_replica():
+        with limiter.throttle():
+            users = User.objects.only("id", "email", "first_name").in_bulk(user_ids)
+        with limiter.throttle():
+            recent = get_recent_digest_quote_ids(list(users), date)
+        with limiter.throttle():
+            quotes_by_user = sample_digest_quotes(list(users), recent)
+        with limiter.throttle():
+            stats_by_user = UserQuoteStats.objects.in_bulk(list(users))
+    digests = []
+    for user_id, user in users.items():
+        quotes = quotes_by_user[user_id]
+        subject, body = render_digest(user, quotes, date, stats_by_user.get(user_id)) if quotes else ("", "")
+        digests.append(PreparedDigest(
+            user_id=user_id,
+            date=date,
+            recipient=user.email,
+            subject=subject,
+            body=body,
+            quote_ids=[quote.id for quote in quotes],
+        ))
+    return digests
+
+def prepare_digests(user_ids: list[int], date: datetime.date) -> int:
+    """
+    Precompute the digests of a block of users for the given date into the staging
+    table: one query for the users, one for their quotes and one bulk insert.
+    Digests that were already prepared are kept. Returns the number of users handled.
+    """
+    digests = build_prepared_digests(user_ids, date)
+    PreparedDigest.objects.bulk_create(digests, ignore_conflicts=True)
+    return len(digests)
+
+def claim_digest_sends(user_ids: list[int], date: datetime.date) -> list[int]:
+    """
+    Bulk version of start_digest_delivery: mark the users' ledger entries for the
+    date as sent and return the ids this caller claimed. Rows locked by another
+    sender or already sent are left out.
+    """
+    with transaction.atomic():
+        claimed = list(
+            DigestDelivery.objects
+            .select_for_update(skip_locked=True)
+            .filter(user_id__in=user_ids, date=date, sent_at__isnull=True)
+            .values_list("user_id", flat=True)
+        )
+        DigestDelivery.objects.filter(user_id__in=claimed, date=date).update(sent_at=timezone.now())
+    return claimed
+
+def send_prepared_digests(user_ids: list[int], date: datetime.date) -> dict[str, int]:
+    """
+    Send stage: claim the users in the send ledger, read their prepared digests and
+    stream them over a single mail connection, one message at a time. Digests
+    that were not prepared in advance, or whose quotes were deleted since, are
+    built on the spot, and every digest goes to the user's current email address.
+    The quotes delivered are added to the users' recently sent quotes.
+    Returns counts of sent, skipped, failed and duplicate users; every claimed
+    user is counted once as sent, skipped or failed. If some digests could not be
+    sent, their claims are released and DigestSendError carries their user ids.
+    """
+    claimed = claim_digest_sends(user_ids, date)
+    counts = {"sent": 0, "skipped": 0, "failed": 0, "duplicates": len(user_ids) - len(claimed)}
+    if not claimed:
+        return counts
+
+    # A digest may have been prepared the evening before: check that its quotes
+    # are still there and were not sent since, and read the recipients again
+    digests = {digest.user_id: digest for digest in PreparedDigest.objects.filter(user_id__in=claimed, date=date)}
+    prepared_quote_ids = {quote_id for digest in digests.values() for quote_id in digest.quote_ids}
+    live_quote_ids = set(Quote.objects.filter(id__in=prepared_quote_ids).values_list("id", flat=True))
+    recent = get_recent_digest_quote_ids(list(digests), date)
+    rebuild = [
+        user_id for user_id in claimed
+        if user_id not in digests
+        or not live_quote_ids.issuperset(digests[user_id].quote_ids)
+        or not recent.get(user_id, set()).isdisjoint(digests[user_id].quote_ids)
+    ]
+    record_cache("prepared_digest", hits=len(claimed) - len(rebuild), misses=len(rebuild))
+    if rebuild:
+        digests.update({digest.user_id: digest for digest in build_prepared_digests(rebuild, date)})
+    emails = dict(User.objects.filter(id__in=claimed).values_list("id", "email"))
+    to_send = []
+    for digest in digests.values():
+        digest.recipient = emails.get(digest.user_id, "")
+        if digest.quote_ids and digest.recipient:
+            to_send.append(digest)
+    messages = [
+        EmailMessage(digest.subject, digest.body, settings.DEFAULT_FROM_EMAIL, [digest.recipient])
+        for digest in to_send
+    ]
+
+    error = None
+    if settings.DIGEST_MAIL_MODE == "async":
+        from quotes.async_mail import send_messages_async
+
+        result = send_messages_async(messages, rate_limiter=get_rate_limiter("digest_send"))
+        failed_ids = [digest.user_id for digest in to_send if digest.recipient in result.failed]
+    else:
+        limiter = get_rate_limiter("digest_send")
+        sent_ids = []
+        try:
+            with get_connection() as connection:
+                for digest, message in zip(to_send, messages):
+                    with limiter.throttle():
+                        if connection.send_messages([message]):
+                            sent_ids.append(digest.user_id)
+        except Exception as e:
+            error = e
+        failed_ids = [digest.user_id for digest in to_send if digest.user_id not in sent_ids]
+
+    failed = set(failed_ids)
+    record_digest_quotes({digest.user_id: digest.quote_ids for digest in to_send if digest.user_id not in failed}, date)
+    DigestDelivery.objects.filter(user_id__in=failed_ids, date=date).update(sent_at=None)
+    # Failed digests stay prepared for the retry
+    PreparedDigest.objects.filter(user_id__in=claimed, date=date).exclude(user_id__in=failed_ids).delete()
+    counts["sent"] = len(to_send) - len(failed_ids)
+    counts["failed"] = len(failed_ids)
+    counts["skipped"] = len(claimed) - len(to_send)
+    logger.info("Prepared digests sent", extra={"date": date.isoformat(), **counts})
+    if failed_ids:
+        raise DigestSendError(counts, failed_ids) from error
+    return counts
+
+def find_quotes_and_send_email(user_id: int, date: datetime.date|None = None) -> bool:
+    """
+    Pick three random quotes from the user's quotes, skipping the recently sent
+    ones when possible, and send an email to the user. The digest is dated the
+    given day, by default today in the user's timezone.
+    Returns whether an email was sent.
     """
     user = User.objects.get(id=user_id)
     logger.info(f"Finding quotes and sending email to {user.email}")
-    quotes = Quote.objects.filter(user=user).filter(deleted_at__isnull=True).order_by('?')[:3]
+    date = date or timezone.localdate(timezone=ZoneInfo(user.timezone))
+    with use_replica():
+        recent = get_recent_digest_quote_ids([user.id], date)
+        quotes = sample_digest_quotes([user.id], recent)[user.id]
+        stats = UserQuoteStats.objects.filter(user=user).first()
     if not quotes:
         logger.info(f"No quotes found for user {user.email}, not sending email")
-        return
-    
-    date = timezone.now().strftime("%Y-%m-%d")
-    authors_str = ", ".join([quote.book.author for quote in quotes[:-1]]) + f" and {quotes[-1].book.author}"
-    subject = f"{date}: Quotes from {authors_str}"
-    message = ""
-    message += f"Dear {user.first_name},\n\n"
-    message += f"Here are three quotes from your collection. Hope you enjoy them!\n\n"
-    for quote in quotes:
-        message += f"{quote.quote}\n"
-        message += f"{quote.book.title} - {quote.book.author}\n"
-        message += f"{quote.page_number}\n"
-    message += "\n\nSee you tomorrow!\n\nBest regards,\nThe Quotes App"
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
\ No newline at end of file
+        return False
+
+    subject, message = render_digest(user, quotes, date, stats)
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+    record_digest_quotes({user.id: [quote.id for quote in quotes]}, date)
+    return True
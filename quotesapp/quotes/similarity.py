@@ -0,0 +1,255 @@
+"""
+Per-user "more like this" index over quote texts.
+
+Each user's quotes are stored as sparse rows of hashed word and word-pair
+features in a single file under SIMILAR_QUOTES_INDEX_DIR:
+
+    header   magic, number of rows, number of stored features
+    ids      int64[rows]       quote ids, sorted
+    indptr   int64[rows + 1]   row i's features are [indptr[i], indptr[i + 1])
+    indices  uint32[nnz]       hashed feature of each entry, sorted within a row
+    tf       float32[nnz]      sublinear term frequency, kept for updates
+    weights  float32[nnz]      tf-idf weight, each row L2 normalized
+
+Files are opened with mmap, so the gunicorn workers of a host share one copy
+in the page cache, and are replaced atomically (write a temporary file, then
+rename) so a reader never sees a half-written index. IDF is computed over the
+user's own quotes whenever the file is written; adding or removing quotes only
+needs the rows of the changed quotes, never the database.
+"""
+
+import fcntl
+import os
+import re
+import tempfile
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b"QSIM0001"
+HEADER = np.dtype([("magic", "S8"), ("rows", "<i8"), ("nnz", "<i8")])
+FEATURES = 2 ** 20
+# Words too common to say anything about a quote
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in is it its me my "
+    "not of on or our she so that the their them they this to was we were what when "
+    "which who will with you your".split()
+)
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def enabled() -> bool:
+    return bool(settings.SIMILAR_QUOTES_INDEX_DIR)
+
+
+def index_path(user_id: int) -> str:
+    return os.path.join(settings.SIMILAR_QUOTES_INDEX_DIR, f"{user_id}.qsim")
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def quote_features(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed features of a quote (its words and pairs of consecutive words) with
+    their sublinear term frequency, sorted by feature.
+    """
+    tokens = tokenize(text)
+    terms = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    hashes = np.array([zlib.crc32(term.encode()) % FEATURES for term in terms], dtype=np.uint32)
+    indices, counts = np.unique(hashes, return_counts=True)
+    return indices, (1 + np.log(counts)).astype(np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self, ids: np.ndarray, indptr: np.ndarray, indices: np.ndarray, tf: np.ndarray, weights: np.ndarray|None = None):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.tf = tf
+        self.weights = weights if weights is not None else self.tf_idf_weights()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows: dict[int, tuple[np.ndarray, np.ndarray]]) -> "SimilarityIndex":
+        """Build an index from (indices, tf) rows keyed by quote id."""
+        ids = np.array(sorted(rows), dtype=np.int64)
+        lengths = np.array([len(rows[quote_id][0]) for quote_id in ids], dtype=np.int64)
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if len(ids):
+            indices = np.concatenate([rows[quote_id][0] for quote_id in ids]).astype(np.uint32)
+            tf = np.concatenate([rows[quote_id][1] for quote_id in ids]).astype(np.float32)
+        else:
+            indices, tf = np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32)
+        return cls(ids, indptr, indices, tf)
+
+    @classmethod
+    def from_quotes(cls, quotes: Iterable[tuple[int, str]]) -> "SimilarityIndex":
+        """Build an index from (quote id, text) pairs."""
+        return cls.from_rows({quote_id: quote_features(text) for quote_id, text in quotes})
+
+    def rows(self) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+        return {
+            int(quote_id): (self.indices[start:end], self.tf[start:end])
+            for quote_id, start, end in zip(self.ids, self.indptr[:-1], self.indptr[1:])
+        }
+
+    def updated(self, added: Iterable[tuple[int, str]] = (), removed: Iterable[int] = ()) -> "SimilarityIndex":
+        """
+        A new index with the given (quote id, text) pairs added, replacing rows
+        with the same id, and the removed ids left out.
+        """
+        rows = self.rows()
+        for quote_id in removed:
+            rows.pop(quote_id, None)
+        for quote_id, text in added:
+            rows[quote_id] = quote_features(text)
+        return SimilarityIndex.from_rows(rows)
+
+    def row_numbers(self) -> np.ndarray:
+        """Row of every stored feature."""
+        return np.repeat(np.arange(len(self.ids)), np.diff(self.indptr))
+
+    def tf_idf_weights(self) -> np.ndarray:
+        """Smoothed tf-idf of every stored feature, L2 normalized per row."""
+        if not len(self.indices):
+            return np.zeros(0, dtype=np.float32)
+        features, columns = np.unique(self.indices, return_inverse=True)
+        document_frequency = np.bincount(columns)
+        idf = np.log((1 + len(self.ids)) / (1 + document_frequency)) + 1
+        weights = self.tf * idf[columns]
+        norms = np.sqrt(np.bincount(self.row_numbers(), weights=weights ** 2, minlength=len(self.ids)))
+        return (weights / norms[self.row_numbers()]).astype(np.float32)
+
+    def similar(self, quote_ids: list[int], limit: int) -> dict[int, list[tuple[int, float]]]:
+        """
+        The most similar quotes to each of the given quotes, best first, as
+        (quote id, cosine similarity) pairs. All the queries are scored against
+        every row at once; quotes sharing no feature are left out, and ids not in
+        the index or without features get no results.
+        """
+        positions = np.searchsorted(self.ids, quote_ids)
+        # Quotes without any feature (only stop words, say) share nothing
+        found = [
+            (quote_id, position)
+            for quote_id, position in zip(quote_ids, positions)
+            if position < len(self.ids) and self.ids[position] == quote_id
+            and self.indptr[position + 1] > self.indptr[position]
+        ]
+        results = {quote_id: [] for quote_id in quote_ids}
+        if not found:
+            return results
+
+        # Sparse-sparse products without a dense feature axis: look up every
+        # stored feature in the sorted (query, feature) keys of the query rows
+        query_keys, query_weights = [], []
+        for query, (_, position) in enumerate(found):
+            start, end = self.indptr[position], self.indptr[position + 1]
+            query_keys.append(query * FEATURES + self.indices[start:end].astype(np.int64))
+            query_weights.append(self.weights[start:end])
+        query_keys = np.concatenate(query_keys)
+        query_weights = np.concatenate(query_weights)
+        keys = np.arange(len(found), dtype=np.int64)[:, None] * FEATURES + self.indices.astype(np.int64)
+        matches = np.minimum(np.searchsorted(query_keys, keys), len(query_keys) - 1)
+        products = np.where(query_keys[matches] == keys, query_weights[matches] * self.weights, 0.0)
+        # Sum the products of each row: differences of the running sum at row boundaries
+        totals = np.zeros((len(found), len(self.indices) + 1))
+        np.cumsum(products, axis=1, out=totals[:, 1:])
+        scores = totals[:, self.indptr[1:]] - totals[:, self.indptr[:-1]]
+
+        for query, (quote_id, position) in enumerate(found):
+            row = scores[query]
+            row[position] = 0.0
+            best = np.flatnonzero(row > 1e-6)
+            if len(best) > limit:
+                best = best[np.argpartition(row[best], -limit)[-limit:]]
+            best = best[np.argsort(-row[best], kind="stable")]
+            results[quote_id] = [(int(self.ids[i]), float(row[i])) for i in best]
+        return results
+
+    def save(self, path: str) -> None:
+        """Write the index to path, atomically replacing any previous file."""
+        header = np.array([(MAGIC, len(self.ids), len(self.indices))], dtype=HEADER)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for array, dtype in (
+                    (header, HEADER),
+                    (self.ids, "<i8"),
+                    (self.indptr, "<i8"),
+                    (self.indices, "<u4"),
+                    (self.tf, "<f4"),
+                    (self.weights, "<f4"),
+                ):
+                    f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "SimilarityIndex|None":
+        """Map the index file read-only, or None if there is no index."""
+        try:
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        except FileNotFoundError:
+            return None
+        header = np.frombuffer(data, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a similarity index")
+        rows, nnz = int(header["rows"]), int(header["nnz"])
+        offset = HEADER.itemsize
+        arrays = []
+        for dtype, count in (("<i8", rows), ("<i8", rows + 1), ("<u4", nnz), ("<f4", nnz), ("<f4", nnz)):
+            arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += np.dtype(dtype).itemsize * count
+        return cls(*arrays)
+
+
+# Indexes mapped by this process, keyed by user id, with the file identity they
+# were mapped from so replaced files are picked up
+_mapped: OrderedDict[int, tuple[tuple[int, int], SimilarityIndex]] = OrderedDict()
+
+
+def get_index(user_id: int) -> SimilarityIndex|None:
+    """The user's index, mapped once per process and remapped when the file is replaced."""
+    path = index_path(user_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _mapped.pop(user_id, None)
+        return None
+    identity = (stat.st_ino, stat.st_mtime_ns)
+    cached = _mapped.get(user_id)
+    if cached and cached[0] == identity:
+        _mapped.move_to_end(user_id)
+        return cached[1]
+    index = SimilarityIndex.load(path)
+    if index is not None:
+        _mapped[user_id] = (identity, index)
+        _mapped.move_to_end(user_id)
+        while len(_mapped) > settings.SIMILAR_QUOTES_MAPPED_INDEXES:
+            _mapped.popitem(last=False)
+    return index
+
+
+@contextmanager
+def locked(user_id: int):
+    """Serialize writers of the user's index across processes."""
+    os.makedirs(settings.SIMILAR_QUOTES_INDEX_DIR, exist_ok=True)
+    with open(index_path(user_id) + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,94 @@
+"""
+A minimal asyncio SMTP server that accepts and discards mail.
+
+Used to benchmark and test the digest mail senders without a real relay. Every
+reply is delayed by `latency` seconds to mimic the round trip to a relay, and
+recipients can be made to fail with a given reply code a number of times.
+"""
+
+import asyncio
+import threading
+
+
+class SmtpSink:
+    def __init__(self, latency: float = 0.0, failures: dict[str, tuple[int, int]]|None = None):
+        self.latency = latency
+        # recipient -> (reply code, number of times to fail)
+        self.failures = dict(failures or {})
+        self.received: list[str] = []
+        self.host = "127.0.0.1"
+        self.port = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    async def _reply(self, writer, line: str) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(f"{line}\r\n".encode())
+        await writer.drain()
+
+    async def _handle(self, reader, writer) -> None:
+        recipients = []
+        try:
+            await self._reply(writer, "220 sink ESMTP")
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    await self._reply(writer, "250 sink")
+                elif verb == "MAIL":
+                    recipients = []
+                    await self._reply(writer, "250 OK")
+                elif verb == "RCPT":
+                    address = command.split(":", 1)[1].strip().strip("<>")
+                    code, remaining = self.failures.get(address, (250, 0))
+                    if remaining:
+                        self.failures[address] = (code, remaining - 1)
+                        await self._reply(writer, f"{code} Recipient rejected")
+                    else:
+                        recipients.append(address)
+                        await self._reply(writer, "250 OK")
+                elif verb == "DATA":
+                    await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    while (await reader.readline()) not in (b".\r\n", b""):
+                        pass
+                    self.received.extend(recipients)
+                    await self._reply(writer, "250 OK")
+                elif verb in ("RSET", "NOOP"):
+                    await self._reply(writer, "250 OK")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 Bye")
+                    break
+                else:
+                    await self._reply(writer, "502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> "SmtpSink":
+        """Serve on a free local port from a background thread."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, 0)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self) -> None:
+        def shutdown():
+            self._server.close()
+            self._loop.stop()
+
+        self._loop.call_soon_threadsafe(shutdown)
+        self._thread.join()
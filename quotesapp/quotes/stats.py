@@ -0,0 +1,146 @@
+"""
+Computation of the per-user quote statistics.
+
+UserQuoteStats is kept up to date incrementally: every quote that becomes live
+(created, restored, moved to a book) or leaves (deleted, moved away) is a +1 or
+-1 change to the user's counts, applied by the outbox consumer with
+apply_user_quote_stats_changes. Only the daily job recomputes the stats from
+the quotes table, to pick up changes made elsewhere (the admin, the shell, raw
+SQL).
+"""
+
+import datetime
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+STATS_FIELDS = ["quote_count", "book_count", "book_counts", "author_counts", "month_counts"]
+
+
+def stats_month(created_at: datetime.datetime) -> str:
+    """The month key of a quote created at the given time ("YYYY-MM", UTC)."""
+    return created_at.astimezone(datetime.timezone.utc).strftime("%Y-%m")
+
+
+def empty_stats() -> dict:
+    return {"quote_count": 0, "book_count": 0, "book_counts": {}, "author_counts": {}, "month_counts": {}}
+
+
+def add_quotes_to_stats(fields: dict, book_id: int, author: str, month: str, count: int) -> None:
+    """
+    Add count quotes of a book, author and month to a user's stats fields, or
+    take them away with a negative count. Keys whose count drops to 0 are removed.
+    """
+    fields["quote_count"] += count
+    for counts, key in (
+        (fields["book_counts"], str(book_id)),
+        (fields["author_counts"], author),
+        (fields["month_counts"], month),
+    ):
+        counts[key] = counts.get(key, 0) + count
+        if not counts[key]:
+            del counts[key]
+    fields["book_count"] = sum(1 for value in fields["book_counts"].values() if value > 0)
+
+
+def compute_user_quote_stats(quote_model, user_ids: list[int]) -> dict[int, dict]:
+    """
+    Stats fields of the given users computed from their live quotes, in one
+    grouped query. Users without quotes get empty stats.
+    """
+    stats = {user_id: empty_stats() for user_id in user_ids}
+    groups = (
+        quote_model.objects
+        .filter(user_id__in=user_ids, deleted_at__isnull=True)
+        .annotate(month=TruncMonth("created_at", tzinfo=datetime.timezone.utc))
+        .values("user_id", "book_id", "book__author", "month")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for group in groups:
+        add_quotes_to_stats(
+            stats[group["user_id"]], group["book_id"], group["book__author"], group["month"].strftime("%Y-%m"), group["count"]
+        )
+    return stats
+
+
+def apply_user_quote_stats_changes(stats_model, changes: list[tuple[int, int, str, str, int]]) -> None:
+    """
+    Fold (user id, book id, author, month, count) changes into the users' stats:
+    one insert of the missing rows, one locked read and one bulk update, however
+    many changes there are. The rows are locked in user id order so concurrent
+    consumers cannot deadlock or lose each other's changes.
+    """
+    if not changes:
+        return
+    user_ids = sorted({user_id for user_id, *_ in changes})
+    with transaction.atomic():
+        stats_model.objects.bulk_create([stats_model(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        rows = {
+            stats.user_id: stats
+            for stats in stats_model.objects.select_for_update().filter(user_id__in=user_ids).order_by("user_id")
+        }
+        fields_by_user = {
+            user_id: {name: getattr(stats, name) for name in STATS_FIELDS}
+            for user_id, stats in rows.items()
+        }
+        for user_id, book_id, author, month, count in changes:
+            add_quotes_to_stats(fields_by_user[user_id], book_id, author, month, count)
+        for user_id, stats in rows.items():
+            for name, value in fields_by_user[user_id].items():
+                setattr(stats, name, value)
+        stats_model.objects.bulk_update(rows.values(), STATS_FIELDS)
+
+
+def refresh_user_quote_stats(stats_model, quote_model, user_ids: list[int], pending_events=None) -> int:
+    """
+    Recompute the stats of the given users, creating missing rows and rewriting
+    the ones that changed. The stats rows are locked (in user id order) before
+    the quotes are read, so two refreshes of a user cannot write older stats
+    over newer ones.
+
+    pending_events are the outbox events whose changes are still to be applied.
+    Users with any are left alone: their quotes, read first, may already hold
+    those changes, which would then be counted twice. Returns the number of rows
+    created or corrected.
+    """
+    with transaction.atomic():
+        existing = {
+            stats.user_id: stats
+            for stats in stats_model.objects.select_for_update().filter(user_id__in=user_ids).order_by("user_id")
+        }
+        computed = compute_user_quote_stats(quote_model, user_ids)
+        if pending_events is not None:
+            busy = set(pending_events.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+            computed = {user_id: fields for user_id, fields in computed.items() if user_id not in busy}
+        missing, drifted = [], []
+        for user_id, fields in computed.items():
+            stats = existing.get(user_id)
+            if stats is None:
+                missing.append(stats_model(user_id=user_id, **fields))
+            elif any(getattr(stats, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(stats, name, value)
+                drifted.append(stats)
+        stats_model.objects.bulk_create(missing, ignore_conflicts=True)
+        stats_model.objects.bulk_update(drifted, STATS_FIELDS)
+    return len(missing) + len(drifted)
+
+
+def reconcile_user_quote_stats(stats_model, quote_model, user_model, block_size: int = 500, pending_events=None) -> int:
+    """
+    Recompute the stats of every user in blocks of block_size users, leaving
+    out the users with pending_events (see refresh_user_quote_stats). Returns
+    the number of rows created or corrected.
+    """
+    corrected = 0
+    last_id = 0
+    while True:
+        user_ids = list(
+            user_model.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:block_size]
+        )
+        if not user_ids:
+            return corrected
+        last_id = user_ids[-1]
+        corrected += refresh_user_quote_stats(stats_model, quote_model, user_ids, pending_events)
@@ -0,0 +1,111 @@
+"""
+Streamed rendering of list pages, for QUOTE_LIST_STREAMING.
+
+A streamed page is made of a header, the rows and a footer template. The header
+and the footer are rendered in the view, so the messages are consumed and the
+CSRF cookie set while the middleware can still see them, and the header goes
+out as the first chunk. The rows are then read through a server-side cursor
+(QuerySet.iterator) and rendered QUOTE_LIST_STREAM_CHUNK_SIZE at a time, so
+neither the rows nor the page are ever held in memory whole.
+
+With QUOTE_LIST_STREAM_GZIP, clients that accept gzip get every chunk
+compressed and flushed on its own, so the browser can render it straight away.
+
+Since the rows are read and rendered after the view returned, middleware that
+times requests finishes with finish_after_streaming.
+"""
+
+import zlib
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import patch_vary_headers
+
+
+def render_chunks(header: str, rows: Iterable, row_template, footers: dict[bool, str], context: dict, chunk_size: int) -> Iterator[str]:
+    yield header
+    rows = iter(rows)
+    has_rows = False
+    while chunk := list(islice(rows, chunk_size)):
+        has_rows = True
+        yield row_template.render({**context, "quotes": chunk})
+    yield footers[has_rows]
+
+
+def gzip_chunks(chunks: Iterable[str], charset: str) -> Iterator[bytes]:
+    """Gzip the chunks as one stream, flushing after each so none is held back."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode(charset)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream_then_finish(content: Iterable[bytes], finish: Callable[[], None]) -> Iterator[bytes]:
+    try:
+        yield from content
+    finally:
+        finish()
+
+
+def finish_after_streaming(response: StreamingHttpResponse, finish: Callable[[], None]) -> None:
+    """
+    Call finish once, when the content of the streaming response has been sent
+    or the response is closed, whichever comes first: a response closed before
+    its content was read (a client gone, a HEAD request) never runs it.
+    """
+    done = False
+
+    def finish_once():
+        nonlocal done
+        if not done:
+            done = True
+            finish()
+
+    response.streaming_content = stream_then_finish(response.streaming_content, finish_once)
+    close = response.close
+
+    def close_and_finish():
+        try:
+            close()
+        finally:
+            finish_once()
+
+    response.close = close_and_finish
+
+
+def stream_list(request, queryset, header_template: str, rows_template: str, footer_template: str, context: dict) -> StreamingHttpResponse:
+    """
+    Stream the page for the rows of queryset. The rows template gets them as
+    `quotes`, a chunk at a time, and the footer gets `has_quotes`.
+    """
+    chunk_size = settings.QUOTE_LIST_STREAM_CHUNK_SIZE
+    # The rows are read after the view returned: settle the database now, so a
+    # replica chosen for the view is still used
+    queryset = queryset.using(queryset.db)
+    header = render_to_string(header_template, context, request)
+    footers = {
+        has_rows: render_to_string(footer_template, {**context, "has_quotes": has_rows}, request)
+        for has_rows in (True, False)
+    }
+    chunks = render_chunks(
+        header,
+        queryset.iterator(chunk_size=chunk_size),
+        get_template(rows_template),
+        footers,
+        context,
+        chunk_size,
+    )
+    response = StreamingHttpResponse(content_type="text/html")
+    # Ask proxies such as nginx not to buffer the page
+    response.headers["X-Accel-Buffering"] = "no"
+    if settings.QUOTE_LIST_STREAM_GZIP:
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if re_accepts_gzip.search(request.headers.get("Accept-Encoding", "")):
+            response.headers["Content-Encoding"] = "gzip"
+            chunks = gzip_chunks(chunks, response.charset)
+    response.streaming_content = chunks
+    return response
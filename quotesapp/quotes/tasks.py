@@ -1,21 +1,225 @@
-from quotes.models import User
+import datetime
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from quotes.models import User, DigestRun, Quote, UserQuoteStats
 from celery import current_app as app
-from quotes.services import find_quotes_and_send_email
+from quotes.services import (
+    find_quotes_and_send_email,
+    claim_digest_deliveries,
+    start_digest_delivery,
+    reset_digest_delivery,
+    prune_digest_deliveries,
+    prepare_digests,
+    send_prepared_digests,
+    rebuild_similarity_indexes,
+    refresh_book_catalogue,
+    flush_quote_views,
+    process_outbox,
+    get_due_send_slots,
+    DigestSendError,
+)
+from quotes.scheduling import digest_date, next_digest_date, refresh_send_slots
+from quotes.stats import reconcile_user_quote_stats
+from quotes import outbox
+from quotes.metrics import DIGEST_TASKS_ENQUEUED, DIGEST_USERS
 
-@app.task
-def create_email_tasks():
+# Digest tasks are fire-and-forget: nobody reads their return values, so they
+# don't store results. Progress is tracked on the DigestRun instead.
+# They are acknowledged after running so a task lost with its worker is
+# redelivered; the send ledger and staging table make reruns safe.
+
+@app.task(ignore_result=True)
+def prepare_digests_task(date: str|None = None):
+    """
+    Off-peak stage: precompute every user's digest for the given day, by default
+    the date of their next digest in their timezone, fanning out one task per
+    block of users with the same date.
+    """
+    now = timezone.now()
+    user_ids_by_date = defaultdict(list)
+    users = User.objects.filter(send_slot__isnull=False).order_by("id").values_list("id", "timezone", "send_slot")
+    for user_id, tz_name, slot in users:
+        user_date = date or next_digest_date(tz_name, slot, now).isoformat()
+        user_ids_by_date[user_date].append(user_id)
+    block_size = settings.DIGEST_PREPARE_BATCH_SIZE
+    for user_date, user_ids in sorted(user_ids_by_date.items()):
+        print(f"Preparing digests of {len(user_ids)} users for {user_date}")
+        for start in range(0, len(user_ids), block_size):
+            prepare_digest_block_task.delay(user_ids[start:start + block_size], user_date)
+
+@app.task(ignore_result=True, acks_late=True)
+def prepare_digest_block_task(user_ids: list[int], date: str):
+    """
+    Sample and render the digests of a block of users into the staging table.
+    """
+    prepare_digests(user_ids, datetime.date.fromisoformat(date))
+
+@app.task(ignore_result=True, acks_late=True)
+def create_email_tasks(slot: int|None = None):
+    """
+    Create email tasks for the users whose send slot is due: the given slot, or
+    by default every slot of the day up to now that no run has handled yet.
+    Fan out the tasks to send emails to blocks of users, with a digest run per slot.
+    """
+    now = timezone.now()
+    slots = [slot] if slot is not None else get_due_send_slots(now)
+    print(f"Creating email tasks for send slots {slots}")
+    users = (
+        User.objects.filter(send_slot__in=slots)
+        .order_by("send_slot", "id")
+        .values_list("send_slot", "timezone", "id")
+    )
+    for slot, rows in groupby(users, key=itemgetter(0)):
+        # Users of a slot can be on either side of the date line
+        user_ids_by_date = defaultdict(list)
+        for _, tz_name, user_id in rows:
+            user_ids_by_date[digest_date(tz_name, slot, now)].append(user_id)
+        create_slot_email_tasks(slot, user_ids_by_date)
+
+def create_slot_email_tasks(slot: int, user_ids_by_date: dict[datetime.date, list[int]]) -> None:
+    # The run marks the slot as handled: create it with the claims, so a task
+    # lost in between leaves the slot due
+    with transaction.atomic():
+        run = DigestRun.objects.create(send_slot=slot)
+        # Users already in the day's send ledger were enqueued by an earlier run
+        claimed_by_date = {
+            date: claim_digest_deliveries(user_ids, run, date)
+            for date, user_ids in sorted(user_ids_by_date.items())
+        }
+        run.total_users = sum(len(claimed_ids) for claimed_ids in claimed_by_date.values())
+        run.duplicates = sum(len(user_ids) for user_ids in user_ids_by_date.values()) - run.total_users
+        run.save(update_fields=["total_users", "duplicates"])
+    DIGEST_USERS.labels("duplicates").inc(run.duplicates)
+    block_size = settings.DIGEST_SEND_BATCH_SIZE
+    for date, claimed_ids in claimed_by_date.items():
+        for start in range(0, len(claimed_ids), block_size):
+            send_digest_batch_task.delay(claimed_ids[start:start + block_size], run.id, date.isoformat())
+            DIGEST_TASKS_ENQUEUED.inc()
+
+@app.task(bind=True, ignore_result=True, acks_late=True, max_retries=3, default_retry_delay=60)
+def send_digest_batch_task(self, user_ids: list[int], run_id: int|None, date: str):
+    """
+    Send stage: stream the prepared digests of a block of users and record the
+    outcome on the digest run. Users whose digest could not be sent are retried
+    on their own, and only counted as failed once the retries are used up.
+    """
+    print(f"Sending digests to {len(user_ids)} users")
+    try:
+        counts = send_prepared_digests(user_ids, datetime.date.fromisoformat(date))
+    except DigestSendError as e:
+        retry = self.request.retries < self.max_retries
+        record_digest_outcome(run_id, **{**e.counts, "failed": 0 if retry else e.counts["failed"]})
+        if retry:
+            raise self.retry(exc=e, args=[e.user_ids, run_id, date])
+        raise
+    record_digest_outcome(run_id, **counts)
+
+@app.task(ignore_result=True)
+def refresh_send_slots_task():
+    """
+    Recompute users' send slots so digests follow daylight saving changes.
+    """
+    updated = refresh_send_slots(User)
+    print(f"Refreshed send slots of {updated} users")
+
+@app.task(ignore_result=True)
+def prune_digest_deliveries_task():
+    """
+    Drop send ledger entries that are too old to matter for deduplication.
+    """
+    deleted = prune_digest_deliveries(settings.DIGEST_LEDGER_RETENTION_DAYS)
+    print(f"Pruned {deleted} digest ledger entries")
+
+@app.task(ignore_result=True)
+def reconcile_user_quote_stats_task():
+    """
+    Rebuild users' quote stats from their quotes, fixing any drift from changes
+    made outside the quote services.
+    """
+    corrected = reconcile_user_quote_stats(UserQuoteStats, Quote, User, pending_events=outbox.pending_events())
+    print(f"Reconciled quote stats, {corrected} users corrected")
+
+@app.task(ignore_result=True)
+def rebuild_similarity_indexes_task():
+    """
+    Rebuild every user's similar quotes index from their quotes, picking up
+    changes made outside the quote services and updates that failed.
+    """
+    if not settings.SIMILAR_QUOTES_INDEX_DIR:
+        return
+    written = rebuild_similarity_indexes()
+    print(f"Rebuilt {written} similar quotes indexes")
+
+@app.task(ignore_result=True)
+def refresh_book_catalogue_task():
+    """
+    Rebuild the book catalogue snapshot when books changed since it was built.
+    """
+    if not settings.BOOK_CATALOGUE_PATH:
+        return
+    if refresh_book_catalogue():
+        print("Rebuilt the book catalogue snapshot")
+
+@app.task(ignore_result=True)
+def flush_quote_views_task():
+    """
+    Add the views buffered since the last flush to the quote view counts.
+    """
+    views = flush_quote_views()
+    print(f"Flushed {views} quote views")
+
+@app.task(ignore_result=True)
+def process_outbox_task():
+    """
+    Run the derived data consumers on the pending outbox events.
+    """
+    handled = process_outbox()
+    if handled:
+        print(f"Handled {handled} outbox events")
+
+@app.task(ignore_result=True)
+def prune_outbox_task():
+    """
+    Drop the outbox events processed before the replay window.
+    """
+    deleted = outbox.prune(settings.OUTBOX_RETENTION_DAYS)
+    print(f"Pruned {deleted} outbox events")
+
+@app.task(ignore_result=True, acks_late=True)
+def send_email_task(user_id: int, run_id: int|None = None, date: str|None = None):
     """
-    Create email tasks for each user in the DB.
-    Fan out the tasks to send emails to each user.
+    Send an email to a single user and record the outcome on the digest run.
+    When a ledger date is given, a digest that was already sent is not sent again.
     """
-    print("Creating email tasks")
-    for user in User.objects.all():
-        send_email_task.delay(user)
+    ledger_date = datetime.date.fromisoformat(date) if date else None
+    if ledger_date and not start_digest_delivery(user_id, ledger_date):
+        print(f"Digest for user {user_id} on {date} already sent")
+        record_digest_outcome(run_id, duplicates=1)
+        return
+    print(f"Sending email to user {user_id}")
+    try:
+        sent = find_quotes_and_send_email(user_id, ledger_date)
+    except Exception:
+        if ledger_date:
+            reset_digest_delivery(user_id, ledger_date)
+        record_digest_outcome(run_id, failed=1)
+        raise
+    if sent:
+        record_digest_outcome(run_id, sent=1)
+    else:
+        record_digest_outcome(run_id, skipped=1)
 
-@app.task
-def send_email_task(user: User):
+def record_digest_outcome(run_id: int|None, **counts: int) -> None:
     """
-    Send an email to the user.
+    Add the given counts (sent, skipped, failed, duplicates) to the digest run in a single UPDATE.
     """
-    print(f"Sending email to {user.email}")
-    find_quotes_and_send_email(user.id)
\ No newline at end of file
+    for name, count in counts.items():
+        DIGEST_USERS.labels(name).inc(count)
+    increments = {name: F(name) + count for name, count in counts.items() if count}
+    if run_id is not None and increments:
+        DigestRun.objects.filter(id=run_id).update(**increments)
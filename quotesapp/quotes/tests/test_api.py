@@ -0,0 +1,153 @@
+import json
+
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes.models import Book, Quote
+from quotes.services import create_quotes, get_user_quote_stats
+
+User = get_user_model()
+
+
+class QuoteApiTest(TestCase):
+    """
+    For the JSON API, we test the following:
+    1. Anonymous requests get a 401
+    2. Cursor pagination walks every quote exactly once
+    3. Sparse fieldsets only return the requested (nested) fields
+    4. Multi-get returns the user's quotes in order and reports missing ids
+    5. Batch create reports per-item results
+    6. Batch create rejects malformed items with their field errors
+    7. Batch create runs in a constant number of queries
+    8. Batch soft delete only deletes the user's live quotes
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw'
+        )
+        self.other_user = User.objects.create_user(
+            username='bob',
+            email='bob@example.com',
+            password='pw'
+        )
+        self.book = Book.objects.create(
+            title="Grokking Algorithms",
+            author="Bhargava"
+        )
+        self.quotes = [
+            Quote.objects.create(user=self.user, book=self.book, quote=f"Quote {i}")
+            for i in range(5)
+        ]
+        self.other_quote = Quote.objects.create(user=self.other_user, book=self.book, quote="Not yours")
+        assert self.client.login(username="alice", password="pw")
+
+    def post_json(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type="application/json")
+
+    def test_anonymous_request_is_rejected(self):
+        """Anonymous requests get a 401 rather than a login redirect"""
+        self.client.logout()
+        resp = self.client.get(reverse("quotes_api:quotes_list"))
+        self.assertEqual(resp.status_code, 401)
+
+    def test_cursor_pagination(self):
+        """Following next_cursor visits every quote of the user exactly once"""
+        seen = []
+        url = reverse("quotes_api:quotes_list") + "?limit=2"
+        cursor = None
+        while True:
+            resp = self.client.get(url + (f"&cursor={cursor}" if cursor else ""))
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            seen.extend(item["id"] for item in data["results"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, sorted((quote.id for quote in self.quotes), reverse=True))
+
+    def test_sparse_fieldset(self):
+        """Only the requested fields are returned, with dotted fields nested"""
+        resp = self.client.get(reverse("quotes_api:quotes_list") + "?fields=id,book.title")
+        item = resp.json()["results"][0]
+        self.assertEqual(item, {"id": self.quotes[-1].id, "book": {"title": "Grokking Algorithms"}})
+
+        resp = self.client.get(reverse("quotes_api:quotes_list") + "?fields=user.password")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_multi_get(self):
+        """Multi-get keeps the requested order and hides other users' quotes"""
+        ids = [self.quotes[2].id, self.other_quote.id, self.quotes[0].id]
+        resp = self.client.get(
+            reverse("quotes_api:quotes_batch") + "?fields=id,quote&ids=" + ",".join(map(str, ids))
+        )
+        data = resp.json()
+        self.assertEqual([item["quote"] for item in data["results"]], ["Quote 2", "Quote 0"])
+        self.assertEqual(data["missing"], [self.other_quote.id])
+
+    def test_batch_create(self):
+        """Batch create returns success, duplicate and validation results in order"""
+        resp = self.post_json(reverse("quotes_api:quotes_batch"), {"quotes": [
+            {"quote": "New quote", "book_id": self.book.id},
+            {"quote": "Quote 1", "book_id": self.book.id},
+            {"quote": "From a new book", "title": "SICP", "author": "Abelson", "page_number": 3},
+            {"quote": "No book"},
+            {"quote": "New quote", "book_id": self.book.id},
+        ]})
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["success", "quote_exists", "success", "form_error", "quote_exists"],
+        )
+        self.assertEqual(results[1]["existing_quote_id"], self.quotes[1].id)
+        self.assertEqual(results[4]["existing_quote_id"], results[0]["id"])
+        self.assertTrue(Book.objects.filter(title="SICP", author="Abelson").exists())
+        self.assertEqual(Quote.objects.filter(user=self.user).count(), 7)
+
+    def test_batch_create_malformed(self):
+        """Items with fields of the wrong type get a 400 naming the fields, and nothing is created"""
+        resp = self.post_json(reverse("quotes_api:quotes_batch"), {"quotes": [
+            {"quote": "Fine", "book_id": self.book.id},
+            {"quote": "Bad title", "title": 42, "author": "Someone"},
+            {"quote": "Bad id", "book_id": "abc"},
+            {"quote": "List id", "book_id": [self.book.id]},
+            {"quote": ["not", "text"], "book_id": self.book.id, "page_number": True},
+        ]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["errors"], [
+            {"index": 1, "errors": {"title": "title must be a string."}},
+            {"index": 2, "errors": {"book_id": "book_id must be an integer."}},
+            {"index": 3, "errors": {"book_id": "book_id must be an integer."}},
+            {"index": 4, "errors": {
+                "quote": "quote must be a string.",
+                "page_number": "page_number must be an integer.",
+            }},
+        ])
+        self.assertEqual(Quote.objects.filter(user=self.user).count(), 5)
+
+    def test_batch_create_constant_queries(self):
+        """The number of queries does not grow with the size of the batch"""
+        items = [
+            {"quote": f"Bulk {i}", "title": f"Book {i % 3}", "author": "Someone"}
+            for i in range(30)
+        ] + [{"quote": f"Existing book {i}", "book_id": self.book.id} for i in range(30)]
+        get_user_quote_stats(self.user)
+        # book lookup, book check, book insert, book read back, existing quotes,
+        # quote insert, outbox insert, plus the savepoint pair of the atomic block
+        with self.assertNumQueries(9):
+            results = create_quotes(items, self.user)
+        self.assertTrue(all(result.status == "success" for result in results))
+
+    def test_batch_soft_delete(self):
+        """Batch delete soft deletes only the user's live quotes"""
+        ids = [self.quotes[0].id, self.quotes[1].id, self.other_quote.id]
+        resp = self.post_json(reverse("quotes_api:quotes_batch_delete"), {"ids": ids})
+        self.assertEqual(resp.json(), {"deleted": 2})
+        self.assertFalse(Quote.objects.filter(id__in=ids[:2]).exists())
+        self.assertTrue(Quote.all_objects.filter(id__in=ids[:2]).exists())
+        self.assertTrue(Quote.objects.filter(id=self.other_quote.id).exists())
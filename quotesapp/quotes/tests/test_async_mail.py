@@ -0,0 +1,77 @@
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from quotes.async_mail import send_messages_async
+from quotes.models import Book, Quote, DigestRun, DigestDelivery
+from quotes.services import claim_digest_deliveries, send_prepared_digests, DigestSendError
+from quotes.smtp_sink import SmtpSink
+
+User = get_user_model()
+
+
+class AsyncMailTest(TestCase):
+    """
+    For the async digest mail sender, we test the following:
+    1. Test that every message is delivered over a small connection pool
+    2. Test that transient recipient failures are retried and permanent ones are not
+    3. Test that in async mode only the failed users' ledger claims are released
+    """
+
+    def setUp(self):
+        """Start a local SMTP sink"""
+        self.sink = SmtpSink().start()
+        self.addCleanup(self.sink.stop)
+
+    def send(self, messages, **kwargs):
+        return send_messages_async(
+            messages, hostname=self.sink.host, port=self.sink.port, username="", password="",
+            use_tls=False, retry_backoff=0, **kwargs
+        )
+
+    def message(self, recipient):
+        return EmailMessage("Digest", "Quotes", "digest@example.com", [recipient])
+
+    def test_delivers_all_messages(self):
+        """Messages are spread over the pool and all of them arrive"""
+        recipients = [f"user{i}@example.com" for i in range(30)]
+        result = self.send((self.message(r) for r in recipients), pool_size=3, concurrency=5)
+        self.assertEqual(sorted(result.sent), sorted(recipients))
+        self.assertEqual(sorted(self.sink.received), sorted(recipients))
+
+    def test_retries_transient_failures(self):
+        """A 4xx reply is retried, a 5xx reply fails straight away"""
+        self.sink.failures = {
+            "busy@example.com": (451, 2),
+            "gone@example.com": (550, 1),
+        }
+        result = self.send([self.message("busy@example.com"), self.message("gone@example.com")],
+                           pool_size=1, concurrency=1, max_retries=3)
+        self.assertEqual(result.sent, ["busy@example.com"])
+        self.assertEqual(result.failed, ["gone@example.com"])
+
+    def test_async_mode_releases_failed_claims(self):
+        """Only users whose digest could not be delivered can be sent again"""
+        book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        users = [
+            User.objects.create_user(username=name, email=f"{name}@example.com", password="pw")
+            for name in ("alice", "bob")
+        ]
+        for user in users:
+            Quote.objects.create(user=user, book=book, quote=f"{user.username}'s quote")
+        today = timezone.now().date()
+        claim_digest_deliveries([user.id for user in users], DigestRun.objects.create(), today)
+        self.sink.failures = {"bob@example.com": (550, 1)}
+
+        with override_settings(DIGEST_MAIL_MODE="async", EMAIL_HOST=self.sink.host, EMAIL_PORT=self.sink.port,
+                               EMAIL_HOST_USER="", EMAIL_HOST_PASSWORD="", EMAIL_USE_TLS=False):
+            with self.assertRaises(DigestSendError) as raised:
+                send_prepared_digests([user.id for user in users], today)
+
+        self.assertEqual((raised.exception.counts["sent"], raised.exception.counts["failed"]), (1, 1))
+        self.assertEqual(raised.exception.user_ids, [users[1].id])
+        self.assertEqual(self.sink.received, ["alice@example.com"])
+        self.assertEqual(
+            list(DigestDelivery.objects.filter(sent_at__isnull=True).values_list("user__username", flat=True)),
+            ["bob"],
+        )
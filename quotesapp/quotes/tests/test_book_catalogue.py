@@ -0,0 +1,134 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes.book_catalogue import get_book_catalogue
+from quotes.forms import QuoteCreateForm
+from quotes.models import Book, Quote
+from quotes.services import create_quotes, get_books, refresh_book_catalogue, sample_digest_quotes
+from quotes.tasks import refresh_book_catalogue_task
+
+User = get_user_model()
+
+
+class BookCatalogueTest(TestCase):
+    """
+    For the book catalogue snapshot, we test the following:
+    1. Test that lookups and prefix searches are served from the mapped snapshot
+    2. Test that a rebuild only happens when books changed and is picked up at once
+    3. Test that the quote form and digest sampling take books from the snapshot
+    4. Test that books missing from the snapshot come from the database
+    5. Test that the autocomplete endpoint searches titles by prefix
+    6. Test that the periodic task builds the snapshot only when it is enabled
+    7. Test that quotes are not saved for books deleted since the snapshot was built
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(BOOK_CATALOGUE_PATH=os.path.join(directory.name, "books.snapshot"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice'
+        )
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        Book.objects.create(title="grokking Simplicity", author="Normand")
+        Book.objects.create(title="Structure and Interpretation of Computer Programs", author="Abelson")
+        Book.objects.create(title="Ölüdeniz notes", author="Öztürk")
+
+    def test_lookup_and_search(self):
+        """The snapshot answers by id and by title prefix, ignoring case"""
+        self.assertTrue(refresh_book_catalogue())
+        catalogue = get_book_catalogue()
+        self.assertEqual(catalogue.get(self.book.id), (self.book.id, "Grokking Algorithms", "Bhargava"))
+        self.assertIsNone(catalogue.get(10 ** 6))
+        self.assertEqual([title for _, title, _ in catalogue.search("GROK", 10)], ["Grokking Algorithms", "grokking Simplicity"])
+        self.assertEqual([title for _, title, _ in catalogue.search("grok", 1)], ["Grokking Algorithms"])
+        self.assertEqual(catalogue.search("öl", 10)[0][2], "Öztürk")
+        self.assertEqual(catalogue.search("zzz", 10), [])
+
+    def test_refresh(self):
+        """Unchanged books keep the snapshot; a new one is seen without reloading anything"""
+        refresh_book_catalogue()
+        self.assertFalse(refresh_book_catalogue())
+        first = get_book_catalogue()
+        self.assertIs(get_book_catalogue(), first)
+        book = Book.objects.create(title="Grokking Deep Learning", author="Trask")
+        self.assertTrue(refresh_book_catalogue())
+        self.assertEqual(get_book_catalogue().version[1], 5)
+        self.assertIsNotNone(get_book_catalogue().get(book.id))
+        self.assertIsNone(first.get(book.id))
+
+    def test_form_and_digests_skip_the_books_table(self):
+        """Validation and digest sampling don't read the books"""
+        refresh_book_catalogue()
+        form = QuoteCreateForm(data={"quote": "Hello", "book": self.book.id})
+        # Only the model's foreign key check remains (it was a read of the book too)
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["book"].author, "Bhargava")
+        self.assertFalse(QuoteCreateForm(data={"quote": "Hello", "book": 10 ** 6}).is_valid())
+
+        Quote.objects.create(user=self.user, book=self.book, quote="Hello")
+        with self.assertNumQueries(1):
+            quotes = sample_digest_quotes([self.user.id])[self.user.id]
+            self.assertEqual(quotes[0].book.title, "Grokking Algorithms")
+
+    def test_missing_books_fall_back(self):
+        """Books created after the build are read from the database"""
+        refresh_book_catalogue()
+        book = Book.objects.create(title="New", author="Someone")
+        with self.assertNumQueries(1):
+            books = get_books([self.book.id, book.id])
+        self.assertEqual(books[book.id].title, "New")
+        self.assertEqual(books[self.book.id].title, "Grokking Algorithms")
+
+    def test_search_endpoint(self):
+        """The autocomplete endpoint works with or without a snapshot"""
+        self.client.login(username="alice", password="pw")
+        url = reverse("quotes_api:books_search")
+        for refresh in (False, True):
+            if refresh:
+                refresh_book_catalogue()
+            response = self.client.get(url, {"q": "grokking s"})
+            self.assertEqual(response.json()["results"], [
+                {"id": Book.objects.get(author="Normand").id, "title": "grokking Simplicity", "author": "Normand"},
+            ])
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_refresh_task(self):
+        """The task builds the snapshot, then leaves it alone until books change"""
+        refresh_book_catalogue_task.apply()
+        catalogue = get_book_catalogue()
+        self.assertEqual(catalogue.version[1], 4)
+        refresh_book_catalogue_task.apply()
+        self.assertIs(get_book_catalogue(), catalogue)
+        path = settings.BOOK_CATALOGUE_PATH
+        os.unlink(path)
+        with self.settings(BOOK_CATALOGUE_PATH=""):
+            refresh_book_catalogue_task.apply()
+        self.assertFalse(os.path.exists(path))
+
+    def test_deleted_book(self):
+        """A book still in the snapshot is checked against the books table on save"""
+        refresh_book_catalogue()
+        book = Book.objects.create(title="Doomed", author="Someone")
+        refresh_book_catalogue()
+        book_id = book.id
+        book.delete()
+        self.assertIn(book_id, get_books([book_id]))
+        results = create_quotes([{"quote": "Hello", "book_id": book_id}, {"quote": "Hello", "book_id": self.book.id}], self.user)
+        self.assertEqual([result.status for result in results], ["form_error", "success"])
+        self.assertEqual(results[0].error_message, "Selected book does not exist.")
+        self.assertFalse(QuoteCreateForm(data={"quote": "Hello", "book": book_id}).is_valid())
+        self.assertEqual(Quote.objects.filter(user=self.user).count(), 1)
@@ -0,0 +1,145 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from quotes.book_import import BookImportError, BookImportStats, load_books, merge_sql, normalize, read_books
+from quotes.models import Book
+
+
+class BookDumpReadingTest(SimpleTestCase):
+    """
+    For reading catalogue dumps, we test the following:
+    1. Test that CSV and JSON lines dumps, plain or gzipped, yield normalized books
+    2. Test that unusable rows are rejected and duplicates dropped
+    3. Test that a CSV without the title and author columns is refused
+    4. Test that the merge skips existing books through the unique constraint
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def dump(self, name: str, content: str) -> str:
+        path = os.path.join(self.directory, name)
+        with (gzip.open if name.endswith(".gz") else open)(path, "wt", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def read(self, path: str, **kwargs) -> tuple[list[tuple[str, str]], BookImportStats]:
+        stats = BookImportStats()
+        return list(read_books(path, stats, **kwargs)), stats
+
+    def test_formats(self):
+        """Every format gives the same books"""
+        expected = [("Grokking Algorithms", "Bhargava"), ("Café Society", "Jones")]
+        paths = [
+            self.dump("books.csv", 'isbn,title,author\n1,"  Grokking\n Algorithms ",Bhargava\n2,Café Society,Jones\n'),
+            self.dump("books.csv.gz", 'title,author\nGrokking Algorithms,Bhargava\nCafé Society,Jones\n'),
+            self.dump("books.jsonl", '{"title": "Grokking Algorithms", "author": "Bhargava"}\n{"title": "Café Society", "author": "Jones"}\n'),
+        ]
+        for path in paths:
+            self.assertEqual(self.read(path)[0], expected)
+        path = self.dump("books.txt", '{"name": "Grokking Algorithms", "by": "Bhargava"}\n')
+        books, _ = self.read(path, format="jsonl", title_column="name", author_column="by")
+        self.assertEqual(books, expected[:1])
+
+    def test_rejected_and_duplicates(self):
+        """Blank, missing, too long and malformed rows are counted, not loaded"""
+        path = self.dump("books.jsonl", "\n".join([
+            '{"title": "SICP", "author": "Abelson"}',
+            '{"title": "SICP ", "author": " Abelson"}',
+            '{"title": " ", "author": "Nobody"}',
+            '{"title": "No author"}',
+            '{"title": 42, "author": "Numbers"}',
+            '["not", "an", "object"]',
+            'not json',
+            '{"title": "%s", "author": "Long"}' % ("x" * 256),
+            '{"title": "HtDP", "author": "Felleisen"}',
+        ]))
+        books, stats = self.read(path)
+        self.assertEqual(books, [("SICP", "Abelson"), ("HtDP", "Felleisen")])
+        self.assertEqual((stats.read, stats.rejected, stats.duplicates), (9, 6, 1))
+        self.assertIsNone(normalize(""))
+
+    def test_small_dedup_window(self):
+        """Duplicates far apart get through the window for the merge to drop"""
+        path = self.dump("books.csv", "title,author\nA,X\nB,X\nC,X\nD,X\nE,X\nA,X\nE,X\n")
+        books, stats = self.read(path, dedup_window=4)
+        self.assertEqual(stats.duplicates, 1)
+        self.assertEqual(len(books), 6)
+
+    def test_missing_columns(self):
+        with self.assertRaises(BookImportError):
+            self.read(self.dump("books.csv", "name,writer\nA,X\n"))
+
+    def test_merge(self):
+        self.assertIn("ON CONFLICT (title, author) DO NOTHING", merge_sql())
+
+
+class ImportBooksCommandTest(TestCase):
+    """
+    For the import_books command, we test the following:
+    1. Test that it refuses to run on databases other than PostgreSQL
+    """
+
+    def test_import_books_needs_postgres(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("Runs against PostgreSQL")
+        with self.assertRaises(CommandError):
+            call_command("import_books", "books.csv")
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Importing books needs PostgreSQL")
+class ImportBooksPostgresTest(TestCase):
+    """
+    For importing books on PostgreSQL, we test the following:
+    1. Test that new books are inserted and existing ones left untouched
+    2. Test that duplicates are dropped, in the dump and across chunks
+    3. Test that rerunning an import adds nothing
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "books.csv.gz")
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            f.write(
+                "title,author\n"
+                "Grokking Algorithms,Bhargava\n"
+                "SICP,Abelson\n"
+                "SICP,Abelson\n"
+                "HtDP,Felleisen\n"
+                ",Nobody\n"
+                "Café Society,Jones\n"
+                "SICP,Abelson\n"
+            )
+        self.existing = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+
+    def test_import(self):
+        """Three new books in chunks of two; the last SICP is past the window and dropped by the merge"""
+        stats = BookImportStats()
+        progress = []
+        load_books(connection, read_books(self.path, stats, dedup_window=2), stats, chunk_size=2, progress=progress.append)
+        self.assertEqual((stats.read, stats.rejected, stats.duplicates, stats.loaded, stats.added), (7, 1, 1, 5, 3))
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(
+            sorted(Book.objects.values_list("title", "author")),
+            [("Café Society", "Jones"), ("Grokking Algorithms", "Bhargava"), ("HtDP", "Felleisen"), ("SICP", "Abelson")],
+        )
+        existing = Book.objects.get(id=self.existing.id)
+        self.assertEqual(existing.updated_at, self.existing.updated_at)
+
+    def test_command_rerun(self):
+        out = io.StringIO()
+        call_command("import_books", self.path, stdout=out)
+        self.assertIn("3 books added", out.getvalue())
+        call_command("import_books", self.path, stdout=out)
+        self.assertIn("0 books added", out.getvalue())
+        self.assertEqual(Book.objects.count(), 4)
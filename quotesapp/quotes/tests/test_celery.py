@@ -0,0 +1,41 @@
+from django.test import SimpleTestCase
+from quotesapp.celery import app
+from quotes import tasks
+
+
+class CeleryRoutingTest(SimpleTestCase):
+    """
+    For the Celery configuration, we test the following:
+    1. Test that digest, housekeeping and other tasks go to their own queues
+    2. Test that every periodic task is scheduled and routed like the task itself
+    3. Test that no digest, housekeeping or periodic task falls back to the default queue
+    """
+
+    def route(self, name: str) -> tuple[str, int|None]:
+        options = app.amqp.router.route({}, name)
+        return options["queue"].name, options.get("priority")
+
+    def test_queues(self):
+        """Fan-outs outrank the tasks they enqueue in the digest queue"""
+        self.assertEqual(self.route(tasks.create_email_tasks.name), ("digest", 0))
+        self.assertEqual(self.route(tasks.send_digest_batch_task.name), ("digest", 3))
+        self.assertEqual(self.route(tasks.prune_digest_deliveries_task.name)[0], "maintenance")
+        self.assertEqual(self.route(tasks.process_outbox_task.name)[0], "frequent")
+        self.assertEqual(self.route(tasks.flush_quote_views_task.name)[0], "frequent")
+        self.assertEqual(self.route("quotesapp.celery.debug_task")[0], "interactive")
+        self.assertTrue(tasks.send_digest_batch_task.acks_late)
+
+    def test_periodic_tasks(self):
+        """The beat schedule holds every periodic task"""
+        schedule = {entry["task"] for entry in app.conf.beat_schedule.values()}
+        self.assertIn(tasks.create_email_tasks.name, schedule)
+        self.assertIn(tasks.rebuild_similarity_indexes_task.name, schedule)
+        self.assertEqual(len(schedule), 10)
+
+    def test_every_task_routed(self):
+        """Only tasks meant for the interactive queue fall back to the default route"""
+        unrouted = {
+            name for name in app.tasks
+            if name.startswith("quotes.tasks.") and self.route(name)[0] == "interactive"
+        }
+        self.assertEqual(unrouted, set())
@@ -0,0 +1,78 @@
+import datetime
+from unittest.mock import patch
+
+from django.test import TransactionTestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.urls import reverse
+from quotes.db_router import PIN_PRIMARY_COOKIE, ReplicaRouter, use_replica
+from quotes.models import Book, Quote
+from quotes.services import build_prepared_digests
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"])
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    For the read-replica router, we test the following (outside a test transaction,
+    since reads inside one always stay on the primary):
+    1. Test that reads only go to a replica inside use_replica
+    2. Test that reads inside a transaction and all writes stay on the primary
+    3. Test that the list view reads from a replica
+    4. Test that a write pins the client to the primary for the next reads
+    5. Test that digest sampling reads from a replica
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw'
+        )
+        self.book = Book.objects.create(
+            title="Grokking Algorithms",
+            author="Bhargava"
+        )
+        self.quote = Quote.objects.create(user=self.user, book=self.book, quote="Hello")
+        self.router = ReplicaRouter()
+
+    def test_reads_use_replica_only_when_asked(self):
+        """Reads default to the primary"""
+        self.assertEqual(self.router.db_for_read(Quote), "default")
+        with use_replica():
+            self.assertEqual(self.router.db_for_read(Quote), "replica_0")
+            self.assertEqual(self.router.db_for_write(Quote), "default")
+        with override_settings(DATABASE_REPLICAS=[]), use_replica():
+            self.assertEqual(self.router.db_for_read(Quote), "default")
+
+    def test_transaction_stays_on_primary(self):
+        """A read inside a transaction may depend on its writes"""
+        with use_replica(), transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Quote), "default")
+
+    @patch("quotes.db_router.choose_replica", return_value="default")
+    def test_list_view_reads_from_replica(self, choose_replica):
+        """The list queries are routed, including the ones run while rendering"""
+        self.client.login(username="alice", password="pw")
+        response = self.client.get(reverse("quotes:quotes_list"))
+        self.assertContains(response, "Hello")
+        self.assertTrue(choose_replica.called)
+
+    @patch("quotes.db_router.choose_replica", return_value="default")
+    def test_write_pins_client_to_primary(self, choose_replica):
+        """After a POST, the client reads from the primary until the cookie expires"""
+        self.client.login(username="alice", password="pw")
+        response = self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": [self.quote.id]})
+        self.assertIn(PIN_PRIMARY_COOKIE, response.cookies)
+        self.client.get(reverse("quotes:quotes_list"))
+        self.assertFalse(choose_replica.called)
+
+    @patch("quotes.db_router.choose_replica", return_value="default")
+    def test_digest_sampling_reads_from_replica(self, choose_replica):
+        """Users and quotes for the digests come from a replica"""
+        digests = build_prepared_digests([self.user.id], datetime.date(2025, 1, 1))
+        self.assertEqual(digests[0].quote_ids, [self.quote.id])
+        self.assertTrue(choose_replica.called)
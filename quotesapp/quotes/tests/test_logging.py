@@ -0,0 +1,108 @@
+import io
+import json
+import logging
+import threading
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+from pythonjsonlogger.jsonlogger import JsonFormatter
+from quotesapp.log_handlers import AsyncBatchHandler, SamplingFilter
+
+
+class BlockingStream(io.StringIO):
+    """A stream whose writes wait until released."""
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.writing.set()
+        self.release.wait(5)
+        return super().write(text)
+
+
+class LoggingPipelineTest(SimpleTestCase):
+    """
+    For the asynchronous logging pipeline, we test the following:
+    1. Test that records are written as JSON lines by the writer thread, in order
+    2. Test that queued records are written in a single batch
+    3. Test that records are dropped and counted when the queue is full
+    4. Test that queuing a record leaves the caller's record untouched for the other handlers
+    5. Test that sampled events are only partly kept and carry their sample rate
+    """
+
+    def make_logger(self, handler):
+        handler.setFormatter(JsonFormatter("%(levelname)s %(message)s"))
+        logger = logging.getLogger(f"test.{self.id()}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_json_lines(self):
+        """Records, including their extras, end up on the stream as JSON"""
+        stream = io.StringIO()
+        logger = self.make_logger(AsyncBatchHandler(stream=stream))
+        logger.info("Quote viewed", extra={"quote_id": 1})
+        logger.info("Quote %s", "updated")
+        logger.handlers[0].flush()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["message"] for line in lines], ["Quote viewed", "Quote updated"])
+        self.assertEqual(lines[0]["quote_id"], 1)
+
+    def test_batched_write(self):
+        """Records queued while the writer is busy are written together"""
+        stream = BlockingStream()
+        handler = AsyncBatchHandler(stream=stream)
+        logger = self.make_logger(handler)
+        logger.info("first")
+        self.assertTrue(stream.writing.wait(5))
+        with patch.object(stream, "write", wraps=stream.write) as write:
+            for i in range(5):
+                logger.info(f"queued {i}")
+            stream.release.set()
+            handler.flush()
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(len(stream.getvalue().splitlines()), 6)
+
+    def test_drops_when_full(self):
+        """A full queue drops records instead of blocking the caller"""
+        stream = BlockingStream()
+        counter = Mock()
+        handler = AsyncBatchHandler(stream=stream, capacity=1, dropped_counter=counter)
+        logger = self.make_logger(handler)
+        logger.info("first")
+        self.assertTrue(stream.writing.wait(5))
+        logger.info("queued")
+        logger.info("dropped")
+        self.assertEqual(handler.dropped, 1)
+        counter.inc.assert_called_once_with()
+        stream.release.set()
+        handler.flush()
+        self.assertEqual(len(stream.getvalue().splitlines()), 2)
+
+    def test_record_not_mutated(self):
+        """The queued copy has its message resolved; the original keeps msg and args"""
+        handler = AsyncBatchHandler(stream=io.StringIO())
+        record = logging.LogRecord("quotes", logging.INFO, "", 0, "Quote %s", ("updated",), None)
+        prepared = handler.prepare(record)
+        self.assertIsNot(prepared, record)
+        self.assertEqual((prepared.msg, prepared.args), ("Quote updated", None))
+        self.assertEqual((record.msg, record.args), ("Quote %s", ("updated",)))
+
+    def test_sampling(self):
+        """Sampled events are kept at their rate; other events and errors always are"""
+        sampling = SamplingFilter({"Quote viewed": 0.25})
+
+        def make(msg, level=logging.INFO):
+            return logging.LogRecord("quotes", level, "", 0, msg, None, None)
+
+        with patch("quotesapp.log_handlers.random.random", side_effect=[0.1, 0.5]):
+            kept = make("Quote viewed")
+            self.assertTrue(sampling.filter(kept))
+            self.assertFalse(sampling.filter(make("Quote viewed")))
+        self.assertEqual(kept.sample_rate, 0.25)
+        self.assertTrue(sampling.filter(make("Quote updated")))
+        self.assertTrue(sampling.filter(make("Quote viewed", logging.ERROR)))
@@ -0,0 +1,130 @@
+from unittest.mock import patch
+
+from django.db import ConnectionHandler, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from quotes.metrics import MetricsMiddleware
+from quotes.models import Book
+from quotes.services import create_quote, create_quotes
+
+User = get_user_model()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class MetricsTest(TestCase):
+    """
+    For the Prometheus metrics, we test the following:
+    1. Test that requests are timed per URL name and their queries are counted
+    2. Test that queries sent to a replica are counted too
+    3. Test that quote creates and conflicts are counted for single and batch creates
+    4. Test that /metrics serves the text format
+    5. Test that /metrics requires the bearer token when one is configured, and always in prod
+    6. Test that streaming responses are measured until their content has been sent or closed
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw'
+        )
+        self.book = Book.objects.create(
+            title="Grokking Algorithms",
+            author="Bhargava"
+        )
+
+    def test_request_latency_and_queries(self):
+        """The list view is timed under its URL name and its queries are counted"""
+        self.client.login(username="alice", password="pw")
+        labels = {"view": "quotes:quotes_list", "method": "GET", "status": "200"}
+        before = sample("quotes_http_request_duration_seconds_count", **labels)
+        queries_before = sample("quotes_http_request_db_queries_sum", view="quotes:quotes_list")
+        response = self.client.get(reverse("quotes:quotes_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sample("quotes_http_request_duration_seconds_count", **labels), before + 1)
+        self.assertGreater(sample("quotes_http_request_db_queries_sum", view="quotes:quotes_list"), queries_before)
+
+    def test_replica_queries(self):
+        """Every connection's queries count towards the request"""
+        databases = ConnectionHandler({
+            "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+            "replica_0": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+        })
+        self.addCleanup(databases.close_all)
+
+        def view(request):
+            for alias in ("default", "replica_0", "replica_0"):
+                with databases[alias].cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            return HttpResponse()
+
+        before = sample("quotes_http_request_db_queries_sum", view="unmatched")
+        with patch("quotes.metrics.connections", databases):
+            MetricsMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(sample("quotes_http_request_db_queries_sum", view="unmatched"), before + 3)
+
+    def test_streaming(self):
+        """The queries run while the rows stream out are counted, once the stream ends"""
+        def rows():
+            for _ in range(2):
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                yield b"row"
+
+        def view(request):
+            return StreamingHttpResponse(rows())
+
+        queries = sample("quotes_http_request_db_queries_sum", view="unmatched")
+        count = sample("quotes_http_request_db_queries_count", view="unmatched")
+        response = MetricsMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(sample("quotes_http_request_db_queries_count", view="unmatched"), count)
+        self.assertEqual(b"".join(response.streaming_content), b"rowrow")
+        self.assertEqual(sample("quotes_http_request_db_queries_count", view="unmatched"), count + 1)
+        self.assertEqual(sample("quotes_http_request_db_queries_sum", view="unmatched"), queries + 2)
+        response.close()
+        self.assertEqual(sample("quotes_http_request_db_queries_count", view="unmatched"), count + 1)
+        self.assertEqual(connection.execute_wrappers, [])
+
+        # Closed without being read
+        MetricsMiddleware(view)(RequestFactory().get("/")).close()
+        self.assertEqual(sample("quotes_http_request_db_queries_count", view="unmatched"), count + 2)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_quote_creates_and_conflicts(self):
+        """Created quotes and duplicates are counted"""
+        created = sample("quotes_created_total")
+        conflicts = sample("quotes_conflicts_total", operation="create")
+        create_quote("Hello", self.book, None, None, None, self.user)
+        create_quote("Hello", self.book, None, None, None, self.user)
+        create_quotes([
+            {"quote": "Hello", "book_id": self.book.id},
+            {"quote": "World", "book_id": self.book.id},
+        ], self.user)
+        self.assertEqual(sample("quotes_created_total"), created + 2)
+        self.assertEqual(sample("quotes_conflicts_total", operation="create"), conflicts + 2)
+
+    def test_metrics_endpoint(self):
+        """The endpoint is public by default and serves the text format"""
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"quotes_http_request_duration_seconds", response.content)
+
+    @override_settings(METRICS_BEARER_TOKEN="secret")
+    def test_metrics_token(self):
+        """Scrapers without the token are rejected"""
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SETTINGS_PROFILE="prod", METRICS_BEARER_TOKEN="")
+    def test_metrics_closed_in_prod(self):
+        """Without a token, prod serves no one"""
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
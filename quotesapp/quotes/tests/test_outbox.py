@@ -0,0 +1,127 @@
+import datetime
+import io
+
+from django.core.management import call_command, CommandError
+from django.db import transaction
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from quotes import outbox
+from quotes.models import Book, OutboxEvent
+from quotes.services import create_quote, create_quotes, soft_delete_quotes, restore_quotes
+
+User = get_user_model()
+
+
+class OutboxTest(TestCase):
+    """
+    For the transactional outbox, we test the following:
+    1. Test that quote changes write their events in the same transaction
+    2. Test that the consumer hands the events to the handlers in batches and marks them processed
+    3. Test that a failing event is isolated from its batch and left aside after too many attempts
+    4. Test that replays requeue events by time, id and topic, and pruning keeps the replay window
+    5. Test that the outbox command reports the backlog and replays
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice'
+        )
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        self.handled = []
+
+    def handler(self, events):
+        self.handled.append([(event.topic, event.object_id) for event in events])
+
+    def topics(self) -> list[tuple[str, int]]:
+        return list(OutboxEvent.objects.order_by("id").values_list("topic", "object_id"))
+
+    def test_events_written_with_changes(self):
+        """Every quote service writes its events; a rolled back change writes none"""
+        quote = create_quote("Hello", self.book, None, None, None, self.user).quote
+        other, = [result.quote for result in create_quotes([{"quote": "World", "book_id": self.book.id}], self.user)]
+        soft_delete_quotes(self.user, [quote.id])
+        restore_quotes(self.user, [quote.id])
+        self.client.login(username="alice", password="pw")
+        self.client.post(reverse("quotes:quote_edit", args=[other.id]), {"quote": "World!", "book": self.book.id})
+        self.assertEqual(self.topics(), [
+            ("quote.created", quote.id),
+            ("quote.created", other.id),
+            ("quote.deleted", quote.id),
+            ("quote.restored", quote.id),
+            ("quote.updated", other.id),
+        ])
+        self.assertEqual(OutboxEvent.objects.last().payload, {"fields": ["quote"]})
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            create_quote("Rolled back", self.book, None, None, None, self.user)
+            raise RuntimeError
+        self.assertEqual(OutboxEvent.objects.count(), 5)
+
+    def test_drain(self):
+        """Events are handled oldest first, in batches, once"""
+        quotes = [create_quote(f"Quote {i}", self.book, None, None, None, self.user).quote for i in range(5)]
+        self.assertEqual(outbox.drain([self.handler], batch_size=2, time_limit=60), 5)
+        self.assertEqual([len(batch) for batch in self.handled], [2, 2, 1])
+        self.assertEqual([object_id for batch in self.handled for _, object_id in batch], [quote.id for quote in quotes])
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(outbox.drain([self.handler], batch_size=2, time_limit=60), 0)
+        self.assertEqual(outbox.status()["oldest_pending_seconds"], 0)
+
+    def test_failing_event(self):
+        """The rest of the batch is processed; the bad event is retried up to the limit"""
+        good = create_quote("Good", self.book, None, None, None, self.user).quote
+        bad = create_quote("Bad", self.book, None, None, None, self.user).quote
+
+        def handler(events):
+            if any(event.object_id == bad.id for event in events):
+                raise ValueError("bad event")
+            self.handler(events)
+
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2):
+            outbox.drain([handler], batch_size=10, time_limit=60)
+            self.assertEqual(self.handled, [[("quote.created", good.id)]])
+            self.assertEqual(outbox.status()["pending"], 1)
+            outbox.drain([handler], batch_size=10, time_limit=60)
+            self.assertEqual(outbox.status(), {"pending": 0, "dead": 1, "oldest_pending_seconds": 0})
+            self.assertEqual(outbox.drain([handler], batch_size=10, time_limit=60), 0)
+
+            self.assertEqual(outbox.replay(from_id=OutboxEvent.objects.get(object_id=bad.id).id), 1)
+            outbox.drain([self.handler], batch_size=10, time_limit=60)
+        self.assertEqual(self.handled[-1], [("quote.created", bad.id)])
+
+    def test_replay_and_prune(self):
+        """Processed events come back for the selected range; old ones are pruned"""
+        first = create_quote("First", self.book, None, None, None, self.user).quote
+        soft_delete_quotes(self.user, [first.id])
+        outbox.drain([self.handler], batch_size=10, time_limit=60)
+        OutboxEvent.objects.filter(topic="quote.created").update(
+            created_at=timezone.now() - datetime.timedelta(days=10),
+            processed_at=timezone.now() - datetime.timedelta(days=10),
+        )
+        self.assertEqual(outbox.replay(since=timezone.now() - datetime.timedelta(days=1)), 1)
+        self.assertEqual(outbox.replay(from_id=0, topics=["quote.created"]), 1)
+        outbox.drain([self.handler], batch_size=10, time_limit=60)
+        self.assertEqual(self.handled[-1], [("quote.created", first.id), ("quote.deleted", first.id)])
+
+        OutboxEvent.objects.filter(topic="quote.created").update(processed_at=timezone.now() - datetime.timedelta(days=10))
+        self.assertEqual(outbox.prune(7), 1)
+        self.assertEqual(self.topics(), [("quote.deleted", first.id)])
+
+    def test_command(self):
+        """status shows the backlog and replay requeues"""
+        create_quote("Hello", self.book, None, None, None, self.user)
+        out = io.StringIO()
+        call_command("outbox", "status", stdout=out)
+        self.assertIn("1 pending events", out.getvalue())
+        outbox.drain([self.handler], batch_size=10, time_limit=60)
+        call_command("outbox", "replay", "--since", "2000-01-01T00:00", "--topic", "quote.created", stdout=out)
+        self.assertIn("Requeued 1 events", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("outbox", "replay")
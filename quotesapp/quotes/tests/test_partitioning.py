@@ -0,0 +1,165 @@
+import importlib
+import unittest
+from io import StringIO
+from types import SimpleNamespace
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from quotes import partitioning
+from quotes.models import Book, Quote
+
+User = get_user_model()
+
+
+class PartitioningSqlTest(SimpleTestCase):
+    """
+    For the quotes table partitioning, we test the following:
+    1. Test that the copy is hash partitioned on user_id with a primary key including it
+    2. Test that indexes and foreign keys are recreated under temporary names
+    3. Test that generated names fit in a Postgres identifier
+    4. Test that fewer than two partitions are rejected
+    """
+
+    unique_index = (
+        "unique_quote_per_user_per_book_when_not_deleted",
+        "CREATE UNIQUE INDEX unique_quote_per_user_per_book_when_not_deleted ON public.quotes_quote "
+        "USING btree (quote, user_id, book_id) WHERE (deleted_at IS NULL)",
+    )
+    foreign_key = (
+        "quotes_quote_book_id_fk",
+        "FOREIGN KEY (book_id) REFERENCES quotes_book(id) DEFERRABLE INITIALLY DEFERRED",
+    )
+
+    def test_partitioned_table(self):
+        statements = partitioning.partitioned_table_sql(4, [], [])
+        self.assertIn("PARTITION BY HASH (user_id)", statements[0])
+        self.assertIn("PRIMARY KEY (id, user_id)", statements[3])
+        self.assertEqual(
+            statements[4:],
+            [
+                f"CREATE TABLE quotes_quote_part_{remainder} PARTITION OF quotes_quote_part "
+                f"FOR VALUES WITH (MODULUS 4, REMAINDER {remainder})"
+                for remainder in range(4)
+            ],
+        )
+
+    def test_indexes_and_foreign_keys(self):
+        statements = partitioning.partitioned_table_sql(2, [self.unique_index], [self.foreign_key])
+        self.assertEqual(
+            statements[-2],
+            "CREATE UNIQUE INDEX unique_quote_per_user_per_book_when_not_deleted_p ON quotes_quote_part "
+            "USING btree (quote, user_id, book_id) WHERE (deleted_at IS NULL)",
+        )
+        self.assertEqual(
+            statements[-1],
+            "ALTER TABLE quotes_quote_part ADD CONSTRAINT quotes_quote_book_id_fk_p "
+            "FOREIGN KEY (book_id) REFERENCES quotes_book(id) DEFERRABLE INITIALLY DEFERRED",
+        )
+
+    def test_name_length(self):
+        name = "x" * 63
+        self.assertEqual(len(partitioning.temporary_name(name)), 63)
+        self.assertEqual(len(partitioning.retired_name(name)), 63)
+
+    def test_too_few_partitions(self):
+        with self.assertRaises(partitioning.PartitioningError):
+            partitioning.partitioned_table_sql(1, [], [])
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL")
+class PartitionQuotesPostgresTest(TestCase):
+    """
+    For partitioning on PostgreSQL, we test the following:
+    1. Test that prepare, copy and swap convert a table with data, keeping the rows changed meanwhile
+    2. Test that the converted table keeps its indexes, constraints and id sequence
+    3. Test that migration 0013 converts an empty table in one go, keeping its indexes and constraints
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+        self.other = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+
+    def partitions(self) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = %s::regclass", [partitioning.TABLE])
+            return cursor.fetchone()[0]
+
+    def test_prepare_copy_swap(self):
+        """Rows inserted, updated and deleted after prepare make it to the partitioned table"""
+        quotes = [Quote.objects.create(user=user, book=self.book, quote=f"Quote {i}") for i, user in enumerate([self.user, self.other] * 3)]
+        with connection.cursor() as cursor:
+            indexes = [name for name, _ in partitioning.get_indexes(cursor, partitioning.TABLE)]
+        out = StringIO()
+        call_command("partition_quotes", "prepare", "--partitions", "4", stdout=out)
+        call_command("partition_quotes", "copy", "--batch-size", "2", stdout=out)
+        self.assertIn("Copied 6 quotes", out.getvalue())
+
+        added = Quote.objects.create(user=self.user, book=self.book, quote="Added during the copy")
+        Quote.objects.filter(id=quotes[0].id).update(quote="Edited during the copy")
+        Quote.objects.filter(id=quotes[1].id).delete()
+        call_command("partition_quotes", "swap", stdout=out)
+
+        self.assertEqual(self.partitions(), 4)
+        self.assertEqual(
+            set(Quote.all_objects.values_list("id", "quote")),
+            {(quote.id, quote.quote) for quote in quotes[2:]} | {(quotes[0].id, "Edited during the copy"), (added.id, added.quote)},
+        )
+        self.assertEqual(Quote.objects.filter(user=self.other).count(), 2)
+        with connection.cursor() as cursor:
+            self.assertTrue(partitioning.table_exists(cursor, partitioning.UNPARTITIONED_TABLE))
+            self.assertFalse(partitioning.table_exists(cursor, partitioning.CHANGES_TABLE))
+            self.assertEqual([name for name, _ in partitioning.get_indexes(cursor, partitioning.TABLE)], indexes)
+            self.assertEqual(len(partitioning.get_constraints(cursor, partitioning.TABLE, "f")), 2)
+        self.assertGreater(Quote.objects.create(user=self.user, book=self.book, quote="After the swap").id, added.id)
+
+    @override_settings(QUOTE_PARTITIONS=2)
+    def test_empty_table(self):
+        migration = importlib.import_module("quotes.migrations.0013_partition_quote")
+        with connection.cursor() as cursor:
+            indexes = [name for name, _ in partitioning.get_indexes(cursor, partitioning.TABLE)]
+            foreign_keys = partitioning.get_constraints(cursor, partitioning.TABLE, "f")
+            (primary_key, _), = partitioning.get_constraints(cursor, partitioning.TABLE, "p")
+            migration.partition_quotes(None, SimpleNamespace(connection=connection))
+            self.assertTrue(partitioning.is_partitioned(cursor))
+            self.assertEqual(self.partitions(), 2)
+            self.assertEqual([name for name, _ in partitioning.get_indexes(cursor, partitioning.TABLE)], indexes)
+            self.assertEqual(partitioning.get_constraints(cursor, partitioning.TABLE, "f"), foreign_keys)
+            self.assertEqual(
+                partitioning.get_constraints(cursor, partitioning.TABLE, "p"),
+                [(primary_key, "PRIMARY KEY (id, user_id)")],
+            )
+            self.assertFalse(partitioning.table_exists(cursor, partitioning.UNPARTITIONED_TABLE))
+            # Running it again leaves the partitioned table alone
+            migration.partition_quotes(None, SimpleNamespace(connection=connection))
+        quote = Quote.objects.create(user=self.user, book=self.book, quote="Hello")
+        self.assertEqual(Quote.objects.get(user=self.user).id, quote.id)
+        with self.assertRaises(partitioning.PartitioningError):
+            partitioning.prepare(connection, 2)
+
+
+class QuoteTableCommandsTest(TestCase):
+    """
+    For the partitioning commands, we test the following:
+    1. Test that partition_quotes refuses to run on databases other than PostgreSQL
+    2. Test that the benchmark reports per-user query latency
+    """
+
+    def test_partition_quotes_needs_postgres(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("Runs against PostgreSQL")
+        with self.assertRaises(CommandError):
+            call_command("partition_quotes", "status")
+
+    def test_benchmark(self):
+        user = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+        book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        Quote.objects.create(user=user, book=book, quote="Hello")
+        out = StringIO()
+        call_command("bench_quote_table", "--repeat", "2", stdout=out)
+        self.assertIn("list: p50", out.getvalue())
+        self.assertIn("(2 queries)", out.getvalue())
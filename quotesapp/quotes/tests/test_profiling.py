@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command, CommandError
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes.models import Book, Quote
+from quotes.profiling import ProfilingMiddleware, list_profiles, make_token, save_profile
+
+User = get_user_model()
+
+
+class RequestProfilingTest(TestCase):
+    """
+    For on-demand request profiling, we test the following:
+    1. Test that the middleware is left out when profiling is off
+    2. Test that a staff token in the header or query profiles the request into a speedscope file
+    3. Test that requests without a valid token of a staff user are not profiled
+    4. Test that only staff can list and download profiles, and only the newest are kept
+    5. Test that tokens are only issued for staff users
+    6. Test that a streamed page is profiled until its rows have been sent
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(PROFILING_DIR=self.directory, PROFILING_INTERVAL=0.0001)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = Client()
+        self.staff = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice',
+            is_staff=True,
+        )
+        self.user = User.objects.create_user(
+            username='bob',
+            email='bob@example.com',
+            password='pw',
+            first_name='Bob',
+        )
+        book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        self.quote = Quote.objects.create(user=self.staff, book=book, quote="Hello")
+
+    def test_disabled(self):
+        """No directory, no middleware"""
+        with self.settings(PROFILING_DIR=""):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_profile_request(self):
+        """The profile holds the sampled stacks and the queries"""
+        self.client.login(username="alice", password="pw")
+        url = reverse("quotes:quote_detail", args=[self.quote.id])
+        response = self.client.get(url, headers={"X-Profile": make_token(self.staff)})
+        self.assertEqual(response.status_code, 200)
+        name = response["X-Profile"]
+        self.assertEqual(list_profiles(), [name])
+        self.assertIn("quotes_quote_detail", name)
+        with open(os.path.join(self.directory, name)) as f:
+            profile = json.load(f)
+        sampled, sql = profile["profiles"]
+        self.assertEqual(len(sampled["samples"]), len(sampled["weights"]))
+        self.assertEqual(sql["type"], "evented")
+        query_names = {profile["shared"]["frames"][event["frame"]]["name"] for event in sql["events"]}
+        self.assertTrue(any("quotes_quote" in query for query in query_names))
+
+        response = self.client.get(url, {"_profile": make_token(self.staff)})
+        self.assertEqual(len(list_profiles()), 2)
+
+    def test_profile_streaming(self):
+        """The profile is saved once the rows are out, with the query that read them"""
+        self.client.login(username="alice", password="pw")
+        with self.settings(QUOTE_LIST_STREAMING=True):
+            response = self.client.get(reverse("quotes:quotes_list"), headers={"X-Profile": make_token(self.staff)})
+        self.assertTrue(response.streaming)
+        self.assertEqual(list_profiles(), [])
+        self.assertIn("Hello", b"".join(response.streaming_content).decode())
+        self.assertEqual(list_profiles(), [response["X-Profile"]])
+        with open(os.path.join(self.directory, response["X-Profile"])) as f:
+            profile = json.load(f)
+        frame_names = [frame["name"] for frame in profile["shared"]["frames"]]
+        # The rows query is in, the test's frames are not
+        self.assertTrue(any("quotes_quote" in name and "snippet" in name for name in frame_names))
+        self.assertNotIn("RequestProfilingTest.test_profile_streaming", frame_names)
+
+    def test_not_profiled(self):
+        """Other users' tokens, forged tokens and non-staff users get no profile"""
+        url = reverse("quotes:quotes_list")
+        self.client.login(username="alice", password="pw")
+        for token in (make_token(self.user), "forged"):
+            self.assertNotIn("X-Profile", self.client.get(url, headers={"X-Profile": token}))
+        self.client.login(username="bob", password="pw")
+        self.assertNotIn("X-Profile", self.client.get(url, headers={"X-Profile": make_token(self.user)}))
+        self.assertEqual(list_profiles(), [])
+
+    def test_profile_views(self):
+        """Profiles are staff only; old ones are removed"""
+        with self.settings(PROFILING_KEEP=2):
+            for number in range(3):
+                save_profile({"profiles": []}, f"2025010{number}T000000-1-view")
+        self.assertEqual(list_profiles(), ["20250102T000000-1-view.speedscope.json", "20250101T000000-1-view.speedscope.json"])
+
+        self.client.login(username="bob", password="pw")
+        self.assertEqual(self.client.get(reverse("profiles")).status_code, 302)
+        self.client.login(username="alice", password="pw")
+        self.assertContains(self.client.get(reverse("profiles")), "20250102T000000-1-view")
+        response = self.client.get(reverse("profile", args=["20250102T000000-1-view.speedscope.json"]))
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), {"profiles": []})
+        self.assertEqual(self.client.get(reverse("profile", args=["settings.py"])).status_code, 404)
+
+    def test_token_command(self):
+        """Only staff users get a token"""
+        with self.assertRaises(CommandError):
+            call_command("profile_token", "bob")
+        stdout = StringIO()
+        call_command("profile_token", "alice", stdout=stdout)
+        self.assertTrue(stdout.getvalue().strip())
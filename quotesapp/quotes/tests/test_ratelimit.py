@@ -0,0 +1,161 @@
+from unittest.mock import patch
+
+import fakeredis
+import redis
+from django.test import SimpleTestCase
+from quotes.metrics import RATE_LIMIT_ACQUIRED, RATE_LIMIT_RATE, RATE_LIMIT_TOKENS
+from quotes.ratelimit import RateLimiter, RedisBucket
+
+
+class RateLimiterTest(SimpleTestCase):
+    """
+    For the digest rate limiter, we test the following:
+    1. Test that the in-memory bucket allows a burst and then makes callers wait
+    2. Test that requests larger than the burst are taken in chunks
+    3. Test that errors and slow calls cut the rate and healthy calls raise it
+    4. Test that the limiter falls back to memory when Redis is unreachable
+    5. Test that throttled blocks are recorded as the given number of calls
+    6. Test that the rate, the tokens left and the tokens acquired are exported
+    """
+
+    def limiter(self, **kwargs):
+        return RateLimiter("test", redis_url=None, **{"rate": 10, "burst": 5, **kwargs})
+
+    def test_burst_then_wait(self):
+        """Tokens beyond the burst are only handed out as the bucket refills"""
+        limiter = self.limiter()
+        for _ in range(5):
+            self.assertEqual(limiter.bucket.take(1)[0], 0)
+        self.assertGreater(limiter.bucket.take(1)[0], 0)
+        with patch("quotes.ratelimit.time.sleep") as sleep:
+            limiter.acquire()
+        self.assertTrue(sleep.called)
+
+    def test_large_request_is_chunked(self):
+        """Asking for more than the burst does not wait forever"""
+        limiter = self.limiter(rate=1000)
+        self.assertGreaterEqual(limiter.acquire(12), 0)
+        self.assertEqual(limiter.snapshot()["acquired"], 12)
+
+    def test_adaptive_rate(self):
+        """Failures cut the rate by 30%; a healthy window raises it by 5% of max_rate"""
+        limiter = self.limiter(max_rate=100, min_rate=1, adjust_interval=0)
+        limiter.record(False, 0.01)
+        self.assertAlmostEqual(limiter.bucket.get_rate(), 7)
+        limiter.record(True, 5.0)
+        self.assertAlmostEqual(limiter.bucket.get_rate(), 4.9)
+        limiter.record(True, 0.01)
+        self.assertAlmostEqual(limiter.bucket.get_rate(), 9.9)
+
+    def test_rate_stays_within_bounds(self):
+        """The rate never drops below min_rate"""
+        limiter = self.limiter(min_rate=5, adjust_interval=0)
+        for _ in range(10):
+            limiter.record(False, 0.01)
+        self.assertEqual(limiter.bucket.get_rate(), 5)
+
+    def test_redis_unavailable(self):
+        """An unreachable Redis means a per-process bucket"""
+        limiter = RateLimiter("test", rate=10, redis_url="redis://127.0.0.1:1")
+        self.assertEqual(limiter.snapshot()["backend"], "memory")
+
+    def test_throttle_calls(self):
+        """A block is compared with latency_target per call, not as a whole"""
+        limiter = self.limiter(rate=1000, burst=1000)
+        with patch.object(limiter, "record") as record:
+            with limiter.throttle():
+                pass
+            with limiter.throttle(20):
+                pass
+            with limiter.throttle(1, calls=8):
+                pass
+        self.assertEqual([call.args[2] for call in record.call_args_list], [1, 20, 8])
+
+    def test_metrics(self):
+        limiter = RateLimiter("metrics_test", rate=10, burst=5, redis_url=None)
+        acquired = RATE_LIMIT_ACQUIRED.labels("metrics_test")._value.get()
+        limiter.acquire(3)
+        self.assertEqual(RATE_LIMIT_ACQUIRED.labels("metrics_test")._value.get() - acquired, 3)
+        self.assertAlmostEqual(RATE_LIMIT_TOKENS.labels("metrics_test")._value.get(), 2, places=2)
+        self.assertEqual(RATE_LIMIT_RATE.labels("metrics_test")._value.get(), 10)
+        limiter.adjust_interval = 0
+        limiter.record(False, 0.01)
+        self.assertAlmostEqual(RATE_LIMIT_RATE.labels("metrics_test")._value.get(), 7)
+
+
+class RedisRateLimiterTest(SimpleTestCase):
+    """
+    For the Redis-backed bucket, on a fake Redis running the Lua script, we test the following:
+    1. Test that the bucket allows a burst, makes callers wait and counts what was acquired
+    2. Test that limiters in different processes draw from the same bucket and rate
+    3. Test that the bucket refills from the Redis clock
+    4. Test that a Redis error mid-run falls back to memory, and Redis is used again after the retry interval
+    5. Test that a limiter created while Redis is down starts in memory and moves to Redis once it is back
+    """
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        patcher = patch("quotes.ratelimit.redis.Redis.from_url", self.redis_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def redis_client(self, url: str = "", **kwargs):
+        return fakeredis.FakeRedis(server=self.server)
+
+    def limiter(self, **kwargs):
+        return RateLimiter("test", redis_url="redis://fake", **{"rate": 10, "burst": 5, **kwargs})
+
+    def test_burst_then_wait(self):
+        limiter = self.limiter()
+        self.assertIsInstance(limiter.bucket, RedisBucket)
+        self.assertEqual(limiter.bucket.take(4), (0, 1, 10))
+        wait, tokens, rate = limiter.bucket.take(2)
+        self.assertAlmostEqual(wait, 0.1, places=1)
+        self.assertAlmostEqual(tokens, 1, places=1)
+        state = limiter.snapshot()
+        self.assertEqual(state["backend"], "redis")
+        self.assertEqual(state["acquired"], 4)
+
+    def test_shared(self):
+        first, second = self.limiter(), self.limiter()
+        first.acquire(5)
+        self.assertGreater(second.bucket.take(1)[0], 0)
+        first.bucket.set_rate(20)
+        self.assertEqual(second.bucket.get_rate(), 20)
+        self.assertEqual(second.bucket.take(5)[2], 20)
+
+    def test_refill(self):
+        limiter = self.limiter()
+        limiter.acquire(5)
+        self.assertGreater(limiter.bucket.take(4)[0], 0)
+        # Move the last take half a second back instead of waiting
+        client = self.redis_client()
+        client.hset("ratelimit:test", "ts", float(client.hget("ratelimit:test", "ts")) - 0.5)
+        self.assertEqual(limiter.bucket.take(4)[0], 0)
+
+    def test_error_falls_back(self):
+        limiter = self.limiter(redis_retry_interval=60)
+        with patch.object(limiter.bucket, "script", side_effect=redis.ConnectionError) as script:
+            self.assertEqual(limiter.acquire(1), 0)
+            self.assertEqual(limiter.acquire(1), 0)
+        # Redis is not retried until the interval is over
+        self.assertEqual(script.call_count, 1)
+        self.assertEqual(limiter.snapshot()["backend"], "memory")
+        self.assertEqual(limiter.fallback.rate, 10)
+
+        limiter.fallback_until = 0
+        limiter.acquire(1)
+        state = limiter.snapshot()
+        self.assertEqual(state["backend"], "redis")
+        self.assertEqual(state["acquired"], 1)
+
+    def test_down_at_start(self):
+        self.server.connected = False
+        limiter = self.limiter(redis_retry_interval=60)
+        self.assertIsInstance(limiter.bucket, RedisBucket)
+        self.assertEqual(limiter.acquire(1), 0)
+        self.assertEqual(limiter.snapshot()["backend"], "memory")
+        self.server.connected = True
+        limiter.fallback_until = 0
+        limiter.acquire(1)
+        self.assertEqual(limiter.snapshot()["backend"], "redis")
@@ -0,0 +1,135 @@
+import datetime
+from unittest.mock import patch
+
+from django.core import mail
+from django.test import TestCase, SimpleTestCase
+from django.contrib.auth import get_user_model
+from quotes.models import Book, Quote, DigestRun, PreparedDigest, RecentDigestQuotes
+from quotes.services import (
+    claim_digest_deliveries,
+    get_recent_digest_quote_ids,
+    prepare_digests,
+    record_digest_quotes,
+    sample_digest_quotes,
+    send_prepared_digests,
+    DigestSendError,
+)
+
+User = get_user_model()
+
+
+class RecentDigestQuotesModelTest(SimpleTestCase):
+    """
+    For the ring buffer, we test the following:
+    1. Test that entries older than the window are dropped and a resend replaces the day's entry
+    """
+
+    def test_record(self):
+        """The buffer only keeps the window's digests, one per day"""
+        recent = RecentDigestQuotes(entries=[["2025-01-01", [1, 2, 3]], ["2025-01-05", [4, 5, 6]]])
+        recent.record(datetime.date(2025, 1, 9), [7, 8, 9], since=datetime.date(2025, 1, 3))
+        recent.record(datetime.date(2025, 1, 9), [7, 8, 10], since=datetime.date(2025, 1, 3))
+        self.assertEqual(recent.entries, [["2025-01-05", [4, 5, 6]], ["2025-01-09", [7, 8, 10]]])
+        self.assertEqual(recent.quote_ids(datetime.date(2025, 1, 6)), {7, 8, 10})
+
+
+class RecentDigestQuotesTest(TestCase):
+    """
+    For excluding recently sent quotes from digests, we test the following:
+    1. Test that the sampler skips recent quotes while the user has others
+    2. Test that the sampler falls back to recent quotes for small collections
+    3. Test that consecutive digests rotate through the collection
+    4. Test that a failed batch is not recorded
+    5. Test that tomorrow's digest, prepared before today's is sent, skips today's quotes
+    6. Test that a prepared digest holding quotes sent since it was prepared is rebuilt
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice',
+        )
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        self.quotes = [
+            Quote.objects.create(user=self.user, book=self.book, quote=f"Quote {i}")
+            for i in range(6)
+        ]
+        self.date = datetime.date(2025, 1, 10)
+
+    def ids(self, quotes) -> set[int]:
+        return {quote.id for quote in quotes}
+
+    def test_sampler_skips_recent(self):
+        """Recent quotes are never picked when enough others exist"""
+        recent = self.ids(self.quotes[:3])
+        for _ in range(5):
+            quotes = sample_digest_quotes([self.user.id], {self.user.id: recent})[self.user.id]
+            self.assertEqual(self.ids(quotes), self.ids(self.quotes[3:]))
+
+    def test_sampler_falls_back(self):
+        """A small collection still gets a full digest"""
+        recent = self.ids(self.quotes[:5])
+        quotes = sample_digest_quotes([self.user.id], {self.user.id: recent})[self.user.id]
+        self.assertEqual(len(quotes), 3)
+        self.assertIn(self.quotes[5], quotes)
+
+    def send(self, date: datetime.date) -> None:
+        claim_digest_deliveries([self.user.id], DigestRun.objects.create(), date)
+        prepare_digests([self.user.id], date)
+        send_prepared_digests([self.user.id], date)
+
+    def test_digests_rotate(self):
+        """The second day's digest has none of the first day's quotes"""
+        self.send(self.date)
+        first = set(RecentDigestQuotes.objects.get(user=self.user).quote_ids(self.date))
+        self.send(self.date + datetime.timedelta(days=1))
+        recent = get_recent_digest_quote_ids([self.user.id], self.date + datetime.timedelta(days=2))
+        self.assertEqual(recent[self.user.id], self.ids(self.quotes))
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(RecentDigestQuotes.objects.get(user=self.user).entries), 2)
+
+    def test_failed_batch_not_recorded(self):
+        """Quotes of digests that failed to send stay available"""
+        claim_digest_deliveries([self.user.id], DigestRun.objects.create(), self.date)
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("SMTP down")):
+            with self.assertRaises(DigestSendError):
+                send_prepared_digests([self.user.id], self.date)
+        self.assertFalse(RecentDigestQuotes.objects.exists())
+        record_digest_quotes({}, self.date)
+        self.assertFalse(RecentDigestQuotes.objects.exists())
+
+    def test_prepared_before_late_send(self):
+        """The next day is prepared while today's digest is still waiting for its slot"""
+        tomorrow = self.date + datetime.timedelta(days=1)
+        prepare_digests([self.user.id], self.date)
+        prepare_digests([self.user.id], tomorrow)
+        today_ids = set(PreparedDigest.objects.get(user=self.user, date=self.date).quote_ids)
+        tomorrow_ids = set(PreparedDigest.objects.get(user=self.user, date=tomorrow).quote_ids)
+        self.assertEqual(today_ids | tomorrow_ids, self.ids(self.quotes))
+
+        claim_digest_deliveries([self.user.id], DigestRun.objects.create(), self.date)
+        send_prepared_digests([self.user.id], self.date)
+        claim_digest_deliveries([self.user.id], DigestRun.objects.create(), tomorrow)
+        with patch("quotes.services.sample_digest_quotes") as sample:
+            send_prepared_digests([self.user.id], tomorrow)
+            sample.assert_not_called()
+        self.assertEqual(RecentDigestQuotes.objects.get(user=self.user).quote_ids(self.date), self.ids(self.quotes))
+
+    def test_prepared_digest_sent_since(self):
+        """Quotes sent after the digest was prepared are swapped out at send time"""
+        tomorrow = self.date + datetime.timedelta(days=1)
+        prepare_digests([self.user.id], tomorrow)
+        PreparedDigest.objects.filter(user=self.user).update(quote_ids=[quote.id for quote in self.quotes[:3]])
+        record_digest_quotes({self.user.id: [quote.id for quote in self.quotes[:3]]}, self.date)
+
+        claim_digest_deliveries([self.user.id], DigestRun.objects.create(), tomorrow)
+        send_prepared_digests([self.user.id], tomorrow)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            {quote.quote for quote in self.quotes if quote.quote in mail.outbox[0].body},
+            {quote.quote for quote in self.quotes[3:]},
+        )
@@ -0,0 +1,80 @@
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from quotes.scheduling import compute_send_slot, current_send_slot, digest_date, next_digest_date, refresh_send_slots
+
+User = get_user_model()
+
+WINTER = datetime(2026, 1, 15, 12, 0, tzinfo=dt_timezone.utc)
+SUMMER = datetime(2026, 7, 15, 12, 0, tzinfo=dt_timezone.utc)
+
+
+@override_settings(DIGEST_SEND_TIME="07:30", DIGEST_SLOT_MINUTES=5, DIGEST_SPREAD_MINUTES=60)
+class SendSlotTest(TestCase):
+    """
+    For digest send slots, we test the following:
+    1. Test that the slot is the local send time in UTC, spread by user id
+    2. Test that the slot follows daylight saving time
+    3. Test that users get a slot when they are created or change timezone
+    4. Test that refreshing slots only rewrites users whose slot changed
+    5. Test that refreshed slots are truncated like compute_send_slot on every backend
+    6. Test that digests are dated in the user's timezone, east of UTC on the next UTC day
+    """
+
+    def test_compute_send_slot(self):
+        """07:30 in UTC is slot 90; the user id shifts it by up to an hour"""
+        self.assertEqual(compute_send_slot(60, "UTC", WINTER), 90)
+        self.assertEqual(compute_send_slot(61, "UTC", WINTER), 90)
+        self.assertEqual(compute_send_slot(65, "UTC", WINTER), 91)
+        self.assertEqual(compute_send_slot(119, "UTC", WINTER), 101)
+        # 07:30 in Tokyo is 22:30 UTC the previous day
+        self.assertEqual(compute_send_slot(60, "Asia/Tokyo", WINTER), 270)
+        self.assertEqual(current_send_slot(datetime(2026, 1, 15, 7, 34, tzinfo=dt_timezone.utc)), 90)
+
+    def test_daylight_saving(self):
+        """07:30 in New York is 12:30 UTC in winter and 11:30 UTC in summer"""
+        self.assertEqual(compute_send_slot(60, "America/New_York", WINTER), 150)
+        self.assertEqual(compute_send_slot(60, "America/New_York", SUMMER), 138)
+
+    def test_digest_date(self):
+        """Tokyo's 07:30 digest goes out at 22:30 UTC the day before its date"""
+        tokyo_slot = compute_send_slot(60, "Asia/Tokyo", WINTER)
+        self.assertEqual(digest_date("Asia/Tokyo", tokyo_slot, WINTER), date(2026, 1, 16))
+        self.assertEqual(digest_date("UTC", 90, WINTER), date(2026, 1, 15))
+        self.assertEqual(digest_date("America/New_York", 150, WINTER), date(2026, 1, 15))
+        # The next digests: New York's slot has passed at noon UTC, Tokyo's has not
+        self.assertEqual(next_digest_date("America/New_York", 150, datetime(2026, 1, 15, 12, 31, tzinfo=dt_timezone.utc)), date(2026, 1, 16))
+        self.assertEqual(next_digest_date("Asia/Tokyo", tokyo_slot, WINTER), date(2026, 1, 16))
+        self.assertEqual(next_digest_date("UTC", 90, WINTER), date(2026, 1, 16))
+
+    def test_slot_assigned_on_save(self):
+        """Creating a user or changing their timezone assigns the slot"""
+        user = User.objects.create_user(username="alice", email="alice@example.com", password="pw")
+        self.assertEqual(User.objects.get(pk=user.pk).send_slot, compute_send_slot(user.pk, "UTC"))
+
+        user.timezone = "Asia/Tokyo"
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).send_slot, compute_send_slot(user.pk, "Asia/Tokyo"))
+
+    def test_refresh_send_slots(self):
+        """Only users whose slot moved are updated"""
+        user = User.objects.create_user(username="alice", email="alice@example.com", password="pw",
+                                        timezone="America/New_York")
+        User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+
+        refresh_send_slots(User, WINTER)
+        self.assertEqual(refresh_send_slots(User, WINTER), 0)
+
+        self.assertEqual(refresh_send_slots(User, SUMMER), 1)
+        user.refresh_from_db()
+        self.assertEqual(user.send_slot, compute_send_slot(user.pk, "America/New_York", SUMMER))
+
+    def test_refresh_truncates(self):
+        """The database agrees with compute_send_slot for every offset within a slot"""
+        for i in range(10):
+            User.objects.create_user(username=f"user{i}", email=f"user{i}@example.com", password="pw",
+                                     timezone="America/New_York")
+        refresh_send_slots(User, SUMMER)
+        for user in User.objects.all():
+            self.assertEqual(user.send_slot, compute_send_slot(user.pk, "America/New_York", SUMMER))
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+from django.core.checks import run_checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from quotes.checks import check_production_settings
+from quotesapp.env import env_bool, env_choice, env_int, env_list
+
+
+class EnvTest(SimpleTestCase):
+    """
+    For the typed environment variables, we test the following:
+    1. Test that booleans are parsed, so that "False" is false
+    2. Test that unset or empty variables give the default
+    3. Test that values that cannot be parsed are rejected
+    """
+
+    def test_booleans(self):
+        for value, expected in [("False", False), ("false", False), ("0", False), ("off", False),
+                                ("True", True), ("1", True), ("yes", True)]:
+            with patch.dict("os.environ", {"FLAG": value}):
+                self.assertIs(env_bool("FLAG", not expected), expected)
+
+    def test_defaults(self):
+        with patch.dict("os.environ", {"EMPTY": ""}):
+            self.assertIs(env_bool("EMPTY", True), True)
+            self.assertEqual(env_int("UNSET_VARIABLE", 3), 3)
+            self.assertEqual(env_list("EMPTY", ["*"]), ["*"])
+
+    def test_invalid_values(self):
+        with patch.dict("os.environ", {"FLAG": "maybe", "NUMBER": "ten", "PROFILE": "staging"}):
+            with self.assertRaises(ImproperlyConfigured):
+                env_bool("FLAG", False)
+            with self.assertRaises(ImproperlyConfigured):
+                env_int("NUMBER", 0)
+            with self.assertRaises(ImproperlyConfigured):
+                env_choice("PROFILE", ("dev", "prod"), "dev")
+
+
+class ProductionCheckTest(SimpleTestCase):
+    """
+    For the prod startup self-check, we test the following:
+    1. Test that a prod process with DEBUG on refuses to start
+    2. Test that a prod process with a forced debug cursor refuses to start
+    3. Test that a prod process without a metrics token refuses to start
+    4. Test that the dev profile and a correct prod profile pass
+    5. Test that `manage.py check` reports the problem
+    6. Test that a process that sets neither DJANGO_PROFILE nor DJANGO_DEBUG_MODE gets prod without DEBUG
+    """
+
+    @override_settings(SETTINGS_PROFILE="prod", DEBUG=True)
+    def test_debug_in_prod(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_production_settings()
+
+    @override_settings(SETTINGS_PROFILE="prod", DEBUG=False, METRICS_BEARER_TOKEN="secret")
+    def test_forced_debug_cursor_in_prod(self):
+        with patch.object(connection, "force_debug_cursor", True):
+            with self.assertRaises(ImproperlyConfigured):
+                check_production_settings()
+        check_production_settings()
+
+    @override_settings(SETTINGS_PROFILE="prod", DEBUG=False, METRICS_BEARER_TOKEN="")
+    def test_metrics_token_in_prod(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_production_settings()
+
+    @override_settings(SETTINGS_PROFILE="dev", DEBUG=True, METRICS_BEARER_TOKEN="")
+    def test_dev_allows_debug(self):
+        check_production_settings()
+
+    @override_settings(SETTINGS_PROFILE="prod", DEBUG=True)
+    def test_system_check(self):
+        self.assertIn("quotesapp.E001", [error.id for error in run_checks()])
+
+    def test_unset_profile_is_prod(self):
+        """Deploys that forget the variables are not left with DEBUG on"""
+        env = {**os.environ, "DJANGO_PROFILE": "", "DJANGO_DEBUG_MODE": "", "DJANGO_SECRET_KEY": "secret"}
+        output = subprocess.run(
+            [sys.executable, "-c", "from quotesapp import settings; print(settings.SETTINGS_PROFILE, settings.DEBUG)"],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(output.split(), ["prod", "False"])
@@ -0,0 +1,178 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.test import TestCase, SimpleTestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes import similarity
+from quotes.models import Book, Quote
+from quotes.similarity import SimilarityIndex
+from quotes.services import (
+    create_quote,
+    create_quotes,
+    process_outbox,
+    rebuild_similarity_indexes,
+    restore_quotes,
+    soft_delete_quotes,
+)
+
+User = get_user_model()
+
+
+class TemporaryIndexDirMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(SIMILAR_QUOTES_INDEX_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class SimilarityIndexTest(TemporaryIndexDirMixin, SimpleTestCase):
+    """
+    For the similarity index itself, we test the following:
+    1. Test that quotes sharing more (and rarer) words rank first and the quote itself is left out
+    2. Test that several quotes are answered in one batch and unknown ids get nothing
+    3. Test that updates add, replace and remove rows
+    4. Test that a saved index is memory-mapped back and remapped once replaced
+    5. Test that quotes without any feature get no results
+    """
+
+    quotes = [
+        (1, "The quick brown fox jumps over the lazy dog"),
+        (2, "A quick brown fox ran away"),
+        (3, "The lazy dog sleeps all day"),
+        (4, "Premature optimization is the root of all evil"),
+        (5, "!!!"),
+    ]
+
+    def test_ranking(self):
+        """Overlapping quotes rank by cosine similarity"""
+        index = SimilarityIndex.from_quotes(self.quotes)
+        results = index.similar([1], limit=5)[1]
+        self.assertEqual([quote_id for quote_id, _ in results], [2, 3])
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertLess(scores[0], 1.0)
+        self.assertEqual(len(index.similar([1], limit=1)[1]), 1)
+
+    def test_batch(self):
+        """Every query is answered from the same scoring pass"""
+        index = SimilarityIndex.from_quotes(self.quotes)
+        results = index.similar([1, 3, 5, 99], limit=2)
+        self.assertEqual([quote_id for quote_id, _ in results[1]], [2, 3])
+        self.assertEqual(results[3][0][0], 1)
+        self.assertEqual(results[5], [])
+        self.assertEqual(results[99], [])
+
+    def test_no_features(self):
+        """Stop words and non-ASCII text alone leave nothing to compare"""
+        index = SimilarityIndex.from_quotes([(1, "To be or not to be"), (2, "Binary search…"), (3, "Ça ß")])
+        self.assertEqual(index.similar([1], limit=5), {1: []})
+        self.assertEqual(index.similar([1, 3], limit=5), {1: [], 3: []})
+        self.assertEqual(SimilarityIndex.from_quotes([(1, "!!!")]).similar([1], limit=5), {1: []})
+
+    def test_updated(self):
+        """Updated indexes match indexes built from scratch"""
+        index = SimilarityIndex.from_quotes(self.quotes[:3]).updated(
+            added=[(4, "Premature optimization is the root of all evil"), (2, "Brown dogs everywhere")],
+            removed=[3],
+        )
+        expected = SimilarityIndex.from_quotes([self.quotes[0], (2, "Brown dogs everywhere"), self.quotes[3]])
+        np.testing.assert_array_equal(index.ids, [1, 2, 4])
+        np.testing.assert_array_equal(index.indices, expected.indices)
+        np.testing.assert_allclose(index.weights, expected.weights)
+
+    def test_save_and_load(self):
+        """The index is mapped from its file and a replaced file is picked up"""
+        path = similarity.index_path(7)
+        SimilarityIndex.from_quotes(self.quotes).save(path)
+        index = similarity.get_index(7)
+        self.assertIsInstance(index.weights.base, np.memmap)
+        self.assertIs(similarity.get_index(7), index)
+        self.assertEqual(index.similar([1], limit=5), SimilarityIndex.from_quotes(self.quotes).similar([1], limit=5))
+
+        SimilarityIndex.from_quotes(self.quotes[:2]).save(path)
+        self.assertEqual(len(similarity.get_index(7)), 2)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["7.qsim"])
+        self.assertIsNone(similarity.get_index(8))
+
+
+class SimilarQuotesTest(TemporaryIndexDirMixin, TestCase):
+    """
+    For similar quotes in the app, we test the following:
+    1. Test that creating, soft deleting and restoring quotes update the index through the outbox
+    2. Test that the quote page lists similar quotes
+    3. Test that the rebuild writes every index but keeps ones updated meanwhile
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        super().setUp()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice'
+        )
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+
+    def indexed_ids(self) -> list[int]:
+        return similarity.get_index(self.user.id).ids.tolist()
+
+    def test_incremental_updates(self):
+        """The index follows the quote services once the outbox is processed"""
+        first = create_quote("Binary search halves the list", self.book, None, None, None, self.user).quote
+        process_outbox()
+        self.assertEqual(self.indexed_ids(), [first.id])
+        second, third = [
+            result.quote for result in create_quotes([
+                {"quote": "Binary search needs a sorted list", "book_id": self.book.id},
+                {"quote": "Recursion needs a base case", "book_id": self.book.id},
+            ], self.user)
+        ]
+        process_outbox()
+        self.assertEqual(self.indexed_ids(), [first.id, second.id, third.id])
+        soft_delete_quotes(self.user, [second.id])
+        process_outbox()
+        self.assertEqual(self.indexed_ids(), [first.id, third.id])
+        restore_quotes(self.user, [second.id])
+        process_outbox()
+        self.assertEqual(self.indexed_ids(), [first.id, second.id, third.id])
+
+    def test_quote_page(self):
+        """The quote page shows the user's similar quotes"""
+        quote = create_quote("Binary search halves the list", self.book, None, None, None, self.user).quote
+        create_quote("Binary search needs a sorted list", self.book, None, None, None, self.user)
+        create_quote("Recursion needs a base case", self.book, None, None, None, self.user)
+        process_outbox()
+        self.client.login(username="alice", password="pw")
+        response = self.client.get(reverse("quotes:quote_detail", args=[quote.id]))
+        self.assertContains(response, "More like this")
+        self.assertEqual([similar.quote for similar in response.context["similar_quotes"]], ["Binary search needs a sorted list"])
+
+        stop_words = create_quote("To be or not to be", self.book, None, None, None, self.user).quote
+        process_outbox()
+        response = self.client.get(reverse("quotes:quote_detail", args=[stop_words.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["similar_quotes"], [])
+
+    def test_rebuild(self):
+        """Indexes are rebuilt from the quotes, except ones updated after the read"""
+        Quote.objects.create(user=self.user, book=self.book, quote="Added in the admin")
+        other_user = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        self.assertEqual(rebuild_similarity_indexes(block_size=1), 1)
+        self.assertEqual(len(self.indexed_ids()), 1)
+        self.assertIsNone(similarity.get_index(other_user.id))
+
+        # An index written after its block was read is left alone
+        path = similarity.index_path(self.user.id)
+        SimilarityIndex.from_quotes([]).save(path)
+        future = time.time() + 60
+        os.utime(path, (future, future))
+        rebuild_similarity_indexes()
+        self.assertEqual(self.indexed_ids(), [])
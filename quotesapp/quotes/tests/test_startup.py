@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.template import engines
+from django.test import TestCase
+from django.urls import clear_url_caches, get_resolver
+from quotes.management.commands.profile_startup import parse_importtime
+from quotesapp.warmup import WARMUP_TEMPLATES, warm_up, warmup_enabled
+
+
+class StartupTest(TestCase):
+    """
+    For startup profiling and warmup, we test the following:
+    1. Test that -X importtime output is parsed into self and cumulative times per module
+    2. Test that the warmup populates the URL resolver and compiles exactly the warmup templates
+    3. Test that DJANGO_WARMUP is read with the same boolean rules as the settings
+    """
+
+    def test_parse_importtime(self):
+        """Header and unrelated lines are skipped"""
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   email.utils\n"
+            "import time:      1500 |       1620 | email\n"
+            "Some other stderr line\n"
+        )
+        self.assertEqual(parse_importtime(output), {
+            "email.utils": (120, 120),
+            "email": (1500, 1620),
+        })
+
+    def test_warm_up(self):
+        """Starting from cold caches, the warmup fills each of them"""
+        loader = engines["django"].engine.template_loaders[0]
+        loader.reset()
+        clear_url_caches()
+        self.assertFalse(get_resolver()._populated)
+
+        self.assertGreater(warm_up(), 0)
+        self.assertTrue(get_resolver()._populated)
+        self.assertEqual(sorted(loader.get_template_cache), sorted(WARMUP_TEMPLATES))
+        self.assertEqual(len(loader.get_template_cache), 5)
+
+    def test_warmup_enabled(self):
+        """Unset or empty is off, booleans are parsed like env_bool, anything else is an error"""
+        for value, expected in (("", False), ("on", True), ("1", True), ("False", False), ("no", False)):
+            with patch.dict("os.environ", {"DJANGO_WARMUP": value}):
+                self.assertEqual(warmup_enabled(), expected, value)
+        with patch.dict("os.environ", {"DJANGO_WARMUP": "maybe"}):
+            with self.assertRaises(ImproperlyConfigured):
+                warmup_enabled()
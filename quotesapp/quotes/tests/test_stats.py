@@ -0,0 +1,193 @@
+import datetime
+
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes.models import Book, OutboxEvent, Quote, UserQuoteStats
+from quotes import outbox
+from quotes.services import (
+    build_prepared_digests,
+    create_quote,
+    create_quotes,
+    process_outbox,
+    restore_quotes,
+    soft_delete_quotes,
+    sync_user_quote_stats,
+)
+from quotes.stats import apply_user_quote_stats_changes, reconcile_user_quote_stats
+
+User = get_user_model()
+
+
+class UserQuoteStatsTest(TestCase):
+    """
+    For the per-user quote stats, we test the following:
+    1. Test that creating quotes, one by one or in a batch, updates the stats through the outbox
+    2. Test that soft deleting and restoring quotes updates the stats, and a quote deleted twice is counted out once
+    3. Test that moving a quote to another book in the update view updates the stats
+    4. Test that replayed events, and events written without stats fields, are recomputed rather than applied again
+    5. Test that reconciliation creates missing stats and fixes drifted ones
+    6. Test that reconciliation leaves alone the users whose changes are still in the outbox
+    7. Test that changes are folded into the stats in a constant number of queries
+    8. Test that the outbox consumer handles a batch of one user's events in a constant number of queries
+    9. Test that the stats page reads a single stats row
+    10. Test that the digest mentions the size of the collection
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice'
+        )
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        self.other_book = Book.objects.create(title="SICP", author="Abelson")
+
+    def stats(self):
+        process_outbox()
+        return UserQuoteStats.objects.get(user=self.user)
+
+    def test_create(self):
+        """Quote and book counts follow creates; duplicates are not counted"""
+        create_quote("Hello", self.book, None, None, None, self.user)
+        create_quote("Hello", self.book, None, None, None, self.user)
+        create_quotes([
+            {"quote": "World", "book_id": self.other_book.id},
+            {"quote": "Again", "title": "New Book", "author": "Bhargava"},
+        ], self.user)
+        self.assertFalse(UserQuoteStats.objects.filter(user=self.user).exists())
+        stats = self.stats()
+        self.assertEqual(stats.quote_count, 3)
+        self.assertEqual(stats.book_count, 3)
+        self.assertEqual(stats.top_authors(), [("Bhargava", 2), ("Abelson", 1)])
+        month = datetime.date.today().strftime("%Y-%m")
+        self.assertEqual(stats.quotes_per_month(), [(month, 3)])
+
+    def test_soft_delete_and_restore(self):
+        """Deleted quotes leave the stats and restored ones come back"""
+        first = create_quote("Hello", self.book, None, None, None, self.user).quote
+        second = create_quote("World", self.other_book, None, None, None, self.user).quote
+        self.assertEqual(soft_delete_quotes(self.user, [first.id, second.id, second.id]), 2)
+        stats = self.stats()
+        self.assertEqual((stats.quote_count, stats.book_count), (0, 0))
+        self.assertEqual(stats.author_counts, {})
+        soft_delete_quotes(self.user, [first.id])
+        self.assertEqual(self.stats().quote_count, 0)
+        restore_quotes(self.user, [second.id])
+        self.assertEqual(self.stats().author_counts, {"Abelson": 1})
+
+    def test_soft_delete_once(self):
+        """One UPDATE returns the deleted rows; deleting them again records no event"""
+        quote = create_quote("Hello", self.book, None, None, None, self.user).quote
+        other_user = User.objects.create_user(username='bob', password='pw')
+        other = create_quote("Hello", self.book, None, None, None, other_user).quote
+        events = OutboxEvent.objects.filter(topic=OutboxEvent.QUOTE_DELETED)
+        with self.assertNumQueries(4):
+            self.assertEqual(soft_delete_quotes(self.user, [quote.id, other.id]), 1)
+        self.assertEqual(list(events.values_list("object_id", "payload")), [
+            (quote.id, {"book_id": self.book.id, "author": "Bhargava", "month": quote.created_at.strftime("%Y-%m")}),
+        ])
+        self.assertEqual(soft_delete_quotes(self.user, [quote.id]), 0)
+        self.assertEqual(events.count(), 1)
+        self.assertEqual(self.stats().quote_count, 0)
+
+    def test_update_moves_book(self):
+        """Moving a quote to another book moves it in the stats"""
+        quote = create_quote("Hello", self.book, None, None, None, self.user).quote
+        self.client.login(username="alice", password="pw")
+        self.client.post(reverse("quotes:quote_edit", args=[quote.id]), {"quote": "Hello", "book": self.other_book.id})
+        stats = self.stats()
+        self.assertEqual(stats.book_counts, {str(self.other_book.id): 1})
+        self.assertEqual(stats.author_counts, {"Abelson": 1})
+
+    def test_replay(self):
+        """Replayed events are not applied twice: their users are recomputed"""
+        quote = create_quote("Hello", self.book, None, None, None, self.user).quote
+        soft_delete_quotes(self.user, [quote.id])
+        restore_quotes(self.user, [quote.id])
+        stats = self.stats()
+        self.assertEqual(outbox.replay(from_id=0), 3)
+        self.assertEqual(self.stats().author_counts, stats.author_counts)
+        self.assertEqual(self.stats().quote_count, 1)
+
+    def test_events_without_stats_fields(self):
+        """Events written before they carried the stats fields still count"""
+        create_quote("Hello", self.book, None, None, None, self.user)
+        create_quote("World", self.other_book, None, None, None, self.user)
+        OutboxEvent.objects.filter(object_id=Quote.objects.get(quote="Hello").id).update(payload={})
+        stats = self.stats()
+        self.assertEqual(stats.quote_count, 2)
+        self.assertEqual(stats.author_counts, {"Bhargava": 1, "Abelson": 1})
+
+    def test_batch_queries(self):
+        """The handler reads and writes the stats once per batch, not once per quote"""
+        create_quotes([{"quote": f"Quote {i}", "book_id": self.book.id} for i in range(50)], self.user)
+        events = list(OutboxEvent.objects.order_by("id"))
+        # insert of the missing rows, locked read, update, plus the savepoint pair
+        with self.assertNumQueries(5):
+            sync_user_quote_stats(events)
+        stats = UserQuoteStats.objects.get(user=self.user)
+        self.assertEqual(stats.quote_count, 50)
+        self.assertEqual(stats.book_counts, {str(self.book.id): 50})
+
+    def test_reconcile(self):
+        """Quotes changed behind the services' back are picked up"""
+        create_quote("Hello", self.book, None, None, None, self.user)
+        process_outbox()
+        Quote.objects.create(user=self.user, book=self.other_book, quote="Added in the admin")
+        other_user = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        Quote.objects.create(user=other_user, book=self.book, quote="No stats yet")
+        self.assertEqual(reconcile_user_quote_stats(UserQuoteStats, Quote, User, block_size=1), 2)
+        self.assertEqual(UserQuoteStats.objects.get(user=self.user).quote_count, 2)
+        self.assertEqual(UserQuoteStats.objects.get(user=other_user).author_counts, {"Bhargava": 1})
+        self.assertEqual(reconcile_user_quote_stats(UserQuoteStats, Quote, User), 0)
+
+    def test_reconcile_skips_pending(self):
+        """A quote whose event is not applied yet would otherwise be counted twice"""
+        create_quote("Hello", self.book, None, None, None, self.user)
+        pending = outbox.pending_events()
+        self.assertEqual(reconcile_user_quote_stats(UserQuoteStats, Quote, User, pending_events=pending), 0)
+        self.assertFalse(UserQuoteStats.objects.exists())
+        self.assertEqual(self.stats().quote_count, 1)
+        self.assertEqual(reconcile_user_quote_stats(UserQuoteStats, Quote, User, pending_events=pending), 0)
+
+    def test_apply_changes(self):
+        """Additions and removals are summed per user, and emptied keys dropped"""
+        other_user = User.objects.create_user(username="bob", email="bob@example.com", password="pw")
+        changes = [(self.user.id, self.book.id, "Bhargava", "2025-01", 1)] * 30 + [
+            (self.user.id, self.book.id, "Bhargava", "2025-01", -1),
+            (self.user.id, self.other_book.id, "Abelson", "2025-02", 1),
+            (self.user.id, self.other_book.id, "Abelson", "2025-02", -1),
+            (other_user.id, self.other_book.id, "Abelson", "2025-02", 1),
+        ]
+        # insert of the missing rows, locked read, update, plus the savepoint pair
+        with self.assertNumQueries(5):
+            apply_user_quote_stats_changes(UserQuoteStats, changes)
+        stats = UserQuoteStats.objects.get(user=self.user)
+        self.assertEqual((stats.quote_count, stats.book_count), (29, 1))
+        self.assertEqual(stats.book_counts, {str(self.book.id): 29})
+        self.assertEqual(stats.author_counts, {"Bhargava": 29})
+        self.assertEqual(stats.month_counts, {"2025-01": 29})
+        self.assertEqual(UserQuoteStats.objects.get(user=other_user).author_counts, {"Abelson": 1})
+
+    def test_stats_page(self):
+        """The page reads the stats row, whatever the size of the collection"""
+        create_quotes([{"quote": f"Quote {i}", "book_id": self.book.id} for i in range(20)], self.user)
+        process_outbox()
+        self.client.login(username="alice", password="pw")
+        self.client.get(reverse("quotes:quote_stats"))
+        # session, user, stats, most viewed quotes
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("quotes:quote_stats"))
+        self.assertContains(response, "20 quotes from 1 book")
+        self.assertContains(response, "Bhargava")
+
+    def test_digest_mentions_collection(self):
+        """The prepared digest includes the collection size"""
+        create_quote("Hello", self.book, None, None, None, self.user)
+        process_outbox()
+        digest, = build_prepared_digests([self.user.id], datetime.date(2025, 1, 1))
+        self.assertIn("Your collection holds 1 quote from 1 book.", digest.body)
@@ -0,0 +1,96 @@
+import zlib
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes.models import Book, Quote
+
+User = get_user_model()
+
+
+@override_settings(QUOTE_LIST_STREAMING=True, QUOTE_LIST_STREAM_CHUNK_SIZE=2)
+class StreamingQuoteListTest(TestCase):
+    """
+    For the streamed quote list page, we test the following:
+    1. Test that the header comes first, then the user's rows in chunks, then the footer
+    2. Test that an empty list streams the empty page
+    3. Test that the header carries the messages and the CSRF cookie is set
+    4. Test that clients accepting gzip get chunks that decompress one by one
+    5. Test that the page is rendered whole when streaming is off
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice'
+        )
+        other = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        Quote.objects.create(user=other, book=self.book, quote="Not mine")
+        self.client.login(username="alice", password="pw")
+
+    def get(self, **kwargs):
+        response = self.client.get(reverse("quotes:quotes_list"), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_chunks(self):
+        """Five quotes in chunks of two: header, three chunks of rows, footer"""
+        for i in range(5):
+            Quote.objects.create(user=self.user, book=self.book, quote=f"Quote {i}")
+        chunks = [chunk.decode() for chunk in self.get().streaming_content]
+        self.assertEqual(len(chunks), 5)
+        self.assertIn("All Book Quotes", chunks[0])
+        self.assertNotIn("<li>", chunks[0])
+        self.assertEqual([chunk.count("<li>") for chunk in chunks[1:4]], [2, 2, 1])
+        self.assertIn("Delete selected", chunks[-1])
+        page = "".join(chunks)
+        self.assertTrue(all(f"Quote {i}" in page for i in range(5)))
+        self.assertNotIn("Not mine", page)
+
+    def test_empty(self):
+        header, footer = [chunk.decode() for chunk in self.get().streaming_content]
+        self.assertIn("No quotes found", footer)
+        self.assertNotIn("Delete selected", footer)
+
+    def test_messages_and_csrf(self):
+        """Both are settled before the response leaves the view"""
+        quote = Quote.objects.create(user=self.user, book=self.book, quote="Hello")
+        self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": [quote.id]})
+        response = self.get()
+        self.assertIn("csrftoken", response.cookies)
+        header = next(iter(response.streaming_content)).decode()
+        self.assertIn("Deleted 1 quote(s).", header)
+        self.assertIn('name="csrfmiddlewaretoken"', header)
+        header = next(iter(self.get().streaming_content)).decode()
+        self.assertNotIn("Deleted 1 quote(s).", header)
+
+    def test_gzip(self):
+        Quote.objects.create(user=self.user, book=self.book, quote="Hello")
+        response = self.get(headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        chunks = [decompressor.decompress(chunk).decode() for chunk in response.streaming_content]
+        self.assertIn("All Book Quotes", chunks[0])
+        self.assertIn("Hello", chunks[1])
+        self.assertTrue(decompressor.eof)
+
+        response = self.get()
+        self.assertFalse(response.has_header("Content-Encoding"))
+        with self.settings(QUOTE_LIST_STREAM_GZIP=False):
+            response = self.get(headers={"Accept-Encoding": "gzip"})
+            self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_not_streaming(self):
+        Quote.objects.create(user=self.user, book=self.book, quote="Hello")
+        with self.settings(QUOTE_LIST_STREAMING=False):
+            response = self.client.get(reverse("quotes:quotes_list"))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "Hello")
+        self.assertContains(response, "Delete selected")
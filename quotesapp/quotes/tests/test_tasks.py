@@ -0,0 +1,252 @@
+import datetime
+from unittest.mock import patch
+
+from django.core import mail
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from quotes.models import Book, Quote, DigestRun, DigestDelivery, PreparedDigest, RecentDigestQuotes
+from quotes.services import claim_digest_deliveries, get_due_send_slots, DigestSendError
+from quotes.tasks import (
+    create_email_tasks,
+    prepare_digests_task,
+    send_email_task,
+    prepare_digest_block_task,
+    send_digest_batch_task,
+)
+
+User = get_user_model()
+
+
+class DigestTaskTest(TestCase):
+    """
+    For the digest tasks, we test the following:
+    1. Test that the fan-out creates a digest run and enqueues the users in the slot
+    2. Test that sent and skipped emails are counted on the digest run
+    3. Test that a failed send is counted and re-raised
+    4. Test that a double-fired fan-out does not enqueue anyone twice
+    5. Test that a redelivered send task does not email twice, but a failed one can be retried
+    6. Test that prepared digests are rendered ahead of time and streamed by the send stage
+    7. Test that the send stage builds digests that were not prepared
+    8. Test that a failed batch releases its claims, is retried and records the failure once retries are used up
+    9. Test that a batch that fails once is sent by its retry
+    10. Test that digests whose quotes were deleted are rebuilt and go to the current email address
+    11. Test that the fan-out catches up on every slot of the day that no run handled
+    12. Test that digests are claimed, prepared and recorded under the user's local date
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice',
+        )
+        self.user_without_quotes = User.objects.create_user(
+            username='bob',
+            email='bob@example.com',
+            password='pw'
+        )
+        book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        for i in range(3):
+            Quote.objects.create(user=self.user, book=book, quote=f"Quote {i}")
+
+    def test_create_email_tasks(self):
+        """One task per user id in the due slot is enqueued against a new digest run"""
+        User.objects.filter(pk=self.user_without_quotes.pk).update(send_slot=self.user.send_slot + 1)
+        with patch("quotes.tasks.send_digest_batch_task.delay") as delay:
+            create_email_tasks(self.user.send_slot)
+        run = DigestRun.objects.get()
+        self.assertEqual((run.send_slot, run.total_users), (self.user.send_slot, 1))
+        delay.assert_called_once_with([self.user.id], run.id, timezone.now().date().isoformat())
+
+    def test_missed_slots(self):
+        """The 00:05 tick was missed: the 00:10 tick sends slots 1 and 2"""
+        now = datetime.datetime(2026, 1, 15, 0, 12, tzinfo=datetime.timezone.utc)
+        User.objects.filter(pk=self.user.pk).update(send_slot=1)
+        User.objects.filter(pk=self.user_without_quotes.pk).update(send_slot=2)
+        DigestRun.objects.create(send_slot=0)
+        # Runs of the previous day do not count
+        DigestRun.objects.filter(send_slot=0).update(started_at=now - datetime.timedelta(hours=1))
+        with patch("django.utils.timezone.now", return_value=now):
+            self.assertEqual(get_due_send_slots(), [0, 1, 2])
+            with patch("quotes.tasks.send_digest_batch_task.delay") as delay:
+                create_email_tasks()
+                create_email_tasks()
+            self.assertEqual(get_due_send_slots(), [0])
+        self.assertEqual(
+            [call.args for call in delay.call_args_list],
+            [([self.user.id], DigestRun.objects.get(send_slot=1).id, "2026-01-15"),
+             ([self.user_without_quotes.id], DigestRun.objects.get(send_slot=2).id, "2026-01-15")],
+        )
+
+    def test_create_email_tasks_empty_slot(self):
+        """Nothing is recorded for a slot without users"""
+        User.objects.update(send_slot=0)
+        with patch("quotes.tasks.send_digest_batch_task.delay") as delay:
+            create_email_tasks(1)
+        delay.assert_not_called()
+        self.assertFalse(DigestRun.objects.exists())
+
+    def test_send_email_task_records_outcomes(self):
+        """Sent and skipped digests are counted on the run"""
+        run = DigestRun.objects.create(total_users=2)
+        send_email_task(self.user.id, run.id)
+        send_email_task(self.user_without_quotes.id, run.id)
+        run.refresh_from_db()
+        self.assertEqual((run.sent, run.skipped, run.failed), (1, 1, 0))
+        self.assertTrue(run.is_complete)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Dear Alice", mail.outbox[0].body)
+
+    def test_send_email_task_records_failure(self):
+        """A failing send is counted and the error propagates"""
+        run = DigestRun.objects.create(total_users=1)
+        with patch("quotes.tasks.find_quotes_and_send_email", side_effect=RuntimeError("SMTP down")):
+            with self.assertRaises(RuntimeError):
+                send_email_task(self.user.id, run.id)
+        run.refresh_from_db()
+        self.assertEqual(run.failed, 1)
+
+    def test_double_fired_fan_out_is_deduplicated(self):
+        """The second run for the same slot and day finds everyone in the ledger"""
+        User.objects.update(send_slot=5)
+        with patch("quotes.tasks.send_digest_batch_task.delay") as delay:
+            create_email_tasks(5)
+            create_email_tasks(5)
+        delay.assert_called_once()
+        self.assertEqual(sorted(delay.call_args.args[0]), [self.user.id, self.user_without_quotes.id])
+        first_run, second_run = DigestRun.objects.order_by("id")
+        self.assertEqual((first_run.total_users, first_run.duplicates), (2, 0))
+        self.assertEqual((second_run.total_users, second_run.duplicates), (0, 2))
+        self.assertEqual(DigestDelivery.objects.count(), 2)
+
+    def test_send_email_task_is_idempotent(self):
+        """A second delivery of the same task is skipped; a failed send can be retried"""
+        today = timezone.now().date()
+        run = DigestRun.objects.create(total_users=1)
+        DigestDelivery.objects.create(user=self.user, date=today, run=run)
+
+        with patch("quotes.tasks.find_quotes_and_send_email", side_effect=RuntimeError("SMTP down")):
+            with self.assertRaises(RuntimeError):
+                send_email_task(self.user.id, run.id, today.isoformat())
+        self.assertIsNone(DigestDelivery.objects.get().sent_at)
+
+        send_email_task(self.user.id, run.id, today.isoformat())
+        send_email_task(self.user.id, run.id, today.isoformat())
+        run.refresh_from_db()
+        self.assertEqual((run.sent, run.failed, run.duplicates), (1, 1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def claim_today(self):
+        today = timezone.now().date()
+        run = DigestRun.objects.create(total_users=2)
+        claim_digest_deliveries([self.user.id, self.user_without_quotes.id], run, today)
+        return run, today
+
+    def test_prepared_digests_are_sent(self):
+        """The send stage streams the prepared messages and clears the staging table"""
+        run, today = self.claim_today()
+        prepare_digest_block_task([self.user.id, self.user_without_quotes.id], today.isoformat())
+        prepared = PreparedDigest.objects.get(user=self.user)
+        self.assertEqual(len(prepared.quote_ids), 3)
+        self.assertIn("Dear Alice", prepared.body)
+        self.assertEqual(PreparedDigest.objects.get(user=self.user_without_quotes).quote_ids, [])
+
+        with patch("quotes.services.sample_digest_quotes") as sample:
+            send_digest_batch_task([self.user.id, self.user_without_quotes.id], run.id, today.isoformat())
+            sample.assert_not_called()
+        run.refresh_from_db()
+        self.assertEqual((run.sent, run.skipped, run.failed), (1, 1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, prepared.subject)
+        self.assertFalse(PreparedDigest.objects.exists())
+
+        # Redelivering the batch sends nothing
+        send_digest_batch_task([self.user.id, self.user_without_quotes.id], run.id, today.isoformat())
+        run.refresh_from_db()
+        self.assertEqual(run.duplicates, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_unprepared_digests_are_built_on_send(self):
+        """Users without a prepared digest still get one"""
+        run, today = self.claim_today()
+        send_digest_batch_task([self.user.id], run.id, today.isoformat())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Grokking Algorithms - Bhargava", mail.outbox[0].body)
+
+    def test_failed_batch_releases_claims(self):
+        """A failed send leaves the ledger open for a retry"""
+        run, today = self.claim_today()
+        prepare_digest_block_task([self.user.id, self.user_without_quotes.id], today.isoformat())
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("SMTP down")) as send:
+            result = send_digest_batch_task.apply(args=[[self.user.id, self.user_without_quotes.id], run.id, today.isoformat()])
+        self.assertIsInstance(result.result, DigestSendError)
+        self.assertEqual(send.call_count, 4)
+        run.refresh_from_db()
+        # Only the user with quotes had a digest to send
+        self.assertEqual((run.sent, run.skipped, run.failed), (0, 1, 1))
+        self.assertTrue(run.is_complete)
+        self.assertEqual(DigestDelivery.objects.get(sent_at__isnull=True).user, self.user)
+        # The failed digest is kept for the retries
+        self.assertEqual(list(PreparedDigest.objects.values_list("user", flat=True)), [self.user.id])
+
+    def test_failed_batch_retried(self):
+        run, today = self.claim_today()
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=[OSError("SMTP down"), 1]):
+            result = send_digest_batch_task.apply(args=[[self.user.id, self.user_without_quotes.id], run.id, today.isoformat()])
+        self.assertTrue(result.successful())
+        run.refresh_from_db()
+        self.assertEqual((run.sent, run.skipped, run.failed, run.duplicates), (1, 1, 0, 0))
+        self.assertFalse(DigestDelivery.objects.filter(sent_at__isnull=True).exists())
+        self.assertFalse(PreparedDigest.objects.exists())
+
+    def test_stale_prepared_digest(self):
+        """A digest prepared the evening before is checked again when sent"""
+        run, today = self.claim_today()
+        prepare_digest_block_task([self.user.id], today.isoformat())
+        deleted = Quote.objects.filter(user=self.user).first()
+        Quote.objects.filter(id=deleted.id).update(deleted_at=timezone.now())
+        User.objects.filter(id=self.user.id).update(email="alice@example.org")
+        User.objects.filter(id=self.user_without_quotes.id).update(email="")
+        Quote.objects.create(user=self.user_without_quotes, book=deleted.book, quote="Bob's quote")
+
+        send_digest_batch_task([self.user.id, self.user_without_quotes.id], run.id, today.isoformat())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["alice@example.org"])
+        self.assertNotIn(deleted.quote, mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].body.count("Quote "), 2)
+        run.refresh_from_db()
+        self.assertEqual((run.sent, run.skipped, run.failed), (1, 1, 0))
+
+
+    def test_local_dates(self):
+        """Alice in Tokyo and Bob in UTC share a slot at 22:30 UTC, a day apart"""
+        now = datetime.datetime(2026, 1, 15, 22, 0, tzinfo=datetime.timezone.utc)
+        User.objects.filter(pk=self.user.pk).update(timezone="Asia/Tokyo", send_slot=270)
+        User.objects.filter(pk=self.user_without_quotes.pk).update(send_slot=270)
+        with patch("django.utils.timezone.now", return_value=now):
+            with patch("quotes.tasks.prepare_digest_block_task.delay") as delay:
+                prepare_digests_task()
+            self.assertEqual(
+                [call.args for call in delay.call_args_list],
+                [([self.user_without_quotes.id], "2026-01-15"), ([self.user.id], "2026-01-16")],
+            )
+            with patch("quotes.tasks.send_digest_batch_task.delay") as delay:
+                create_email_tasks(270)
+        run = DigestRun.objects.get()
+        self.assertEqual(run.total_users, 2)
+        self.assertEqual(
+            [call.args for call in delay.call_args_list],
+            [([self.user_without_quotes.id], run.id, "2026-01-15"), ([self.user.id], run.id, "2026-01-16")],
+        )
+        self.assertEqual(
+            set(DigestDelivery.objects.values_list("user_id", "date")),
+            {(self.user.id, datetime.date(2026, 1, 16)), (self.user_without_quotes.id, datetime.date(2026, 1, 15))},
+        )
+
+        # A digest sent outside the slots is dated in the user's timezone too
+        with patch("django.utils.timezone.now", return_value=now + datetime.timedelta(hours=1)):
+            send_email_task(self.user.id)
+        self.assertEqual(RecentDigestQuotes.objects.get(user=self.user).entries[0][0], "2026-01-16")
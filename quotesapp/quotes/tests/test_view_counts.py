@@ -0,0 +1,145 @@
+from unittest.mock import patch
+
+import fakeredis
+import redis
+from django.db import DatabaseError
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from quotes.models import Book, Quote, QuoteViewCount
+from quotes.services import flush_quote_views, most_viewed_quotes, record_quote_view, soft_delete_quotes
+from quotes.view_counts import REDIS_KEY, RedisViewBuffer, ViewCounter
+
+User = get_user_model()
+
+
+class QuoteViewCountsTest(TestCase):
+    """
+    For the buffered quote view counters, we test the following:
+    1. Test that viewing quotes never writes on the request path; the background round does
+    2. Test that a flush adds to existing counts in batches and drops unknown quotes
+    3. Test that views go back to the buffer when the write fails
+    4. Test that the most viewed quotes skip deleted ones and show on the stats page
+    5. Test that the counter falls back to memory when Redis is unreachable
+    6. Test that views counted in Redis are flushed, and a Redis error mid-run falls back to memory
+    7. Test that the counter goes back to Redis with its in-memory views once Redis answers
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw',
+            first_name='Alice'
+        )
+        self.book = Book.objects.create(title="Grokking Algorithms", author="Bhargava")
+        self.quotes = [
+            Quote.objects.create(user=self.user, book=self.book, quote=f"Quote {i}")
+            for i in range(3)
+        ]
+        self.counter = ViewCounter(None, flush_interval=3600, max_pending=2)
+        counter_patch = patch("quotes.services.get_view_counter", return_value=self.counter)
+        counter_patch.start()
+        self.addCleanup(counter_patch.stop)
+        self.client.login(username="alice", password="pw")
+
+    def views(self) -> dict[int, int]:
+        return dict(QuoteViewCount.objects.values_list("quote_id", "views"))
+
+    def view(self, quote: Quote):
+        return self.client.get(reverse("quotes:quote_detail", args=[quote.id]))
+
+    def test_views_are_buffered(self):
+        """A second quote wakes the background thread up, but the request writes nothing"""
+        for _ in range(3):
+            self.view(self.quotes[0])
+        self.assertFalse(self.counter.wake.is_set())
+        with self.assertNumQueries(0):
+            record_quote_view(self.quotes[1].id)
+        self.assertTrue(self.counter.wake.is_set())
+        self.assertEqual(self.views(), {})
+        self.assertEqual(self.counter.flush_memory(flush_quote_views), 4)
+        self.assertEqual(self.views(), {self.quotes[0].id: 3, self.quotes[1].id: 1})
+        self.assertEqual(self.counter.take(), {})
+
+    def test_flush(self):
+        """Counts accumulate across flushes and batches"""
+        for quote in self.quotes:
+            self.counter.add(quote.id)
+        self.counter.add(10 ** 6)
+        self.assertEqual(flush_quote_views(self.counter), 4)
+        self.counter.buffer.put_back({self.quotes[0].id: 5, self.quotes[2].id: 1})
+        with self.settings(VIEW_COUNTS_FLUSH_BATCH_SIZE=1):
+            self.assertEqual(flush_quote_views(self.counter), 6)
+        self.assertEqual(self.views(), {self.quotes[0].id: 6, self.quotes[1].id: 1, self.quotes[2].id: 2})
+        self.assertEqual(QuoteViewCount.objects.get(quote=self.quotes[1]).user, self.user)
+        self.assertEqual(flush_quote_views(self.counter), 0)
+
+    def test_failed_flush_keeps_views(self):
+        """Views that could not be written are flushed next time"""
+        self.counter.add(self.quotes[0].id)
+        with patch("quotes.services.upsert_quote_views_sql", return_value="SELECT * FROM missing_table"):
+            with self.assertRaises(DatabaseError):
+                flush_quote_views(self.counter)
+        flush_quote_views(self.counter)
+        self.assertEqual(self.views(), {self.quotes[0].id: 1})
+
+    def test_most_viewed(self):
+        """Deleted quotes drop out of the ranking"""
+        self.counter.buffer.put_back({self.quotes[0].id: 2, self.quotes[1].id: 5, self.quotes[2].id: 1})
+        flush_quote_views(self.counter)
+        self.assertEqual(most_viewed_quotes(self.user, 2), [self.quotes[1], self.quotes[0]])
+        self.assertEqual(most_viewed_quotes(self.user, 2)[0].views, 5)
+        soft_delete_quotes(self.user, [self.quotes[1].id])
+        self.assertEqual(most_viewed_quotes(self.user, 5), [self.quotes[0], self.quotes[2]])
+        response = self.client.get(reverse("quotes:quote_stats"))
+        self.assertContains(response, "Most viewed")
+        self.assertContains(response, "(2 views)")
+
+    def test_redis_unavailable(self):
+        """An unreachable Redis means counting in memory"""
+        counter = ViewCounter("redis://127.0.0.1:1", flush_interval=0, max_pending=10)
+        counter.add(self.quotes[0].id)
+        self.assertTrue(counter.in_memory())
+        self.assertEqual(counter.take(), {self.quotes[0].id: 1})
+
+    def redis_counter(self) -> ViewCounter:
+        server = fakeredis.FakeServer()
+        with patch("quotes.view_counts.redis.Redis.from_url", return_value=fakeredis.FakeRedis(server=server)):
+            counter = ViewCounter("redis://fake", flush_interval=3600, max_pending=2)
+        return counter
+
+    def test_redis(self):
+        counter = self.redis_counter()
+        self.assertIsInstance(counter.buffer, RedisViewBuffer)
+        for quote in (self.quotes[0], self.quotes[0], self.quotes[1]):
+            counter.add(quote.id)
+        self.assertFalse(counter.wake.is_set())
+        pending = counter.buffer.client.hgetall(REDIS_KEY)
+        self.assertEqual(pending, {str(self.quotes[0].id).encode(): b"2", str(self.quotes[1].id).encode(): b"1"})
+        self.assertEqual(flush_quote_views(counter), 3)
+        self.assertFalse(counter.buffer.client.exists(REDIS_KEY))
+
+        with patch.object(counter.buffer.client, "hincrby", side_effect=redis.ConnectionError):
+            counter.add(self.quotes[2].id)
+        self.assertTrue(counter.in_memory())
+        self.assertEqual(counter.take(), {self.quotes[2].id: 1})
+
+    def test_reconnect(self):
+        """Views counted while Redis was down are moved there, and the task flushes them"""
+        server = fakeredis.FakeServer()
+        server.connected = False
+        with patch("quotes.view_counts.redis.Redis.from_url", return_value=fakeredis.FakeRedis(server=server)):
+            counter = ViewCounter("redis://fake", flush_interval=3600, max_pending=10)
+            self.assertTrue(counter.in_memory())
+            counter.add(self.quotes[0].id)
+            # Still down: the background round writes the views itself
+            self.assertEqual(counter.flush_memory(flush_quote_views), 1)
+            counter.add(self.quotes[0].id)
+            server.connected = True
+            self.assertEqual(counter.flush_memory(flush_quote_views), 0)
+        self.assertFalse(counter.in_memory())
+        self.assertEqual(flush_quote_views(counter), 1)
+        self.assertEqual(self.views(), {self.quotes[0].id: 2})
@@ -134,6 +134,7 @@ class QuoteListViewTest(TestCase):
     For the quote list view, we test the following:
     1. Test list view scopes to current user - only shows current user's quotes
     2. Test that other users' quotes are not visible
+    3. Test that list rows carry a truncated snippet and the book title, not full quotes
     """
     
     def setUp(self):
@@ -183,4 +184,96 @@ class QuoteListViewTest(TestCase):
         quotes_in_context = list(resp.context["quotes"])
         self.assertEqual(len(quotes_in_context), 1)
         self.assertEqual(quotes_in_context[0].id, q1.id)
-        self.assertEqual(quotes_in_context[0].quote, "Greedy stays greedy.")
+        self.assertEqual(quotes_in_context[0].snippet, "Greedy stays greedy.")
+
+    def test_list_view_renders_lightweight_rows(self):
+        """
+        Long quotes are truncated in the query and rows expose the joined book title.
+        """
+        long_text = "x" * 1000
+        Quote.objects.create(user=self.user1, book=self.book, quote=long_text)
+
+        assert self.client.login(username="alice", password="pw")
+        resp = self.client.get(reverse("quotes:quotes_list"))
+        self.assertEqual(resp.status_code, 200)
+
+        row = list(resp.context["quotes"])[0]
+        self.assertLess(len(row.snippet), len(long_text))
+        self.assertEqual(row.book_title, "Grokking Algorithms")
+        self.assertFalse(hasattr(row, "quote"))
+        self.assertNotContains(resp, long_text)
+        self.assertContains(resp, "Grokking Algorithms")
+
+
+class QuoteBulkDeleteRestoreViewTest(TestCase):
+    """
+    For the bulk soft delete and restore views, we test the following:
+    1. Test bulk delete soft deletes only the current user's selected quotes
+    2. Test bulk restore brings the selected quotes back
+    3. Test bulk restore reports quotes that conflict with a live duplicate
+    4. Test bulk restore only restores one of several deleted copies of the same quote
+    """
+
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='pw'
+        )
+        self.other_user = User.objects.create_user(
+            username='bob',
+            email='bob@example.com',
+            password='pw'
+        )
+        self.book = Book.objects.create(
+            title="Grokking Algorithms",
+            author="Bhargava"
+        )
+        self.quotes = [
+            Quote.objects.create(user=self.user, book=self.book, quote=f"Quote {i}")
+            for i in range(3)
+        ]
+        self.other_quote = Quote.objects.create(user=self.other_user, book=self.book, quote="Not yours")
+        assert self.client.login(username="alice", password="pw")
+
+    def test_bulk_delete(self):
+        """Only the user's selected quotes are soft deleted"""
+        ids = [self.quotes[0].id, self.quotes[1].id, self.other_quote.id]
+        resp = self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": ids}, follow=True)
+        self.assertContains(resp, "Deleted 2 quote(s).")
+        self.assertEqual(list(Quote.objects.filter(user=self.user)), [self.quotes[2]])
+        self.assertTrue(Quote.objects.filter(id=self.other_quote.id).exists())
+
+    def test_bulk_restore(self):
+        """Restoring brings soft deleted quotes back"""
+        ids = [quote.id for quote in self.quotes]
+        self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": ids})
+        resp = self.client.get(reverse("quotes:quotes_deleted"))
+        self.assertEqual(len(resp.context["quotes"]), 3)
+
+        resp = self.client.post(reverse("quotes:quotes_bulk_restore"), {"quote_ids": ids}, follow=True)
+        self.assertContains(resp, "Restored 3 quote(s).")
+        self.assertEqual(Quote.objects.filter(user=self.user).count(), 3)
+
+    def test_bulk_restore_conflict_with_live_quote(self):
+        """A deleted quote is not restored over a live duplicate and is reported"""
+        deleted = self.quotes[0]
+        self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": [deleted.id]})
+        Quote.objects.create(user=self.user, book=self.book, quote=deleted.quote)
+
+        resp = self.client.post(reverse("quotes:quotes_bulk_restore"), {"quote_ids": [deleted.id]}, follow=True)
+        self.assertContains(resp, "Restored 0 quote(s).")
+        self.assertContains(resp, "1 quote(s) could not be restored")
+        self.assertFalse(Quote.objects.filter(id=deleted.id).exists())
+
+    def test_bulk_restore_conflict_within_request(self):
+        """Only one of several deleted copies of the same quote is restored"""
+        first = self.quotes[0]
+        self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": [first.id]})
+        second = Quote.objects.create(user=self.user, book=self.book, quote=first.quote)
+        self.client.post(reverse("quotes:quotes_bulk_delete"), {"quote_ids": [second.id]})
+
+        self.client.post(reverse("quotes:quotes_bulk_restore"), {"quote_ids": [first.id, second.id]})
+        self.assertEqual(Quote.objects.filter(user=self.user, quote=first.quote).count(), 1)
@@ -9,4 +9,8 @@ urlpatterns = [
     path("create/", views.QuoteCreateViewCustomForm.as_view(), name="quote_create"),
     path("<int:pk>/edit/", views.QuoteUpdateView.as_view(), name="quote_edit"),
     path("<int:pk>/delete/", views.QuoteSoftDeleteView.as_view(), name="quote_delete"),
+    path("delete/", views.QuoteBulkSoftDeleteView.as_view(), name="quotes_bulk_delete"),
+    path("deleted/", views.DeletedQuotesListView.as_view(), name="quotes_deleted"),
+    path("deleted/restore/", views.QuoteBulkRestoreView.as_view(), name="quotes_bulk_restore"),
+    path("stats/", views.QuoteStatsView.as_view(), name="quote_stats"),
 ]
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Buffered quote view counters.
+
+Adding one to a counter row on every page view would turn each read into a
+write and a row lock on popular quotes. Views are counted in a buffer instead
+and added to the QuoteViewCount table in batches by the services:
+
+- in Redis, shared by every web process: a hash of quote id -> pending views
+  that flush_quote_views_task drains every VIEW_COUNTS_FLUSH_SECONDS;
+- in memory when Redis is not configured or not reachable: each process keeps
+  its own counts, and a background thread writes them every
+  VIEW_COUNTS_FLUSH_SECONDS, or as soon as they cover VIEW_COUNTS_MAX_PENDING
+  quotes. The same thread tries Redis again each time and, once it answers,
+  moves the counts there. Requests never wait on the database or on Redis
+  coming back.
+
+Pending views are taken out of the buffer before they are written, so a view
+is never counted twice and the loss on a crash is bounded: a web process loses
+at most one interval of its in-memory views, a worker dying mid-flush loses the
+batch it took, and Redis loses what its persistence settings allow. A failed
+write puts the views back.
+"""
+
+import logging
+import threading
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = "quote_views:pending"
+
+
+class MemoryViewBuffer:
+    """Pending views local to this process."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, quote_id: int, n: int = 1) -> None:
+        with self.lock:
+            self.counts[quote_id] += n
+
+    def take(self) -> dict[int, int]:
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+        return dict(counts)
+
+    def put_back(self, counts: dict[int, int]) -> None:
+        with self.lock:
+            self.counts.update(counts)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+class RedisViewBuffer:
+    """Pending views shared by every process through a Redis hash."""
+
+    def __init__(self, client: redis.Redis, key: str):
+        self.client = client
+        self.key = key
+
+    def add(self, quote_id: int, n: int = 1) -> None:
+        self.client.hincrby(self.key, quote_id, n)
+
+    def take(self) -> dict[int, int]:
+        # Read and clear in one transaction so no view is added in between
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.hgetall(self.key)
+        pipeline.delete(self.key)
+        counts, _ = pipeline.execute()
+        return {int(quote_id): int(n) for quote_id, n in counts.items()}
+
+    def put_back(self, counts: dict[int, int]) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for quote_id, n in counts.items():
+            pipeline.hincrby(self.key, quote_id, n)
+        pipeline.execute()
+
+
+class ViewCounter:
+    def __init__(self, redis_url: str|None, flush_interval: float, max_pending: int):
+        self.redis_url = redis_url
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Set to have the background thread flush the in-memory views early
+        self.wake = threading.Event()
+        self.buffer = self._connect()
+        if self.buffer is None:
+            if redis_url:
+                logger.warning("View counter falling back to memory")
+            self.buffer = MemoryViewBuffer()
+
+    def _connect(self) -> RedisViewBuffer|None:
+        if not self.redis_url:
+            return None
+        try:
+            client = redis.Redis.from_url(self.redis_url, socket_connect_timeout=0.5, socket_timeout=0.5)
+            client.ping()
+            return RedisViewBuffer(client, REDIS_KEY)
+        except redis.RedisError:
+            return None
+
+    def _fall_back(self) -> None:
+        logger.warning("View counter falling back to memory")
+        self.buffer = MemoryViewBuffer()
+
+    def in_memory(self) -> bool:
+        return isinstance(self.buffer, MemoryViewBuffer)
+
+    def add(self, quote_id: int) -> None:
+        """Count a view of the quote."""
+        try:
+            self.buffer.add(quote_id)
+        except redis.RedisError:
+            self._fall_back()
+            self.buffer.add(quote_id)
+        if self.in_memory() and len(self.buffer) >= self.max_pending:
+            self.wake.set()
+
+    def take(self) -> dict[int, int]:
+        """Remove and return the pending views by quote id."""
+        try:
+            return self.buffer.take()
+        except redis.RedisError:
+            self._fall_back()
+            return {}
+
+    def put_back(self, counts: dict[int, int]) -> None:
+        """Return views that could not be written to the buffer."""
+        try:
+            self.buffer.put_back(counts)
+        except redis.RedisError:
+            self._fall_back()
+            self.buffer.put_back(counts)
+
+    def reconnect(self) -> bool:
+        """
+        Switch back to Redis if counting in memory and Redis answers again,
+        moving the views counted in memory there. Returns whether it switched.
+        """
+        if not self.in_memory():
+            return False
+        buffer = self._connect()
+        if buffer is None:
+            return False
+        memory, self.buffer = self.buffer, buffer
+        counts = memory.take()
+        try:
+            buffer.put_back(counts)
+        except redis.RedisError:
+            self.buffer = memory
+            memory.put_back(counts)
+            return False
+        logger.info("View counter back on Redis")
+        return True
+
+    def flush_memory(self, flush) -> int:
+        """
+        One round of the background thread: try Redis again, then write the
+        views counted in memory with flush(counter). Returns the views written.
+        """
+        if self.reconnect() or not self.in_memory():
+            return 0
+        try:
+            return flush(self)
+        except DatabaseError:
+            logger.exception("Quote views flush failed")
+            return 0
+
+    def start(self) -> None:
+        """Start the background thread of this process."""
+        threading.Thread(target=self._run, name="view-counter", daemon=True).start()
+
+    def _run(self) -> None:
+        from quotes.services import flush_quote_views
+
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush_memory(flush_quote_views)
+            # The thread's own database connection
+            connections.close_all()
+
+
+_counter: ViewCounter|None = None
+_counter_lock = threading.Lock()
+
+
+def get_view_counter() -> ViewCounter:
+    """
+    The process-wide view counter.
+    """
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = ViewCounter(
+                settings.VIEW_COUNTS_REDIS_URL,
+                settings.VIEW_COUNTS_FLUSH_SECONDS,
+                settings.VIEW_COUNTS_MAX_PENDING,
+            )
+            _counter.start()
+        return _counter
@@ -1,31 +1,104 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404
+from django.contrib import messages
 from django.views import View
-from django.views.generic import ListView, DetailView, CreateView, UpdateView
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, TemplateView
 from .models import Quote, Book, User
 from django.db import transaction, DataError
 from django.urls import reverse_lazy
 from .forms import QuoteCreateForm
 from django.utils import timezone
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.db.models.functions import Left
 import logging
-from .services import create_quote
+from .services import (
+    create_quote,
+    soft_delete_quotes,
+    restore_quotes,
+    get_user_quote_stats,
+    similar_quotes,
+    record_quote_update,
+    record_quote_view,
+    most_viewed_quotes,
+)
+from .db_router import ReplicaReadMixin
+from .streaming import stream_list
 
 logger = logging.getLogger(__name__)
 
 # Create your views here.
 
+# Number of characters of each quote rendered on the list page
+QUOTE_SNIPPET_LENGTH = 200
+
 class UserQuotesQuerySetMixin:
     """Mixin to filter quotes to only show the current user's quotes"""
     def get_queryset(self):
         return Quote.objects.filter(user=self.request.user)
 
-class QuotesListView(LoginRequiredMixin, UserQuotesQuerySetMixin, ListView):
+def project_quote_rows(queryset):
+    """
+    Only fetch the columns the list pages render, as lightweight named rows.
+    The quote text is truncated in SQL (one extra character so the template
+    knows when to add an ellipsis) and the book title comes from a join.
+    """
+    return (
+        queryset
+        .annotate(
+            snippet=Left("quote", QUOTE_SNIPPET_LENGTH + 1),
+            book_title=F("book__title"),
+        )
+        .values_list("id", "snippet", "book_title", "created_at", named=True)
+    )
+
+def get_selected_quote_ids(request) -> list[int]:
+    """Quote ids ticked in a multi-select form"""
+    return [int(pk) for pk in request.POST.getlist("quote_ids") if pk.isdigit()]
+
+class QuotesListView(LoginRequiredMixin, ReplicaReadMixin, UserQuotesQuerySetMixin, ListView):
     model = Quote
     template_name = 'quotes/list_quotes.html'
     context_object_name = 'quotes'
 
-class QuoteDetailView(LoginRequiredMixin, UserQuotesQuerySetMixin, DetailView):
+    def get(self, request, *args, **kwargs):
+        if not settings.QUOTE_LIST_STREAMING:
+            return super().get(request, *args, **kwargs)
+        return stream_list(
+            request,
+            self.get_queryset(),
+            'quotes/list_quotes_header.html',
+            'quotes/quote_rows.html',
+            'quotes/list_quotes_footer.html',
+            {"snippet_length": QUOTE_SNIPPET_LENGTH},
+        )
+
+    def get_queryset(self):
+        return project_quote_rows(super().get_queryset())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["snippet_length"] = QUOTE_SNIPPET_LENGTH
+        return context
+
+class DeletedQuotesListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
+    model = Quote
+    template_name = 'quotes/list_deleted_quotes.html'
+    context_object_name = 'quotes'
+
+    def get_queryset(self):
+        return project_quote_rows(
+            Quote.all_objects.filter(user=self.request.user, deleted_at__isnull=False)
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["snippet_length"] = QUOTE_SNIPPET_LENGTH
+        return context
+
+class QuoteDetailView(LoginRequiredMixin, ReplicaReadMixin, UserQuotesQuerySetMixin, DetailView):
     model = Quote
     template_name = 'quotes/view_quote.html'
     context_object_name = 'quote'
@@ -39,7 +112,13 @@ class QuoteDetailView(LoginRequiredMixin, UserQuotesQuerySetMixin, DetailView):
                 "quote_id": obj.pk,
             }
         )
+        record_quote_view(obj.pk)
         return obj
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["similar_quotes"] = similar_quotes(self.request.user, self.object, settings.SIMILAR_QUOTES_LIMIT)
+        return context
   
 class QuoteCreateViewCustomForm(LoginRequiredMixin, CreateView):
     model = Quote
@@ -106,23 +185,53 @@ class QuoteUpdateView(LoginRequiredMixin, UserQuotesQuerySetMixin, UpdateView):
             }
         )
         
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        record_quote_update(self.object, form.changed_data, form.initial.get("book"))
+        return response
+
+class QuoteStatsView(LoginRequiredMixin, TemplateView):
+    template_name = 'quotes/quote_stats.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        stats = get_user_quote_stats(self.request.user)
+        context["stats"] = stats
+        context["top_authors"] = stats.top_authors()
+        context["quotes_per_month"] = stats.quotes_per_month()
+        context["most_viewed_quotes"] = most_viewed_quotes(self.request.user, settings.MOST_VIEWED_QUOTES_LIMIT)
+        return context
 
 class QuoteSoftDeleteView(LoginRequiredMixin, View):
     def post(self, request, pk):
         # Filter to only user's quotes for security
-        quote = get_object_or_404(Quote.all_objects, pk=pk, user=self.request.user)
-        quote.deleted_at = timezone.now()
-        quote.save(update_fields=["deleted_at"])
+        if not soft_delete_quotes(self.request.user, [pk]):
+            raise Http404("No quote found matching the query")
         logger.info(
             "Quote soft deleted",
             extra={
                 "user_id": self.request.user.id,
-                "quote_id": quote.pk,
+                "quote_id": pk,
             }
         )
         return redirect("quotes:quotes_list")
 
+class QuoteBulkSoftDeleteView(LoginRequiredMixin, View):
+    def post(self, request):
+        deleted = soft_delete_quotes(self.request.user, get_selected_quote_ids(request))
+        messages.success(request, f"Deleted {deleted} quote(s).")
+        return redirect("quotes:quotes_list")
+
+class QuoteBulkRestoreView(LoginRequiredMixin, View):
+    def post(self, request):
+        result = restore_quotes(self.request.user, get_selected_quote_ids(request))
+        messages.success(request, f"Restored {result.restored} quote(s).")
+        if result.conflict_ids:
+            messages.warning(
+                request,
+                f"{len(result.conflict_ids)} quote(s) could not be restored because they already exist.",
+            )
+        return redirect("quotes:quotes_deleted")
+
 
 # Leaving here as a reference for the basic form view
 # class QuoteCreateViewBasic(CreateView):
@@ -2,6 +2,7 @@ import os
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init, worker_process_shutdown, worker_ready
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quotesapp.settings')
@@ -13,11 +14,94 @@ app.autodiscover_tasks()
 
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender: Celery, **kwargs):
-    # Executes every Monday morning at 7:30 a.m.
+    from django.conf import settings
+
+    # Precompute tomorrow's digests off-peak
+    prepare_hour, prepare_minute = settings.DIGEST_PREPARE_TIME.split(':')
+    sender.add_periodic_task(
+        crontab(hour=int(prepare_hour), minute=int(prepare_minute)),
+        sender.signature('quotes.tasks.prepare_digests_task'),
+    )
+    # Enqueue the digests of the users whose send slot starts now
+    sender.add_periodic_task(
+        crontab(minute=f'*/{settings.DIGEST_SLOT_MINUTES}'),
+        sender.signature('quotes.tasks.create_email_tasks'),
+    )
+    # Follow daylight saving changes once a day
+    sender.add_periodic_task(
+        crontab(hour=0, minute=0),
+        sender.signature('quotes.tasks.refresh_send_slots_task'),
+    )
+    # Drop old send ledger entries and stale prepared digests
+    sender.add_periodic_task(
+        crontab(hour=0, minute=10),
+        sender.signature('quotes.tasks.prune_digest_deliveries_task'),
+    )
+    # Fix quote stats that drifted from the quotes table
+    sender.add_periodic_task(
+        crontab(hour=1, minute=0),
+        sender.signature('quotes.tasks.reconcile_user_quote_stats_task'),
+    )
+    # Rebuild the similar quotes indexes from scratch
+    sender.add_periodic_task(
+        crontab(hour=1, minute=30),
+        sender.signature('quotes.tasks.rebuild_similarity_indexes_task'),
+    )
+    # Pick up new and changed books in the catalogue snapshot
+    sender.add_periodic_task(
+        crontab(minute=f'*/{settings.BOOK_CATALOGUE_REFRESH_MINUTES}'),
+        sender.signature('quotes.tasks.refresh_book_catalogue_task'),
+    )
+    # Add the buffered quote views to the view counts
+    sender.add_periodic_task(
+        settings.VIEW_COUNTS_FLUSH_SECONDS,
+        sender.signature('quotes.tasks.flush_quote_views_task'),
+    )
+    # Hand new quote changes to the derived data consumers
     sender.add_periodic_task(
-        crontab(hour=7, minute=30, day_of_week='*'),
-        'quotes.tasks.create_email_tasks',
+        settings.OUTBOX_POLL_SECONDS,
+        sender.signature('quotes.tasks.process_outbox_task'),
     )
+    # Drop outbox events past the replay window
+    sender.add_periodic_task(
+        crontab(hour=0, minute=20),
+        sender.signature('quotes.tasks.prune_outbox_task'),
+    )
+
+@worker_init.connect
+def check_worker_settings(**kwargs):
+    # Workers never clear connection.queries, so never record queries in prod
+    from quotes.checks import check_production_settings
+
+    check_production_settings()
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    """
+    Serve the worker's Prometheus metrics on CELERY_METRICS_PORT. Pool processes
+    run the tasks, so set PROMETHEUS_MULTIPROC_DIR (not shared with gunicorn) to
+    aggregate their samples.
+    """
+    from django.conf import settings
+    from prometheus_client import REGISTRY, CollectorRegistry, multiprocess, start_http_server
+
+    if not settings.CELERY_METRICS_PORT:
+        return
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(settings.CELERY_METRICS_PORT, registry=registry)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
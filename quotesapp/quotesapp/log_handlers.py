@@ -0,0 +1,125 @@
+"""
+Logging handlers that keep log formatting and I/O off the request path.
+
+AsyncBatchHandler only puts records on a bounded queue in the calling thread; a
+background thread formats them (JSON in production) and writes them in batches.
+When the queue is full, records are dropped and counted rather than blocking the
+request; the settings pass in the Prometheus counter for the drops, so this module
+does not import the app. SamplingFilter keeps a fraction of high-volume events.
+"""
+
+import copy
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records whose message is in `rates`, e.g.
+    {"Quote viewed": 0.1}. Kept records carry their sample_rate so counts can be
+    scaled back up. Warnings and errors are never sampled.
+    """
+    def __init__(self, rates: dict[str, float]|None = None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.msg) if record.levelno < logging.WARNING else None
+        if rate is None:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class AsyncBatchHandler(QueueHandler):
+    def __init__(
+        self,
+        stream=None,
+        capacity: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        dropped_counter=None,
+    ):
+        super().__init__(queue.Queue(capacity))
+        self.stream = stream or sys.stderr
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.dropped_counter = dropped_counter
+        self._dropped_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_writer(self) -> None:
+        # Threads do not survive a fork (Celery prefork, gunicorn --preload), so
+        # each process starts its own writer on first use.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._write_batches, name="log-writer", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting is left to the writer thread. Only the message is resolved
+        # here, so that arguments mutated after the call are not picked up. The
+        # record is shared with the other handlers, so a copy is queued.
+        record = copy.copy(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            if self.dropped_counter is not None:
+                self.dropped_counter.inc()
+
+    def _write_batches(self) -> None:
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def write(self, records: list[logging.LogRecord]) -> None:
+        """Format a batch of records and write them with a single write call."""
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+        if lines:
+            try:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+            except Exception:
+                self.handleError(records[0])
+
+    def flush(self) -> None:
+        """Wait until every queued record has been written."""
+        if self._pid == os.getpid():
+            self.queue.join()
@@ -10,32 +10,36 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
-import os
 from dotenv import load_dotenv
+from quotesapp.env import env_bool, env_choice, env_float, env_int, env_list, env_str
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 env_path = BASE_DIR.parent / '.env'
 
+# Settings are imported by every web and worker process at boot, so stay quiet
+# here: variables already set in the environment take precedence over the file.
 if env_path.exists():
-    print(f"Found environment file at {env_path}. Loading environment variables from file.")
     load_dotenv(env_path)
-else:
-    print(f"Environment file NOT FOUND at {env_path}. Using environment variables from system.")
 
-# Quick-start development settings - unsuitable for production
+# 'dev' for local development, 'prod' for deployed web and worker processes.
+# The prod profile is adjusted at the end of this file and checked at startup
+# (see quotes/checks.py). A deploy that sets nothing gets prod; set
+# DJANGO_PROFILE=dev for local development. Test runs default to dev.
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+SETTINGS_PROFILE = env_choice('DJANGO_PROFILE', ('dev', 'prod'), 'dev' if 'test' in sys.argv else 'prod')
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
+SECRET_KEY = env_str('DJANGO_SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = os.getenv('DJANGO_DEBUG_MODE')
+# Off unless DJANGO_DEBUG_MODE turns it on, in every profile
+DEBUG = env_bool('DJANGO_DEBUG_MODE', False)
 
-# TODO: Change to specific hosts in production
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', ['*'])
 
 
 # Application definition
@@ -52,13 +56,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'quotes.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'quotes.db_router.PinPrimaryAfterWriteMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'quotes.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'quotesapp.urls'
@@ -87,14 +94,36 @@ WSGI_APPLICATION = 'quotesapp.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_NAME'),
-        'USER': os.getenv('POSTGRES_USER'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-        'HOST': os.getenv('POSTGRES_HOST'),
-        'PORT': os.getenv('POSTGRES_PORT'),
+        'NAME': env_str('POSTGRES_NAME'),
+        'USER': env_str('POSTGRES_USER'),
+        'PASSWORD': env_str('POSTGRES_PASSWORD'),
+        'HOST': env_str('POSTGRES_HOST'),
+        'PORT': env_str('POSTGRES_PORT'),
     }
 }
 
+# Read replicas, as comma separated host[:port] of servers replicating the primary.
+# Read-only views and digest sampling read from them (see quotes/db_router.py).
+# To try it locally, add any second alias to DATABASES and list it here.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(env_list('POSTGRES_REPLICA_HOSTS', [])):
+    host, _, port = replica.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['quotes.db_router.ReplicaRouter']
+# Seconds a client keeps reading from the primary after a write
+READ_REPLICA_STICKY_SECONDS = 10
+# Hash partitions of the quotes table on user_id (Postgres only, 0 to disable).
+# Applied by migration 0013 to an empty table; convert existing data with
+# `manage.py partition_quotes`.
+QUOTE_PARTITIONS = env_int('QUOTE_PARTITIONS', 0)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -146,6 +175,12 @@ LOGOUT_REDIRECT_URL = '/'
 LOGIN_URL = '/'
 
 # Logging configuration
+# Fraction of high-volume INFO events that are logged
+LOG_SAMPLE_RATES = {
+    "Quote viewed": env_float('LOG_QUOTE_VIEWED_SAMPLE_RATE', 0.1),
+}
+# Records beyond this many waiting to be written are dropped (and counted)
+LOG_QUEUE_CAPACITY = 10000
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -155,17 +190,31 @@ LOGGING = {
             "format": "%(asctime)s %(levelname)s %(name)s %(message)s",
         },
     },
+    "filters": {
+        "sampling": {
+            "()": "quotesapp.log_handlers.SamplingFilter",
+            "rates": LOG_SAMPLE_RATES,
+        },
+    },
     "handlers": {
+        # Records are queued on the calling thread and formatted and written in
+        # batches by a background thread; see quotesapp/log_handlers.py
         "console": {
-            "class": "logging.StreamHandler",
+            "()": "quotesapp.log_handlers.AsyncBatchHandler",
             "formatter": "json",
+            "filters": ["sampling"],
+            "capacity": LOG_QUEUE_CAPACITY,
+            "dropped_counter": "ext://quotes.metrics.LOG_RECORDS_DROPPED",
         }
     },
     "root": {"handlers": ["console"], "level": "INFO"},
+    "loggers": {
+        # SQL is only logged with DEBUG, which must not be on outside development
+        "django.db.backends": {"level": "WARNING"},
+    },
 }
 
 # Silence logs during testing
-import sys
 if 'test' in sys.argv:
     LOGGING['root']['level'] = 'ERROR'  # Only show errors during tests
 
@@ -173,7 +222,167 @@ CELERY_BROKER_URL = 'redis://127.0.0.1:6379'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_BACKEND = 'django-db'
+# 'django-db' stores results in Postgres; point this at Redis (e.g. redis://127.0.0.1:6379/1)
+# to keep result writes off the database. Fire-and-forget tasks set ignore_result.
+CELERY_RESULT_BACKEND = env_str('CELERY_RESULT_BACKEND', 'django-db')
+CELERY_RESULT_EXPIRES = 60 * 60 * 24
 CELERY_TIMEZONE='UTC'
+# Tasks are routed to four queues, each meant for its own worker (see the
+# makefile targets and their CELERY_*_CONCURRENCY pool sizes):
+# - interactive, the default queue, for work a user waits on: 4 processes, no
+#   prefetching (--prefetch-multiplier 1), so a long task never holds others back;
+# - digest, for the fan-outs and the per-block and per-user digest tasks, which
+#   are short and numerous: 8 processes prefetching 4 tasks each;
+# - maintenance, for the nightly housekeeping and rebuilds: 1 process, no
+#   prefetching;
+# - frequent, for the tasks beat runs every few seconds or minutes (outbox,
+#   view counts, catalogue), so they never wait behind a long rebuild: 2
+#   processes, no prefetching. The outbox claims its events with SKIP LOCKED,
+#   so both processes can drain it.
+# A worker must consume every queue; `make run-celery-worker` consumes all four.
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_TASK_ROUTES = {
+    # Within the digest queue (0 is the highest priority on Redis): fan-outs first,
+    # then sends, which are due in the user's morning, then tomorrow's rendering
+    'quotes.tasks.prepare_digests_task': {'queue': 'digest', 'priority': 0},
+    'quotes.tasks.create_email_tasks': {'queue': 'digest', 'priority': 0},
+    'quotes.tasks.send_digest_batch_task': {'queue': 'digest', 'priority': 3},
+    'quotes.tasks.send_email_task': {'queue': 'digest', 'priority': 3},
+    'quotes.tasks.prepare_digest_block_task': {'queue': 'digest', 'priority': 6},
+    'quotes.tasks.refresh_send_slots_task': {'queue': 'maintenance'},
+    'quotes.tasks.prune_digest_deliveries_task': {'queue': 'maintenance'},
+    'quotes.tasks.reconcile_user_quote_stats_task': {'queue': 'maintenance'},
+    'quotes.tasks.rebuild_similarity_indexes_task': {'queue': 'maintenance'},
+    'quotes.tasks.prune_outbox_task': {'queue': 'maintenance'},
+    'quotes.tasks.process_outbox_task': {'queue': 'frequent'},
+    'quotes.tasks.flush_quote_views_task': {'queue': 'frequent'},
+    'quotes.tasks.refresh_book_catalogue_task': {'queue': 'frequent'},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Redis emulates priorities with a list per priority step
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
 
-EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
\ No newline at end of file
+EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+
+# Daily digest: sent at DIGEST_SEND_TIME in each user's timezone, spread over
+# DIGEST_SPREAD_MINUTES and enqueued in slots of DIGEST_SLOT_MINUTES. Digests are
+# dated in the user's timezone, see quotes.scheduling
+DIGEST_SEND_TIME = '07:30'
+DIGEST_SLOT_MINUTES = 5
+DIGEST_SPREAD_MINUTES = 60
+# Each user's next digest is rendered ahead of time at DIGEST_PREPARE_TIME (UTC),
+# before the day's late slots are sent: sampling skips the quotes of digests still
+# waiting to be sent, and the send stage rebuilds digests holding quotes sent since
+DIGEST_PREPARE_TIME = '22:00'
+DIGEST_PREPARE_BATCH_SIZE = 500
+DIGEST_SEND_BATCH_SIZE = 100
+# 'sync' sends through EMAIL_BACKEND; 'async' sends over a pool of SMTP connections
+# to EMAIL_HOST with bounded concurrency and per-recipient retries
+DIGEST_MAIL_MODE = env_choice('DIGEST_MAIL_MODE', ('sync', 'async'), 'sync')
+DIGEST_ASYNC_MAIL_POOL_SIZE = 10
+DIGEST_ASYNC_MAIL_CONCURRENCY = 20
+DIGEST_ASYNC_MAIL_MAX_RETRIES = 3
+# Token buckets throttling digest sampling queries (four per block of users) and
+# sends (per second, shared by all workers through Redis; each process falls back
+# to its own bucket if Redis is unavailable). Rates adapt between min_rate and
+# max_rate; latency_target is per query or per message.
+RATE_LIMIT_REDIS_URL = env_str('RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL)
+if 'test' in sys.argv:
+    # Tests never share buckets with the broker's Redis
+    RATE_LIMIT_REDIS_URL = ''
+DIGEST_RATE_LIMITS = {
+    'digest_sampling': {'rate': 200, 'burst': 200, 'min_rate': 20, 'max_rate': 800, 'latency_target': 0.5},
+    'digest_send': {'rate': 200, 'burst': 200, 'min_rate': 10, 'max_rate': 1000, 'latency_target': 1.0},
+}
+# Quotes sent in the last DIGEST_RECENT_DAYS digests are not picked again while
+# the user has other quotes
+DIGEST_RECENT_DAYS = 7
+# Days of digest send ledger kept for deduplication
+DIGEST_LEDGER_RETENTION_DAYS = 7
+
+# Prometheus metrics: /metrics requires this bearer token (always in prod). Set
+# PROMETHEUS_MULTIPROC_DIR to aggregate samples across gunicorn workers (see
+# gunicorn.conf.py); Celery workers serve their own metrics on CELERY_METRICS_PORT.
+METRICS_BEARER_TOKEN = env_str('METRICS_BEARER_TOKEN', '')
+CELERY_METRICS_PORT = env_int('CELERY_METRICS_PORT', 0)
+
+# "More like this" on the quote page: per-user similarity indexes are written to
+# this directory (shared by the web and Celery processes of a host) and kept up
+# to date as quotes change; unset to turn the feature off
+SIMILAR_QUOTES_INDEX_DIR = env_str('SIMILAR_QUOTES_INDEX_DIR', '')
+SIMILAR_QUOTES_LIMIT = 5
+# Indexes each process keeps mapped
+SIMILAR_QUOTES_MAPPED_INDEXES = 1000
+
+# Memory-mapped snapshot of the books (for form validation, autocomplete and
+# digests), rebuilt every BOOK_CATALOGUE_REFRESH_MINUTES when books changed;
+# unset to always read books from the database
+BOOK_CATALOGUE_PATH = env_str('BOOK_CATALOGUE_PATH', '')
+BOOK_CATALOGUE_REFRESH_MINUTES = 5
+
+# Quote views are counted in Redis (shared by all processes; each process counts
+# in memory if Redis is unavailable) and added to the view counts table in
+# batches every VIEW_COUNTS_FLUSH_SECONDS; unset the URL to count in memory
+VIEW_COUNTS_REDIS_URL = env_str('VIEW_COUNTS_REDIS_URL', CELERY_BROKER_URL)
+VIEW_COUNTS_FLUSH_SECONDS = 30
+# A process counting in memory flushes early once this many quotes have views
+VIEW_COUNTS_MAX_PENDING = 10000
+VIEW_COUNTS_FLUSH_BATCH_SIZE = 1000
+if 'test' in sys.argv:
+    # Tests never write to the broker's Redis, and flush the views they count
+    # themselves rather than from the background thread
+    VIEW_COUNTS_REDIS_URL = ''
+    VIEW_COUNTS_FLUSH_SECONDS = 24 * 60 * 60
+MOST_VIEWED_QUOTES_LIMIT = 5
+
+# Stream the quote list page: the header goes out at once and the rows follow in
+# chunks read through a server-side cursor (see quotes.streaming), optionally
+# gzipped chunk by chunk
+QUOTE_LIST_STREAMING = env_bool('QUOTE_LIST_STREAMING', False)
+QUOTE_LIST_STREAM_CHUNK_SIZE = 200
+QUOTE_LIST_STREAM_GZIP = env_bool('QUOTE_LIST_STREAM_GZIP', True)
+
+# Transactional outbox of quote changes for derived data (see quotes.outbox),
+# drained every OUTBOX_POLL_SECONDS on the frequent queue, in batches, for at
+# most OUTBOX_DRAIN_SECONDS per run
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_DRAIN_SECONDS = 4
+# Events that failed this many times wait for a replay
+OUTBOX_MAX_ATTEMPTS = 5
+# Processed events are kept this long, for replays
+OUTBOX_RETENTION_DAYS = 7
+
+# Staff can profile a single request by sending a token from `manage.py
+# profile_token` (see quotes.profiling); profiles are saved in this directory
+# and listed at /profiles/. Unset to take the profiling middleware out entirely
+PROFILING_DIR = env_str('PROFILING_DIR', '')
+PROFILING_INTERVAL = 0.001
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_KEEP = 100
+
+if SETTINGS_PROFILE == 'prod':
+    if not SECRET_KEY:
+        from django.core.exceptions import ImproperlyConfigured
+        raise ImproperlyConfigured('DJANGO_SECRET_KEY must be set in the prod profile.')
+    # Keep compiled templates in memory (APP_DIRS cannot be combined with loaders)
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    # Reuse database connections across requests and tasks
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = env_int('DJANGO_CONN_MAX_AGE', 60)
+        database['CONN_HEALTH_CHECKS'] = True
+    LOGGING['loggers'].update({
+        'django': {'level': 'WARNING'},
+        'django.request': {'level': 'ERROR'},
+        'celery': {'level': 'INFO'},
+    })
@@ -18,10 +18,17 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 
+from quotes.metrics import metrics_view
+from quotes.profiling import profiles_view, profile_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('quotes/', include('quotes.urls')),
+    path('api/', include('quotes.api_urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('profiles/', profiles_view, name='profiles'),
+    path('profiles/<str:name>', profile_view, name='profile'),
 
     path("", auth_views.LoginView.as_view(), name="login"),
     path("logout/", auth_views.LogoutView.as_view(), name="logout"),
@@ -0,0 +1,58 @@
+"""
+Opt-in warmup for web processes.
+
+Django builds the URL resolver, compiles templates and opens the database
+connection lazily, so without a warmup the first request served by every
+freshly started worker pays for all of it. Set DJANGO_WARMUP=1 to do that work
+when the WSGI application is loaded instead.
+"""
+
+import logging
+import time
+
+from django.db import DatabaseError, connections
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from quotesapp.env import env_bool
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEMPLATES = [
+    "registration/login.html",
+    "quotes/list_quotes.html",
+    "quotes/view_quote.html",
+    "quotes/create_quote.html",
+    "quotes/update_quote.html",
+]
+
+
+def warmup_enabled() -> bool:
+    return env_bool("DJANGO_WARMUP", False)
+
+
+def warm_up() -> float:
+    """
+    Populate the URL resolver, compile the commonly rendered templates and open a
+    database connection. Returns the time taken in seconds.
+    """
+    start = time.perf_counter()
+
+    # Populating the reverse lookup imports every view module referenced by the URLconf
+    get_resolver().reverse_dict
+
+    for template_name in WARMUP_TEMPLATES:
+        try:
+            get_template(template_name)
+        except TemplateDoesNotExist:
+            logger.warning("Warmup template not found", extra={"template": template_name})
+
+    try:
+        connections["default"].ensure_connection()
+    except DatabaseError:
+        logger.warning("Warmup could not connect to the database")
+
+    elapsed = time.perf_counter() - start
+    logger.info("Warmup complete", extra={"duration_ms": round(elapsed * 1000, 1)})
+    return elapsed
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quotesapp.settings')
 
 application = get_wsgi_application()
+
+from quotes.checks import check_production_settings  # noqa: E402 (needs configured settings)
+from quotesapp.warmup import warm_up, warmup_enabled  # noqa: E402
+
+check_production_settings()
+
+if warmup_enabled():
+    warm_up()